@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+import click
+from flask import Flask
+from flask.testing import FlaskClient
+from sqlalchemy import func, select
+from flaskr import create_app
+from flaskr.database import (
+    db,
+    Post,
+    PostCategory,
+    PostType,
+    User
+)
+from flaskr.datagen import DEFAULT_PASSWORD, generate
+
+
+# Endpoint benchmarks against seeded databases of several sizes.
+#
+# For every size a database is generated once (instance/bench-<posts>.db,
+# reused on later runs) and every endpoint is driven through the Flask test
+# client with SQL instrumentation on. Reported per endpoint: latency
+# percentiles, sequential throughput and SQL statements per request. A run
+# fails when an endpoint issues more statements than its budget.
+#
+#   python benchmark.py --sizes 1000,100000 --output bench.json
+#   python benchmark.py --sizes 1000 --compare bench.json
+
+# Maximum SQL statements per request. None: no budget.
+BUDGETS: Dict[str, Optional[int]] = {
+    "ViewPosts": 4,
+    "ViewPosts?post_type": 4,
+    "ViewPosts?post_category": 4,
+    "ViewPosts?author_id": 5,
+    "ViewPosts?after": 4,
+    "ViewPost": 8,
+    "AddPost": 12,
+    "AddComment": 8,
+    "UserProfile": 4,
+    "CreateRequest": 10,
+    "GetRequests": 4,
+}
+
+
+class Scenario:
+
+    def __init__(self, app: Flask, client: FlaskClient, rng: random.Random):
+        self.app = app
+        self.client = client
+        self.rng = rng
+
+        with app.app_context():
+            self.user: User = db.session.execute(
+                select(User)
+                .join(Post, Post.original_author_id == User.id)
+                .filter(User.type == "user")
+                .group_by(User.id)
+                .order_by(func.count().desc())
+                .limit(1)
+            ).scalar_one()
+            self.username = self.user.username
+            self.user_public_id = self.user.alternative_id
+            self.post_ids = db.session.execute(
+                select(Post.alternative_id)
+                .filter(Post.private == False)
+                .order_by(func.random())
+                .limit(500)
+            ).scalars().all()
+            # Each CreateRequest needs a post of ours that has no request yet
+            self.requestable_post_ids = iter(db.session.execute(
+                select(Post.alternative_id)
+                .filter(Post.original_author_id == self.user.id)
+                .filter(Post.outgoing_requet_id.is_(None))
+            ).scalars().all())
+            self.post_type = db.session.execute(select(PostType.id, PostType.name)).first()
+            self.category = db.session.execute(select(PostCategory.id, PostCategory.name)).first()
+
+        response = client.post(
+            "/auth/login",
+            data={"username": self.username, "password": DEFAULT_PASSWORD}
+        )
+        if response.status_code != 302 or "/users/" not in response.location:
+            raise click.ClickException(f"Could not log in as {self.username}.")
+
+        first_page = client.get("/posts/").get_data(as_text=True)
+        marker = "after="
+        start = first_page.find(marker)
+        self.next_cursor = (
+            first_page[start + len(marker):].split('"', 1)[0].split("&", 1)[0]
+            if start != -1 else ""
+        )
+
+    def endpoints(self) -> Dict[str, Callable]:
+        get, post = self.client.get, self.client.post
+        pick = self.rng.choice
+        long_text = "Benchmark content about water pumps and solar grids. " * 4
+
+        return {
+            "ViewPosts": lambda: get("/posts/"),
+            "ViewPosts?post_type": lambda: get(f"/posts/?post_type={self.post_type.name}"),
+            "ViewPosts?post_category": lambda: get(f"/posts/?post_category={self.category.name}"),
+            "ViewPosts?author_id": lambda: get(f"/posts/?author_id={self.user_public_id}"),
+            "ViewPosts?after": lambda: get(f"/posts/?after={self.next_cursor}"),
+            "ViewPost": lambda: get(f"/posts/{pick(self.post_ids)}"),
+            "AddPost": lambda: post("/posts/add-post", data={
+                "title": "Benchmark publication title",
+                "body": long_text,
+                "post_type": self.post_type.id,
+                "post_categories": [self.category.id]
+            }),
+            "AddComment": lambda: post(
+                f"/posts/{pick(self.post_ids)}/add-comment",
+                data={"text": long_text}
+            ),
+            "UserProfile": lambda: get(f"/users/{self.user_public_id}"),
+            "CreateRequest": lambda: get(
+                f"/requests/create/user_req?source_id={next(self.requestable_post_ids, '')}"
+            ),
+            "GetRequests": lambda: get("/requests/"),
+        }
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(call: Callable, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        call()
+
+    latencies, statements, errors = [], [], 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        request_started = time.perf_counter()
+        response = call()
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        statements.append(int(response.headers.get("X-SQL-Count", 0)))
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    return {
+        "iterations": iterations,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "throughput_rps": round(iterations / elapsed, 1),
+        "statements_median": statistics.median(statements),
+        "statements_max": max(statements),
+    }
+
+
+def seeded_app(posts: int, seed: int, reseed: bool) -> Flask:
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", f"bench-{posts}.db")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fresh = reseed or not os.path.exists(path)
+    if fresh and os.path.exists(path):
+        os.remove(path)
+
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}",
+        "SQL_INSTRUMENTATION": True,
+        "TESTING": True
+    })
+    # The per-request N+1 warnings would drown the report; budgets cover them
+    app.logger.setLevel(logging.ERROR)
+
+    if fresh:
+        click.echo(f"Seeding {path} ...")
+        with app.app_context():
+            db.create_all()
+            users = max(100, posts // 10)
+            generate(
+                users=users,
+                representatives=max(1, users // 200),
+                boards=3,
+                board_members=9,
+                posts=posts,
+                comments=posts * 3,
+                links=posts // 5,
+                requests=posts // 50,
+                seed=seed
+            )
+    return app
+
+
+def compare(results: List[dict], baseline_path: str) -> None:
+    with open(baseline_path) as baseline_file:
+        baseline = {
+            (entry["size"], entry["endpoint"]): entry
+            for entry in json.load(baseline_file)["results"]
+        }
+    click.echo(f"\nCompared with {baseline_path} (p95, statements):")
+    for entry in results:
+        previous = baseline.get((entry["size"], entry["endpoint"]))
+        if previous is None:
+            continue
+        ratio = entry["p95_ms"] / previous["p95_ms"] if previous["p95_ms"] else float("inf")
+        click.echo(
+            f"  {entry['size']:>9} {entry['endpoint']:<24} "
+            f"p95 {previous['p95_ms']:>8.2f} -> {entry['p95_ms']:>8.2f} ms ({ratio:.2f}x)  "
+            f"sql {previous['statements_max']} -> {entry['statements_max']}"
+        )
+
+
+@click.command()
+@click.option("--sizes", default="1000,100000,1000000", show_default=True, help="Comma-separated post counts.")
+@click.option("--iterations", default=200, show_default=True)
+@click.option("--warmup", default=20, show_default=True)
+@click.option("--endpoint", "only", multiple=True, help="Run only these endpoints (repeatable).")
+@click.option("--budget", multiple=True, help="Override a budget, e.g. --budget ViewPost=6.")
+@click.option("--seed", default=42, show_default=True)
+@click.option("--reseed", is_flag=True, help="Regenerate the databases even if they exist.")
+@click.option("--output", type=click.Path(dir_okay=False), help="Write results as JSON.")
+@click.option("--compare", "baseline", type=click.Path(exists=True, dir_okay=False), help="JSON of an earlier run.")
+def main(sizes, iterations, warmup, only, budget, seed, reseed, output, baseline):
+    budgets = dict(BUDGETS)
+    for item in budget:
+        name, _, value = item.partition("=")
+        budgets[name] = int(value) if value else None
+
+    results, violations = [], []
+
+    for size in [int(value) for value in sizes.split(",")]:
+        app = seeded_app(size, seed, reseed)
+        scenario = Scenario(app, app.test_client(), random.Random(seed))
+        click.echo(f"\n{size} posts (as {scenario.username})")
+        click.echo(f"  {'endpoint':<24} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} {'sql':>5}")
+
+        for name, call in scenario.endpoints().items():
+            if only and name not in only:
+                continue
+            result = {"size": size, "endpoint": name, **measure(call, iterations, warmup)}
+            result["budget"] = budgets.get(name)
+            results.append(result)
+
+            over_budget = result["budget"] is not None and result["statements_max"] > result["budget"]
+            if over_budget:
+                violations.append(result)
+            click.echo(
+                f"  {name:<24} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['throughput_rps']:>8.1f} "
+                f"{result['statements_max']:>5}{'  OVER BUDGET' if over_budget else ''}"
+                f"{'  ERRORS: ' + str(result['errors']) if result['errors'] else ''}"
+            )
+
+    if output:
+        with open(output, "w") as output_file:
+            json.dump({
+                "meta": {
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "iterations": iterations,
+                    "warmup": warmup,
+                    "seed": seed,
+                    "python": sys.version.split()[0]
+                },
+                "results": results
+            }, output_file, indent=2)
+
+    if baseline:
+        compare(results, baseline)
+
+    if violations:
+        click.echo(f"\n{len(violations)} endpoint(s) over their SQL statement budget:")
+        for result in violations:
+            click.echo(f"  {result['size']} {result['endpoint']}: {result['statements_max']} > {result['budget']}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,112 @@ from flask import Flask, render_template, redirect, url_for
 from flask_login import LoginManager, current_user
 
 
-def create_app() -> Flask:
+def create_app(test_config=None) -> Flask:
     
-    from . import auth, users, posts, requestops
-    from .database import db, User
+    from . import (
+        auth, users, posts, requestops,
+        search, instrumentation, routing, statistics, reference,
+        identity, schema, passwords, datagen, storage, replicas,
+        votes, insights, graph, related, export, ingest, rendering,
+        conditional, fragments
+    )
+    from .database import db
 
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_mapping(
         SECRET_KEY="WU",
-        SQLALCHEMY_DATABASE_URI="sqlite:///project.db"
+        SQLALCHEMY_DATABASE_URI="sqlite:///project.db",
+        POSTS_PER_PAGE=20,
+        POSTS_MAX_PER_PAGE=100,
+        SQL_INSTRUMENTATION=False,
+        SQL_INSTRUMENTATION_SLOWEST=5,
+        SQL_INSTRUMENTATION_REPORT_SIZE=500,
+        SQL_N_PLUS_ONE_THRESHOLD=3,
+        REFERENCE_DATA_TTL=300,
+        USER_CACHE_SIZE=1024,
+        USER_CACHE_TTL=60,
+        PUBLIC_ID_BINARY=False,
+        # Bodies of at least the threshold (bytes) are stored zlib-compressed
+        POST_BODY_COMPRESSION=False,
+        POST_BODY_COMPRESSION_THRESHOLD=1024,
+        PASSWORD_HASH_METHOD="scrypt",
+        PASSWORD_HASH_WORKERS=2,
+        PASSWORD_HASH_MAX_PENDING=8,
+        PASSWORD_HASH_TIMEOUT=10,
+        SQLITE_JOURNAL_MODE="WAL",
+        SQLITE_SYNCHRONOUS="NORMAL",
+        # Negative: KiB per connection
+        SQLITE_CACHE_SIZE=-16000,
+        SQLITE_MMAP_SIZE=256 * 1024 * 1024,
+        SQLITE_TEMP_STORE="MEMORY",
+        # Milliseconds
+        SQLITE_BUSY_TIMEOUT=5000,
+        SQLITE_BUSY_RETRIES=3,
+        SQLITE_BUSY_BACKOFF=0.05,
+        SQLITE_POOL_SIZE=8,
+        SQLITE_POOL_OVERFLOW=8,
+        SQLITE_POOL_TIMEOUT=10,
+        # Seconds; 0 disables the background maintenance thread
+        SQLITE_MAINTENANCE_INTERVAL=3600,
+        # e.g. ["sqlite:///project-replica.db"]
+        READ_REPLICAS=[],
+        REPLICA_STICKY_SECONDS=10,
+        # Seconds; 0: sync with `flask replicas sync` only
+        REPLICA_SYNC_INTERVAL=0,
+        # Seconds between upvote flushes: the most a crash can lose
+        VOTES_FLUSH_INTERVAL=2,
+        VOTES_MAX_PENDING=1000,
+        INSIGHT_SUMMARIZER="flaskr.insights:extractive_summary",
+        INSIGHT_POOL="thread",
+        INSIGHT_WORKERS=4,
+        INSIGHT_BATCH_SIZE=100,
+        INSIGHT_LEASE_SECONDS=300,
+        INSIGHT_MAX_ATTEMPTS=3,
+        INSIGHT_POLL_INTERVAL=10,
+        # Attributed to insights of posts that never went through a request
+        # (None: the first representative)
+        INSIGHT_REPRESENTATIVE_ID=None,
+        GRAPH_MAX_DEPTH=5,
+        GRAPH_MAX_RESULTS=500,
+        GRAPH_INDEX=False,
+        GRAPH_INDEX_TTL=300,
+        GRAPH_INDEX_MAX_OVERLAY=10000,
+        # None: <instance>/related
+        RELATED_INDEX_PATH=None,
+        RELATED_DIMENSIONS=2 ** 18,
+        RELATED_RESULTS=10,
+        EXPORT_CHUNK_SIZE=1000,
+        # Longest write transaction the export watermark allows for (seconds)
+        EXPORT_WATERMARK_LAG=60,
+        INGEST_CHUNK_SIZE=5000,
+        INGEST_MAX_REJECTS_SHOWN=1000,
+        # Seconds between background re-renders after a renderer upgrade;
+        # 0: `flask markdown rerender` only
+        MARKDOWN_RERENDER_INTERVAL=0,
+        # Part of every ETag: bump it when templates change
+        CONDITIONAL_GET_VERSION=1,
+        # "memory" (LRU per process), "sqlite" (shared file) or None
+        FRAGMENT_CACHE="memory",
+        FRAGMENT_CACHE_SIZE=10000,
+        # None: <instance>/fragments.db
+        FRAGMENT_CACHE_PATH=None
     )
+    # e.g. FLASK_SQL_INSTRUMENTATION=true
+    app.config.from_prefixed_env()
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
     login_manager = LoginManager()
     login_manager.init_app(app)
     login_manager.login_view = "auth.login"
 
+    storage.configure(app)
+    replicas.configure(app)
     db.init_app(app)
+    storage.init_app(app)
+    replicas.init_app(app)
+    schema.init_app(app)
+    passwords.init_app(app)
 
     
     app.register_blueprint(auth.auth_bp)
@@ -24,11 +115,26 @@ def create_app() -> Flask:
     app.register_blueprint(posts.posts_bp)
     app.register_blueprint(requestops.requests_bp)
 
+    search.init_app(app)
+    routing.init_app(app)
+    statistics.init_app(app)
+    reference.init_app(app)
+    datagen.init_app(app)
+    votes.init_app(app)
+    insights.init_app(app)
+    graph.init_app(app)
+    related.init_app(app)
+    export.init_app(app)
+    ingest.init_app(app)
+    rendering.init_app(app)
+    conditional.init_app(app)
+    fragments.init_app(app)
+    identity.init_app(app)
+    instrumentation.init_app(app)
+
     @login_manager.user_loader
     def load_user(user_id):
-        return db.session.execute(
-            db.select(User).filter_by(alternative_id=user_id)
-        ).scalars().first()
+        return identity.load_user(user_id)
     
 
     @app.route("/")
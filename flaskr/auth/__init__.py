@@ -1,5 +1,4 @@
 from sqlalchemy.exc import SQLAlchemyError
-from werkzeug.security import check_password_hash
 from flask import (
     Blueprint,
     render_template,
@@ -11,6 +10,7 @@ from flask import (
 from flask_login import login_user, logout_user
 from flaskr.database import db, User
 from flaskr.utils import validate_string
+from flaskr.passwords import needs_rehash
 
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
@@ -39,7 +39,6 @@ def register():
         if not (all(map(validate_string, [full_name, username, email, profession, password]))):
             flash("Bad input data. Try again, please.")
             return redirect(url_for("auth.register"))
-        print("works")
         try:
             user = User(
                 full_name=full_name,
@@ -80,9 +79,18 @@ def login():
         ).scalar_one_or_none()
 
 
-        if not (user and check_password_hash(user.password_hash, password)):
+        if not (user and user.check_password(password)):
             flash("Wrong login credentials. Can you try again, please? :)")
-        
+            return redirect(url_for("auth.login"))
+
+        if needs_rehash(user.password_hash):
+            # Hash parameters changed since this password was set
+            try:
+                user.set_password(password)
+                user.update()
+            except SQLAlchemyError:
+                db.session.rollback()
+
         login_user(user, remember=remember_me)
 
         return redirect(url_for("users.UserProfile", alternative_id=user.alternative_id))        
@@ -0,0 +1,170 @@
+import hashlib
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional
+from flask import Response, current_app, g, request, session
+from flask_login import current_user
+from sqlalchemy import func, select
+from flaskr.database import Post, PostComment, PostDiscussion, UserRequest
+from flaskr import rendering, votes
+
+
+# Conditional GET for ViewPost, ViewPosts and UserProfile.
+#
+# Each page has a validator: the few values its content depends on (a
+# post's updated_at, which also moves when a comment is added or deleted,
+# its upvotes and those of its comments, the ids and updated_at of a
+# listing page, a profile's counters), hashed with the viewer into a weak
+# ETag. A first view computes it from the objects it loaded anyway. A
+# revalidation (If-None-Match, or If-Modified-Since alone) fetches just
+# those values with one small query and answers 304 when they still match,
+# before any of the page's own queries or its template run.
+#
+# Last-Modified (the newest updated_at shown) only decides for clients that
+# send no ETag: it misses changes that leave updated_at alone, such as
+# comment votes.
+#
+# The pages are per user: "Cache-Control: private, no-cache" keeps them out
+# of shared caches and makes browsers revalidate every time. Bump
+# CONDITIONAL_GET_VERSION when the templates change.
+
+
+class PostStamp(NamedTuple):
+    id: int
+    private: bool
+    original_author_id: int
+    updated_at: datetime
+    upvotes: int
+    request_confirmed: Optional[bool]
+    comment_upvotes: int
+
+    @classmethod
+    def of(cls, post: Post) -> "PostStamp":
+        return cls(
+            post.id,
+            post.private,
+            post.original_author_id,
+            post.updated_at,
+            post.upvotes,
+            post.outgoing_request.confirmed if post.outgoing_request else None,
+            sum(comment.upvotes for comment in post.post_discussion.post_comments)
+        )
+
+    def visible_to(self, viewer) -> bool:
+        return not self.private or self.original_author_id == viewer.id
+
+    def validator(self) -> tuple:
+        return (
+            *self,
+            votes.upvotes(votes.POST, self.id, 0),
+            votes.pending_total(votes.COMMENT),
+            rendering.RENDERER_VERSION
+        )
+
+
+def post_stamp_query(post_id: str):
+    """The PostStamp columns of a post, in one row."""
+    return (
+        select(
+            Post.id, Post.private, Post.original_author_id, Post.updated_at, Post.upvotes,
+            UserRequest.confirmed,
+            select(func.coalesce(func.sum(PostComment.upvotes), 0))
+            .join(PostDiscussion, PostDiscussion.id == PostComment.post_discussion_id)
+            .where(PostDiscussion.post_id == Post.id)
+            .scalar_subquery()
+        )
+        .outerjoin(UserRequest, UserRequest.id == Post.outgoing_requet_id)
+        .where(Post.alternative_id == post_id)
+    )
+
+
+def _listing_validators(page: List, next_cursor: Optional[str], prev_cursor: Optional[str]):
+    # `page` holds posts or rows of posts_stamp_query(): both have id and updated_at
+    validator = (
+        tuple((post.id, post.updated_at) for post in page),
+        next_cursor,
+        prev_cursor,
+        tuple(sorted(request.args.items(multi=True)))
+    )
+    return validator, max((post.updated_at for post in page), default=None)
+
+
+def revalidating() -> bool:
+    """Whether the client holds a copy to validate (worth a stamp query)."""
+    return bool(request.if_none_match or request.if_modified_since)
+
+
+def _etag(validator: tuple) -> str:
+    parts = (current_app.config["CONDITIONAL_GET_VERSION"], current_user.id, validator)
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def _http_date(value: Optional[datetime]) -> Optional[datetime]:
+    # Stored times are naive UTC; HTTP dates have whole seconds
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def validate(validator: tuple, last_modified: Optional[datetime] = None) -> None:
+    """Send these validators with the page being rendered."""
+    g.validators = (_etag(validator), _http_date(last_modified))
+
+
+def not_modified(validator: tuple, last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """A 304 when the client's copy is current, else None (and `validate()`)."""
+    validate(validator, last_modified)
+    etag, last_modified = g.validators
+    # A pending flash message must reach the page
+    if "_flashes" in session:
+        return None
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        fresh = (
+            last_modified is not None
+            and request.if_modified_since is not None
+            and last_modified <= request.if_modified_since
+        )
+    return current_app.response_class(status=304) if fresh else None
+
+
+def post_not_modified(row) -> Optional[Response]:
+    """not_modified() for a row of post_stamp_query() (None if there is none)."""
+    if row is None:
+        return None
+    stamp = PostStamp(*row)
+    # Let ViewPost answer 404
+    if not stamp.visible_to(current_user):
+        return None
+    return not_modified(stamp.validator(), stamp.updated_at)
+
+
+def validate_post(post: Post) -> None:
+    stamp = PostStamp.of(post)
+    validate(stamp.validator(), stamp.updated_at)
+
+
+def listing_not_modified(page: List, next_cursor: Optional[str], prev_cursor: Optional[str]) -> Optional[Response]:
+    return not_modified(*_listing_validators(page, next_cursor, prev_cursor))
+
+
+def validate_listing(page: List, next_cursor: Optional[str], prev_cursor: Optional[str]) -> None:
+    validate(*_listing_validators(page, next_cursor, prev_cursor))
+
+
+def _add_validators(response: Response) -> Response:
+    validators = g.pop("validators", None)
+    if validators is None or response.status_code not in (200, 304):
+        return response
+    etag, last_modified = validators
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    return response
+
+
+def init_app(app) -> None:
+    app.after_request(_add_validators)
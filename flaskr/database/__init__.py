@@ -1,13 +1,16 @@
 from __future__ import annotations
 from typing import List, Optional
 from datetime import datetime, timezone
-from werkzeug.security import generate_password_hash, check_password_hash
+from flaskr.passwords import hash_password, verify_password
+from flaskr.replicas import RoutingSession
+from flask import current_app, has_app_context
 from flask_login import UserMixin
 
 from flask_sqlalchemy import (
     SQLAlchemy
 )
 from sqlalchemy import (
+    insert,
     Integer,
     String,
     Table,
@@ -15,29 +18,188 @@ from sqlalchemy import (
     ForeignKey,
     DateTime,
     Text,
-    UniqueConstraint
+    Index,
+    UniqueConstraint,
+    TypeDecorator,
+    event,
+    inspect,
+    select,
+    update
 )
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
     mapped_column,
     relationship,
-    declared_attr
+    declared_attr,
+    validates
 )
 import uuid
+import zlib
+
+
+class PublicId(TypeDecorator):
+    """
+    UUID exposed as its canonical 36-char string everywhere in Python.
+
+    Stored as that string by default, or as the 16 raw bytes when the
+    current app's PUBLIC_ID_BINARY is on. Rows in either form are read
+    back, but lookups bind the configured form only and miss rows stored
+    in the other one: stop the application, run `flask schema public-ids`
+    and switch PUBLIC_ID_BINARY together. Values that are not UUIDs are
+    bound unchanged and simply match nothing.
+    """
+    impl = String(36)
+    cache_ok = True
+
+    @property
+    def binary(self) -> bool:
+        return has_app_context() and current_app.config["PUBLIC_ID_BINARY"]
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = uuid.UUID(bytes=value)
+        elif not isinstance(value, uuid.UUID):
+            try:
+                value = uuid.UUID(value)
+            except (TypeError, ValueError):
+                return value
+        return value.bytes if self.binary else str(value)
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            return str(uuid.UUID(bytes=value))
+        return value
+
+
+class CompressedText(TypeDecorator):
+    """
+    Text that is stored zlib-compressed (as a BLOB) when the current app's
+    POST_BODY_COMPRESSION is on and it is at least
+    POST_BODY_COMPRESSION_THRESHOLD bytes long. Reads accept both, so
+    `flask schema post-bodies` can convert an existing database while it is
+    in use. SQL sees the text through the post_body() function.
+    """
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if not has_app_context():
+            return value
+        config = current_app.config
+        return self.encode(value, config["POST_BODY_COMPRESSION"], config["POST_BODY_COMPRESSION_THRESHOLD"])
+
+    def process_result_value(self, value, dialect):
+        return self.decode(value)
+
+    @staticmethod
+    def encode(value, compress: bool, threshold: int):
+        if value is None or not compress:
+            return value
+        encoded = value.encode()
+        return zlib.compress(encoded) if len(encoded) >= threshold else value
+
+    @staticmethod
+    def decode(value):
+        if isinstance(value, bytes):
+            return zlib.decompress(value).decode()
+        return value
+
+
+@event.listens_for(Engine, "connect")
+def _register_functions(dbapi_connection, connection_record):
+    # Used by the search triggers, which index the text, not its storage
+    dbapi_connection.create_function("post_body", 1, CompressedText.decode, deterministic=True)
 
 
 class Base(DeclarativeBase):
 
-    def insert(self):
+    def insert(self, commit: bool = True):
         db.session.add(self)
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
-    def update(self):
-        db.session.commit()
-
-
-db = SQLAlchemy(model_class=Base)
+    def update(self, commit: bool = True):
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+
+    @classmethod
+    def insert_all(cls, objects: list, commit: bool = True) -> List[int]:
+        """
+        Persist `objects` (any mix of models) in a single flush and return
+        their primary keys. The unit of work groups the rows of each table
+        into executemany INSERT ... RETURNING; SQLite still runs those one
+        row at a time, since it cannot return ids in parameter order, but
+        all of them share one flush and one commit. Pass commit=False to
+        keep going in the same transaction.
+        """
+        db.session.add_all(objects)
+        db.session.flush()
+        ids = [inspect(obj).identity[0] for obj in objects]
+        if commit:
+            db.session.commit()
+        return ids
+
+    @classmethod
+    def insert_rows(cls, rows: List[dict], commit: bool = True) -> List[int]:
+        """
+        Bulk INSERT of plain dicts, returning the new ids in the order of
+        `rows`. No objects are built and column defaults still
+        apply, but mapper events do not fire: derived tables (statistics,
+        request counters) have to be recounted afterwards.
+        """
+        if not rows:
+            return []
+        ids = db.session.scalars(
+            insert(cls).returning(cls.id, sort_by_parameter_order=True),
+            rows
+        ).all()
+        if commit:
+            db.session.commit()
+        return ids
+
+    @classmethod
+    def upsert_rows(cls, rows: List[dict], index_elements: List[str], commit: bool = True) -> List[int]:
+        """
+        insert_rows() that updates the existing row instead when one of
+        `index_elements` (a unique column set) already exists. Rows must
+        still be complete: SQLite checks NOT NULL before the conflict.
+        """
+        if not rows:
+            return []
+        statement = sqlite_insert(cls)
+        statement = statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={
+                name: statement.excluded[name]
+                for name in rows[0] if name not in index_elements
+            }
+        )
+        ids = db.session.scalars(
+            statement.returning(cls.id, sort_by_parameter_order=True),
+            rows
+        ).all()
+        if commit:
+            db.session.commit()
+        return ids
+
+    def previous(self, key):
+        # Value of `key` before the pending (not yet flushed) change. The
+        # column needs active_history=True if the object may have been
+        # expired (e.g. loaded before a commit): history is empty otherwise
+        history = inspect(self).attrs[key].history
+        if history.deleted:
+            return history.deleted[0]
+        return getattr(self, key)
+
+
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 
 
 class Board(db.Model):
@@ -53,6 +215,8 @@ class Board(db.Model):
     # TODO: 
     incoming_requests: Mapped[List[RepresentativeRequest]] = relationship(
             back_populates="board")
+    # Maintained by flaskr.routing, do not set by hand
+    open_requests_count: Mapped[int] = mapped_column(default=0, server_default="0", index=True)
 
 
 
@@ -91,7 +255,9 @@ class User(UserMixin, db.Model):
     __tablename__ = "user_table"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    alternative_id: Mapped[str] = mapped_column(default=lambda: str(uuid.uuid4()))
+    alternative_id: Mapped[str] = mapped_column(
+        PublicId, unique=True, index=True, default=lambda: str(uuid.uuid4())
+    )
 
     full_name: Mapped[str] = mapped_column(String(40))
     username: Mapped[str] = mapped_column(String(20), unique=True)
@@ -115,6 +281,7 @@ class User(UserMixin, db.Model):
 
     post_comments: Mapped[List[PostComment]] = relationship(back_populates="author")
     requests: Mapped[List[UserRequest]] = relationship(back_populates="calling_user")
+    statistics: Mapped[Optional[UserStatistics]] = relationship(back_populates="user")
 
     type: Mapped[str]
 
@@ -126,11 +293,11 @@ class User(UserMixin, db.Model):
 
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
 
     def check_password(self, password):
-        return check_password_hash(self. password_hash, password)
+        return verify_password(self.password_hash, password)
 
     def get_id(self):
         return self.alternative_id
@@ -173,6 +340,8 @@ class Representative(User):
     id: Mapped[int] = mapped_column(ForeignKey("user_table.id"), primary_key=True)
     incoming_requests: Mapped[List[UserRequest]] = relationship(back_populates="receiving_representative")
     repr_requests: Mapped[List[RepresentativeRequest]] = relationship(back_populates="representative")
+    # Maintained by flaskr.routing, do not set by hand
+    open_requests_count: Mapped[int] = mapped_column(default=0, server_default="0", index=True)
 
     # TODO: requests relationship: Done
     inserted_insights: Mapped[Insight] = relationship(back_populates="inserting_representative")
@@ -183,22 +352,47 @@ class Representative(User):
 
 
 
+class UserStatistics(db.Model):
+    __tablename__ = "user_statistics_table"
+
+    # Per-user post counters maintained by flaskr.statistics
+    user_id: Mapped[int] = mapped_column(ForeignKey("user_table.id"), primary_key=True)
+    publications: Mapped[int] = mapped_column(default=0)
+    public_publications: Mapped[int] = mapped_column(default=0)
+    confirmed_for_deployment: Mapped[int] = mapped_column(default=0)
+    confirmed_for_insights: Mapped[int] = mapped_column(default=0)
+
+    user: Mapped[User] = relationship(back_populates="statistics")
+
+
 class Request(db.Model):
     __abstract__ = True
 
     id: Mapped[int] = mapped_column(primary_key=True)
     confirmed: Mapped[bool] = mapped_column(default=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now(timezone.utc))
-    closed_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+    # Moves with every change (confirmation, closing, reassignment), for
+    # incremental exports; nullable for databases upgraded in place
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+        index=True
+    )
+    # active_history: flaskr.routing needs the old value even when the
+    # request was loaded (and so expired) in an earlier transaction
+    closed_at: Mapped[Optional[datetime]] = mapped_column(nullable=True, active_history=True)
 
 
 
 class UserRequest(Request):
     __tablename__ = "user_request_table"
 
-    calling_user_id: Mapped[int] = mapped_column(ForeignKey("user_table.id"))
+    calling_user_id: Mapped[int] = mapped_column(ForeignKey("user_table.id"), index=True)
     calling_user: Mapped[User] = relationship(back_populates="requests")
-    receiving_representative_id: Mapped[int] = mapped_column(ForeignKey("representative_table.id"))
+    receiving_representative_id: Mapped[int] = mapped_column(
+        ForeignKey("representative_table.id"), index=True, active_history=True
+    )
     receiving_representative: Mapped[Representative] = relationship(
         back_populates="incoming_requests",
         foreign_keys=[receiving_representative_id]
@@ -216,7 +410,7 @@ class RepresentativeRequest(Request):
     calling_user_request: Mapped[UserRequest] = relationship(back_populates="linked_repr_request")
     representative_id: Mapped[int] = mapped_column(ForeignKey("representative_table.id"))
     representative: Mapped[Representative] = relationship(back_populates="repr_requests")
-    board_id: Mapped[int] = mapped_column(ForeignKey("board_table.id"))
+    board_id: Mapped[int] = mapped_column(ForeignKey("board_table.id"), active_history=True)
     board: Mapped[Board] = relationship(back_populates="incoming_requests")
 
     __table_args__ = (
@@ -242,7 +436,8 @@ post_category_association_table = Table(
     "post_category_association_table",
     db.metadata,
     Column("post_category_id", ForeignKey("post_category_table.id")),
-    Column("post_id", ForeignKey("post_table.id")),
+    Column("post_id", ForeignKey("post_table.id"), index=True),
+    Index("ix_post_category_association_category_post", "post_category_id", "post_id"),
 )
 
 
@@ -270,31 +465,49 @@ class PostCategory(db.Model):
 post_to_post_association_table = Table(
     "post_to_post_association_table",
     db.metadata,
-    Column("post_id", ForeignKey("post_table.id")),
-    Column("linked_post_id", ForeignKey("post_table.id"))
+    # Both directions are walked by flaskr.graph
+    Column("post_id", ForeignKey("post_table.id"), index=True),
+    Column("linked_post_id", ForeignKey("post_table.id"), index=True)
 )
 
 # Post table is in many-to-one relationship with PostType table
 
 
 
+# Characters of the body shown in post listings
+PREVIEW_LENGTH = 50
+
+
 class Post(db.Model):
     __tablename__ = "post_table"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    alternative_id: Mapped[str] = mapped_column(default=lambda: str(uuid.uuid4()))
+    alternative_id: Mapped[str] = mapped_column(
+        PublicId, unique=True, index=True, default=lambda: str(uuid.uuid4())
+    )
 
     title: Mapped[str] = mapped_column(String(100))
-    body: Mapped[str] = mapped_column(Text)
+    # Listings show the preview; the body is loaded only where it is shown
+    body: Mapped[str] = mapped_column(CompressedText, deferred=True)
+    preview: Mapped[Optional[str]] = mapped_column(String(PREVIEW_LENGTH))
+    # Rendered Markdown of the body and the renderer version; see flaskr.rendering
+    body_html: Mapped[Optional[str]] = mapped_column(Text, deferred=True)
+    body_html_version: Mapped[Optional[int]] = mapped_column(index=True)
     upvotes: Mapped[int] = mapped_column(default=0)
-    private: Mapped[bool] = mapped_column(default=False)
+    # active_history: flaskr.statistics needs the old value of these even
+    # when the post was loaded (and so expired) in an earlier transaction
+    private: Mapped[bool] = mapped_column(default=False, active_history=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc)
+    )
     # BAD:
-    confirmed_for_deployment: Mapped[bool] = mapped_column(default=False)
-    confirmed_for_insights: Mapped[bool] = mapped_column(default=False)
+    confirmed_for_deployment: Mapped[bool] = mapped_column(default=False, active_history=True)
+    confirmed_for_insights: Mapped[bool] = mapped_column(default=False, active_history=True)
 
-    original_author_id: Mapped[int] = mapped_column(ForeignKey("user_table.id"))
+    original_author_id: Mapped[int] = mapped_column(ForeignKey("user_table.id"), active_history=True)
     original_author: Mapped[User] = relationship(
         back_populates="authored_posts",
         foreign_keys=[original_author_id]
@@ -331,9 +544,45 @@ class Post(db.Model):
 
     insights: Mapped[List[Insight]] = relationship(back_populates="source_post")
 
-    outgoing_requet_id: Mapped[int] = mapped_column(ForeignKey("user_request_table.id"), nullable=True)
+    outgoing_requet_id: Mapped[int] = mapped_column(ForeignKey("user_request_table.id"), nullable=True, index=True)
     outgoing_request: Mapped[UserRequest] = relationship(back_populates="request_object")
 
+    __table_args__ = (
+        # Keyset pagination of listings walks this index newest-first
+        Index("ix_post_created_at_id", "created_at", "id"),
+        Index("ix_post_author_created_at_id", "original_author_id", "created_at", "id"),
+        # Incremental exports (flaskr.export) walk posts changed since a time
+        Index("ix_post_updated_at_id", "updated_at", "id"),
+    )
+
+    @staticmethod
+    def make_preview(body: str) -> str:
+        """Also to be set by writers that insert rows without the ORM."""
+        return body[:PREVIEW_LENGTH]
+
+    @validates("body")
+    def _update_preview(self, key, body):
+        self.preview = self.make_preview(body)
+        return body
+
+    @property
+    def short_body(self) -> str:
+        # Rows of databases not yet upgraded by `flask schema post-bodies`
+        # have no preview: those load their body instead
+        if self.preview is not None:
+            return self.preview
+        return self.make_preview(self.body)
+
+    def attach_categories(self, category_ids: List[int]) -> None:
+        # One executemany INSERT into the association table; the categories
+        # are not loaded. The post must have been flushed already.
+        db.session.execute(
+            insert(post_category_association_table),
+            [
+                {"post_id": self.id, "post_category_id": category_id}
+                for category_id in category_ids
+            ]
+        )
 
 
     def get_public_info(self, short=False):
@@ -350,7 +599,9 @@ class Post(db.Model):
         }
 
         if short:
-            response["body"] = self.body[:50]
+            response["preview"] = self.short_body
+            # Clients written before the preview column read "body"
+            response["body"] = response["preview"]
         else:
             response["body"] = self.body
             response["upvotes"] = self.upvotes
@@ -371,7 +622,7 @@ class Discussion(db.Model):
 class PostDiscussion(Discussion):
     __tablename__ = "discussion_table"
 
-    post_id: Mapped[int] = mapped_column(ForeignKey("post_table.id"))
+    post_id: Mapped[int] = mapped_column(ForeignKey("post_table.id"), index=True)
     post: Mapped[Post] = relationship(back_populates="post_discussion")
     post_comments: Mapped[List[PostComment]] = relationship(back_populates="post_discussion")
 
@@ -412,10 +663,46 @@ class Comment(db.Model):
 class PostComment(Comment):
     __tablename__ = "post_comment"
 
-    post_discussion_id: Mapped[int] = mapped_column(ForeignKey("discussion_table.id"))
+    text_html: Mapped[Optional[str]] = mapped_column(Text)
+    text_html_version: Mapped[Optional[int]] = mapped_column(index=True)
+
+    post_discussion_id: Mapped[int] = mapped_column(ForeignKey("discussion_table.id"), index=True)
     post_discussion: Mapped[PostDiscussion] = relationship(back_populates="post_comments")
 
 
+@event.listens_for(PostComment, "after_insert")
+@event.listens_for(PostComment, "after_delete")
+def _touch_post(mapper, connection, comment):
+    # Post.updated_at versions the post together with its thread (exports,
+    # ETags, cached threads): ids of deleted comments can be reused
+    connection.execute(
+        update(Post.__table__)
+        .where(
+            Post.__table__.c.id == select(PostDiscussion.post_id)
+            .where(PostDiscussion.id == comment.post_discussion_id)
+            .scalar_subquery()
+        )
+        .values(updated_at=datetime.now(timezone.utc))
+    )
+
+
+# One row per (user, target) upvote, written in batches by flaskr.votes
+
+post_vote_table = Table(
+    "post_vote_table",
+    db.metadata,
+    Column("user_id", ForeignKey("user_table.id"), primary_key=True),
+    Column("post_id", ForeignKey("post_table.id"), primary_key=True),
+)
+
+post_comment_vote_table = Table(
+    "post_comment_vote_table",
+    db.metadata,
+    Column("user_id", ForeignKey("user_table.id"), primary_key=True),
+    Column("comment_id", ForeignKey("post_comment.id"), primary_key=True),
+)
+
+
 class BoardDiscussionComment(Comment):
     __tablename__ = "board_discussion_comment"
 
@@ -438,7 +725,47 @@ class Insight(db.Model):
     inserting_representative_id: Mapped[int] = mapped_column(ForeignKey("representative_table.id"))
     inserting_representative: Mapped[Representative] = relationship(back_populates="inserted_insights")
 
-    source_post_id: Mapped[int] = mapped_column(ForeignKey("post_table.id"))
+    # One insight per post, written by flaskr.insights
+    source_post_id: Mapped[int] = mapped_column(ForeignKey("post_table.id"), unique=True, index=True)
     source_post: Mapped[Post] = relationship(back_populates="insights")
 
 
+class InsightJob(db.Model):
+    """Durable queue of posts waiting for an Insight; see flaskr.insights."""
+    __tablename__ = "insight_job_table"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    post_id: Mapped[int] = mapped_column(ForeignKey("post_table.id"), unique=True)
+    # pending -> running -> done | failed
+    status: Mapped[str] = mapped_column(String(10), default="pending", server_default="pending")
+    attempts: Mapped[int] = mapped_column(default=0, server_default="0")
+    lease_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_insight_job_status_id", "status", "id"),
+    )
+
+
+
+
+class ImportedPost(db.Model):
+    """Source id of every post written by flaskr.ingest, for dedup and links."""
+    __tablename__ = "imported_post_table"
+
+    source: Mapped[str] = mapped_column(String(50), primary_key=True)
+    external_id: Mapped[str] = mapped_column(String(100), primary_key=True)
+    post_id: Mapped[int] = mapped_column(ForeignKey("post_table.id"), index=True)
+
+
+# Links of imported posts whose target has not been imported yet
+import_pending_link_table = Table(
+    "import_pending_link_table",
+    db.metadata,
+    Column("source", String(50), primary_key=True),
+    Column("external_id", String(100), primary_key=True),
+    Column("linked_external_id", String(100), primary_key=True),
+    Index("ix_import_pending_link_target", "source", "linked_external_id"),
+)
@@ -0,0 +1,448 @@
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Iterator, List, Optional
+import click
+from flask import current_app
+from sqlalchemy import func, select
+from flaskr import insights, related, search, statistics, routing, reference, rendering
+from flaskr.database import (
+    db,
+    Board,
+    BoardMember,
+    Post,
+    PostCategory,
+    PostComment,
+    PostDiscussion,
+    PostType,
+    Representative,
+    RepresentativeRequest,
+    User,
+    UserRequest,
+    post_category_association_table,
+    post_to_post_association_table
+)
+from flaskr.passwords import hash_password
+
+
+# Synthetic data at production volumes.
+#
+# Rows are generated in primary key order with explicit ids and written with
+# Core executemany inserts, batch_size rows per transaction, so nothing goes
+# through the ORM unit of work or its per-row events. Derived state (search
+# index, per-user statistics, request counters, related-posts index,
+# insight jobs) is rebuilt once at the end; the search triggers come back
+# even when the load fails part way.
+#
+# Activity is skewed like a real community: authors, commented posts and
+# categories are drawn from a Zipf-like distribution, so a few users write
+# most of the posts and a few posts collect most of the comments.
+#
+# The same seed always produces the same database. Every generated user gets
+# the same password; it is hashed once and the hash reused.
+
+POST_TYPES = ["Solution Relations", "Issue Relations", "Ideas", "Issues", "Solutions"]
+
+CATEGORIES = [
+    "No Poverty", "Health", "Education", "Climate", "Affordable & Clean Energy",
+    "Responsible consumption", "Economy", "Peace, Jutice, and Strong Institutions",
+    "Zero Hunger", "Life Beow Water", "Life on Land", "Clean Water and Saniation",
+]
+
+FIRST_NAMES = [
+    "Amina", "Bekzod", "Chen", "Dilnoza", "Elena", "Farid", "Grace", "Hiro",
+    "Ines", "Jamal", "Kofi", "Laila", "Mateo", "Nadia", "Omar", "Priya",
+    "Quentin", "Rosa", "Sardor", "Tariq", "Umida", "Viktor", "Wen", "Yusuf",
+]
+
+LAST_NAMES = [
+    "Abdullaev", "Brown", "Costa", "Diallo", "Evans", "Fischer", "Garcia",
+    "Haddad", "Ivanova", "Jensen", "Karimov", "Li", "Mensah", "Novak",
+    "Okafor", "Petrov", "Rahimov", "Silva", "Tanaka", "Usmonov", "Weber",
+]
+
+PROFESSIONS = [
+    "student", "engineer", "teacher", "physician", "farmer", "researcher",
+    "economist", "designer", "nurse", "lawyer", "developer", "activist",
+]
+
+WORDS = (
+    "water access energy solar grid school teacher clinic vaccine farm soil "
+    "harvest drought flood climate emission carbon waste plastic recycling "
+    "ocean river forest village city transport road market income loan "
+    "community health nutrition hunger poverty education literacy girls "
+    "policy council budget data sensor mobile network training volunteer "
+    "pilot project cost impact local regional partner funding maintenance "
+    "pump filter well sanitation housing job youth women justice court "
+    "insurance cooperative storage cold chain irrigation seed fertilizer "
+    "battery wind biogas stove smoke air quality monitoring report survey"
+).split()
+
+DEFAULT_PASSWORD = "password"
+
+
+class Generator:
+
+    def __init__(self, seed: int, batch_size: int, skew: float, until: datetime, days: int):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.skew = skew
+        self.until = until
+        self.since = until - timedelta(days=days)
+
+    def public_id(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def text(self, low: int, high: int) -> str:
+        return " ".join(self.rng.choices(WORDS, k=self.rng.randint(low, high)))
+
+    def skewed(self, population: List[int]) -> "SkewedChoice":
+        return SkewedChoice(self.rng, population, self.skew)
+
+    def timestamps(self, count: int) -> Iterator[datetime]:
+        # Monotonic in id order, like rows inserted over time
+        span = (self.until - self.since).total_seconds()
+        for index in range(count):
+            offset = span * (index + self.rng.random()) / max(count, 1)
+            yield self.since + timedelta(seconds=offset)
+
+    def insert(self, table, rows: Iterator[dict], label: str) -> int:
+        started = time.perf_counter()
+        total = sum(self._flush(table, batch) for batch in _chunks(rows, self.batch_size))
+        if total:
+            elapsed = time.perf_counter() - started
+            click.echo(f"  {label}: {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f}/s)")
+        return total
+
+    def _flush(self, table, batch: List[dict]) -> int:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        return len(batch)
+
+
+class SkewedChoice:
+    """Zipf-like draw: weight 1/rank**skew over a shuffled population."""
+
+    def __init__(self, rng: random.Random, population: List[int], skew: float):
+        self.rng = rng
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.cum_weights = list(accumulate(
+            1.0 / (rank ** skew) for rank in range(1, len(self.population) + 1)
+        ))
+
+    def one(self) -> int:
+        return self.rng.choices(self.population, cum_weights=self.cum_weights)[0]
+
+    def many(self, k: int) -> List[int]:
+        return self.rng.choices(self.population, cum_weights=self.cum_weights, k=k)
+
+
+def _next_id(model) -> int:
+    return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _reference_ids(model, names: List[str]) -> List[int]:
+    ids = db.session.execute(select(model.id).order_by(model.id)).scalars().all()
+    if ids:
+        return list(ids)
+    first = _next_id(model)
+    db.session.execute(
+        model.__table__.insert(),
+        [{"id": first + index, "name": name} for index, name in enumerate(names)]
+    )
+    db.session.commit()
+    return list(range(first, first + len(names)))
+
+
+def generate(
+    users: int,
+    representatives: int,
+    boards: int,
+    board_members: int,
+    posts: int,
+    comments: int,
+    links: int,
+    requests: int,
+    seed: int = 42,
+    batch_size: int = 10000,
+    skew: float = 1.07,
+    until: Optional[datetime] = None,
+    days: int = 730,
+    password: str = DEFAULT_PASSWORD
+) -> None:
+    gen = Generator(seed, batch_size, skew, until or datetime(2025, 10, 1), days)
+    rng = gen.rng
+    password_hash = hash_password(password)
+
+    search.drop_triggers()
+    try:
+        type_ids = _reference_ids(PostType, POST_TYPES)
+        category_ids = _reference_ids(PostCategory, CATEGORIES)
+
+        # Boards and users
+        first_board = _next_id(Board)
+        board_ids = list(range(first_board, first_board + boards))
+        gen.insert(Board.__table__, (
+            {"id": board_id, "established_at": gen.since, "open_requests_count": 0}
+            for board_id in board_ids
+        ), "boards")
+
+        first_user = _next_id(User)
+        user_count = users + representatives + (board_members if board_ids else 0)
+        user_ids = list(range(first_user, first_user + user_count))
+        representative_ids = user_ids[users:users + representatives]
+        member_ids = user_ids[users + representatives:]
+        user_types = {user_id: "representative" for user_id in representative_ids}
+        user_types.update({user_id: "board_member" for user_id in member_ids})
+
+        def user_rows():
+            for user_id, registered_at in zip(user_ids, gen.timestamps(user_count)):
+                yield {
+                    "id": user_id,
+                    "alternative_id": gen.public_id(),
+                    "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    "username": f"member{user_id}",
+                    "email": f"member{user_id}@example.org",
+                    "profession": rng.choice(PROFESSIONS),
+                    "age": rng.randint(16, 80) if rng.random() < 0.8 else None,
+                    "password_hash": password_hash,
+                    "registered_at": registered_at,
+                    "type": user_types.get(user_id, "user")
+                }
+
+        gen.insert(User.__table__, user_rows(), "users")
+        gen.insert(Representative.__table__, (
+            {"id": user_id, "open_requests_count": 0} for user_id in representative_ids
+        ), "representatives")
+        gen.insert(BoardMember.__table__, (
+            {"id": user_id, "board_id": board_ids[index % len(board_ids)]}
+            for index, user_id in enumerate(member_ids)
+        ), "board members")
+
+        # Posts, each with its discussion and 1-3 categories. A share of the
+        # posts has an outgoing request; the request rows are generated in the
+        # same pass so post.outgoing_requet_id can be filled in directly.
+        first_post = _next_id(Post)
+        post_ids = list(range(first_post, first_post + posts))
+        first_discussion = _next_id(PostDiscussion)
+        first_request = _next_id(UserRequest)
+        request_ratio = min(requests / posts, 1.0) if posts else 0
+
+        authors = gen.skewed(user_ids)
+        post_types = gen.skewed(type_ids)
+        categories = gen.skewed(category_ids)
+
+        request_rows = []
+        category_rows = []
+        discussion_rows = []
+
+        def post_rows():
+            request_id = first_request
+            for index, (post_id, created_at) in enumerate(zip(post_ids, gen.timestamps(posts))):
+                author_id = authors.one()
+                private = rng.random() < 0.1
+
+                outgoing_request_id = None
+                if representative_ids and not private and rng.random() < request_ratio:
+                    outgoing_request_id = request_id
+                    representative_id = rng.choice(representative_ids)
+                    requested_at = created_at + timedelta(hours=rng.randint(1, 72))
+                    request_rows.append({
+                        "id": request_id,
+                        "calling_user_id": author_id,
+                        "receiving_representative_id": representative_id,
+                        "confirmed": False,
+                        "created_at": requested_at,
+                        "updated_at": requested_at,
+                        "closed_at": None
+                    })
+                    request_id += 1
+
+                for category_id in set(categories.many(rng.randint(1, 3))):
+                    category_rows.append({"post_id": post_id, "post_category_id": category_id})
+                discussion_rows.append({
+                    "id": first_discussion + index,
+                    "post_id": post_id,
+                    "created_at": created_at
+                })
+
+                row = {
+                    "id": post_id,
+                    "alternative_id": gen.public_id(),
+                    "title": gen.text(3, 12).capitalize()[:100],
+                    "body": gen.text(40, 400).capitalize(),
+                    "upvotes": int(rng.paretovariate(1.5)) - 1,
+                    "private": private,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                    "confirmed_for_deployment": rng.random() < 0.02,
+                    "confirmed_for_insights": rng.random() < 0.05,
+                    "original_author_id": author_id,
+                    "post_type_id": post_types.one(),
+                    "outgoing_requet_id": outgoing_request_id
+                }
+                row["preview"] = Post.make_preview(row["body"])
+                row["body_html"] = rendering.render(row["body"])
+                row["body_html_version"] = rendering.RENDERER_VERSION
+                yield row
+
+        def posts_and_side_tables():
+            # post_rows() fills the side tables as it goes; they are written and
+            # emptied after every batch of posts
+            for post_batch in _chunks(post_rows(), gen.batch_size):
+                gen._flush(Post.__table__, post_batch)
+                for table, rows in (
+                    (PostDiscussion.__table__, discussion_rows),
+                    (post_category_association_table, category_rows),
+                    (UserRequest.__table__, request_rows),
+                ):
+                    if rows:
+                        gen._flush(table, rows)
+                        rows.clear()
+                yield len(post_batch)
+
+        started = time.perf_counter()
+        written = sum(posts_and_side_tables())
+        if written:
+            click.echo(f"  posts (+ discussions, categories, requests): {written} posts in {time.perf_counter() - started:.1f}s")
+
+        # Escalate some of the requests to boards
+        escalated = [
+            row for row in db.session.execute(
+                select(UserRequest.id, UserRequest.receiving_representative_id, UserRequest.created_at)
+                .where(UserRequest.id >= first_request)
+            ).all()
+            if board_ids and rng.random() < 0.3
+        ]
+        first_repr_request = _next_id(RepresentativeRequest)
+
+        def repr_request_rows():
+            for index, row in enumerate(escalated):
+                board_id = rng.choice(board_ids)
+                escalated_at = row.created_at + timedelta(days=rng.randint(1, 14))
+                yield {
+                    "id": first_repr_request + index,
+                    "calling_user_request_id": row.id,
+                    "representative_id": row.receiving_representative_id,
+                    "board_id": board_id,
+                    "confirmed": False,
+                    "created_at": escalated_at,
+                    "updated_at": escalated_at,
+                    "closed_at": None
+                }
+
+        gen.insert(RepresentativeRequest.__table__, repr_request_rows(), "representative requests")
+
+        # Comments concentrate on popular discussions
+        discussions = gen.skewed([first_discussion + index for index in range(posts)])
+        first_comment = _next_id(PostComment)
+
+        def comment_rows():
+            for index in range(comments if posts else 0):
+                row = {
+                    "id": first_comment + index,
+                    "text": gen.text(8, 80).capitalize(),
+                    "upvotes": int(rng.paretovariate(2.0)) - 1,
+                    "author_id": authors.one(),
+                    "post_discussion_id": discussions.one()
+                }
+                row["text_html"] = rendering.render(row["text"])
+                row["text_html_version"] = rendering.RENDERER_VERSION
+                yield row
+
+        gen.insert(PostComment.__table__, comment_rows(), "comments")
+
+        # Links between posts, mostly from newer posts to older ones
+        linked_posts = gen.skewed(post_ids)
+
+        def link_rows():
+            seen = set()
+            for _ in range(links if len(post_ids) > 1 else 0):
+                source, target = rng.choice(post_ids), linked_posts.one()
+                if source != target and (source, target) not in seen:
+                    seen.add((source, target))
+                    yield {"post_id": max(source, target), "linked_post_id": min(source, target)}
+
+        gen.insert(post_to_post_association_table, link_rows(), "post links")
+
+        for batch in _chunks(iter(escalated), gen.batch_size):
+            db.session.execute(
+                UserRequest.__table__.update()
+                .where(UserRequest.id.in_([row.id for row in batch]))
+                .values(confirmed=True)
+            )
+            db.session.commit()
+    finally:
+        # Committed batches stay; index them and restore the triggers either way
+        db.session.rollback()
+        search.rebuild_index()
+
+    click.echo("Rebuilding derived data...")
+    statistics.recount_statistics()
+    routing.recount_open_requests()
+    reference.invalidate()
+    click.echo(f"  insight jobs: {insights.enqueue_confirmed()} enqueued")
+    meta = related.rebuild_index()
+    click.echo(f"  related posts: {meta['documents']} posts indexed")
+    if current_app.config["GRAPH_INDEX"]:
+        click.echo(
+            "  graph: running servers load the new links at their next index rebuild "
+            "(GRAPH_INDEX_TTL seconds); restart them to load them now"
+        )
+
+
+def _chunks(rows: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@click.command("datagen")
+@click.option("--users", default=1000, show_default=True)
+@click.option("--representatives", default=None, type=int, help="Default: 1 per 200 users.")
+@click.option("--boards", default=3, show_default=True)
+@click.option("--board-members", default=9, show_default=True)
+@click.option("--posts", default=10000, show_default=True)
+@click.option("--comments", default=None, type=int, help="Default: 3 per post.")
+@click.option("--links", default=None, type=int, help="Default: 1 per 5 posts.")
+@click.option("--requests", default=None, type=int, help="Default: 1 per 50 posts.")
+@click.option("--seed", default=42, show_default=True)
+@click.option("--batch-size", default=10000, show_default=True)
+@click.option("--skew", default=1.07, show_default=True, help="Zipf exponent of user/post activity.")
+@click.option("--password", default=DEFAULT_PASSWORD, show_default=True, help="Password of every generated user.")
+@click.option("--reset/--append", default=False, help="Drop and recreate all tables first.")
+def datagen_command(users, representatives, boards, board_members, posts, comments,
+                    links, requests, seed, batch_size, skew, password, reset):
+    """Seed the database with synthetic users, posts, comments and requests."""
+    if reset:
+        db.drop_all()
+        db.create_all()
+
+    started = time.perf_counter()
+    generate(
+        users=users,
+        representatives=max(1, users // 200) if representatives is None else representatives,
+        boards=boards,
+        board_members=board_members,
+        posts=posts,
+        comments=posts * 3 if comments is None else comments,
+        links=posts // 5 if links is None else links,
+        requests=posts // 50 if requests is None else requests,
+        seed=seed,
+        batch_size=batch_size,
+        skew=skew,
+        password=password
+    )
+    click.echo(f"Done in {time.perf_counter() - started:.1f}s.")
+
+
+def init_app(app) -> None:
+    app.cli.add_command(datagen_command)
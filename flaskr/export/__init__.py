@@ -0,0 +1,314 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+import click
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+from flask.cli import AppGroup
+from flask_login import login_required
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from flaskr.database import (
+    db,
+    Post,
+    PostCategory,
+    PostComment,
+    PostDiscussion,
+    PostType,
+    User,
+    UserRequest,
+    post_category_association_table
+)
+from flaskr.replicas import reads_from_replica
+
+
+# Streaming exports of public posts, their comments and their requests.
+#
+# Every export is one column projection (no ORM objects) read with
+# yield_per, so rows come off a server-side cursor EXPORT_CHUNK_SIZE at a
+# time. Categories and comments of a chunk of posts are fetched with one
+# query each, keyed by post id. Each chunk is serialised and handed to the
+# response (or file) before the next one is read: memory does not grow
+# with the size of the table.
+#
+# `since` limits an export to posts and requests updated after that time.
+# A post counts as updated when any of its columns or comments change. Responses carry
+# X-Export-Watermark: pass it as the next `since`. updated_at is stamped
+# when a change is flushed, not when it commits, so a transaction still
+# open while an export reads can commit a time older than the export's
+# start. The watermark is therefore the start minus EXPORT_WATERMARK_LAG
+# seconds: rows appear again in the next export rather than not at all,
+# unless their transaction stayed open longer than the lag.
+
+RESOURCES = ("posts", "comments", "requests")
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _watermark() -> str:
+    # Naive UTC like the stored times, so it needs no escaping in a URL
+    lag = timedelta(seconds=current_app.config["EXPORT_WATERMARK_LAG"])
+    return (_now() - lag).replace(tzinfo=None).isoformat()
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _stream(query, chunk_size: int):
+    return db.session.execute(query.execution_options(yield_per=chunk_size)).partitions()
+
+
+def _categories(post_ids: List[int]) -> Dict[int, List[str]]:
+    names = defaultdict(list)
+    for post_id, name in db.session.execute(
+        select(post_category_association_table.c.post_id, PostCategory.name)
+        .join(PostCategory, PostCategory.id == post_category_association_table.c.post_category_id)
+        .where(post_category_association_table.c.post_id.in_(post_ids))
+        .order_by(PostCategory.name)
+    ):
+        names[post_id].append(name)
+    return names
+
+
+def _comments(post_ids: List[int]) -> Dict[int, List[dict]]:
+    comments = defaultdict(list)
+    for row in db.session.execute(
+        select(
+            PostDiscussion.post_id, PostComment.id, PostComment.text, PostComment.upvotes,
+            User.alternative_id, User.username
+        )
+        .join(PostDiscussion, PostDiscussion.id == PostComment.post_discussion_id)
+        .join(User, User.id == PostComment.author_id)
+        .where(PostDiscussion.post_id.in_(post_ids))
+        .order_by(PostComment.id)
+    ):
+        comments[row.post_id].append({
+            "id": row.id,
+            "author": {"alternative_id": row.alternative_id, "username": row.username},
+            "text": row.text,
+            "upvotes": row.upvotes
+        })
+    return comments
+
+
+def export_posts(since: Optional[datetime], chunk_size: int, with_comments: bool = True) -> Iterator[List[dict]]:
+    """Chunks of public post records, oldest change first."""
+    query = (
+        select(
+            Post.id, Post.alternative_id, Post.title, Post.body, Post.upvotes,
+            Post.created_at, Post.updated_at, Post.confirmed_for_deployment,
+            PostType.name.label("post_type"),
+            User.alternative_id.label("author_id"), User.username
+        )
+        .join(PostType, PostType.id == Post.post_type_id)
+        .join(User, User.id == Post.original_author_id)
+        .where(Post.private == False)
+        .order_by(Post.updated_at, Post.id)
+    )
+    if since is not None:
+        query = query.where(Post.updated_at > since)
+
+    for rows in _stream(query, chunk_size):
+        post_ids = [row.id for row in rows]
+        categories = _categories(post_ids)
+        comments = _comments(post_ids) if with_comments else None
+        chunk = []
+        for row in rows:
+            record = {
+                "alternative_id": row.alternative_id,
+                "title": row.title,
+                "body": row.body,
+                "post_type": row.post_type,
+                "categories": categories.get(row.id, []),
+                "author": {"alternative_id": row.author_id, "username": row.username},
+                "upvotes": row.upvotes,
+                "confirmed_for_deployment": row.confirmed_for_deployment,
+                "created_at": _isoformat(row.created_at),
+                "updated_at": _isoformat(row.updated_at)
+            }
+            if comments is not None:
+                record["comments"] = comments.get(row.id, [])
+            chunk.append(record)
+        yield chunk
+
+
+def export_comments(since: Optional[datetime], chunk_size: int) -> Iterator[List[dict]]:
+    """Chunks of comment records on public posts."""
+    query = (
+        select(
+            PostComment.id, PostComment.text, PostComment.upvotes,
+            Post.alternative_id.label("post_id"),
+            User.alternative_id.label("author_id"), User.username
+        )
+        .join(PostDiscussion, PostDiscussion.id == PostComment.post_discussion_id)
+        .join(Post, Post.id == PostDiscussion.post_id)
+        .join(User, User.id == PostComment.author_id)
+        .where(Post.private == False)
+        .order_by(PostComment.id)
+    )
+    if since is not None:
+        query = query.where(Post.updated_at > since)
+
+    for rows in _stream(query, chunk_size):
+        yield [
+            {
+                "id": row.id,
+                "post_id": row.post_id,
+                "author": {"alternative_id": row.author_id, "username": row.username},
+                "text": row.text,
+                "upvotes": row.upvotes
+            }
+            for row in rows
+        ]
+
+
+def export_requests(since: Optional[datetime], chunk_size: int) -> Iterator[List[dict]]:
+    """Chunks of user requests raised for public posts."""
+    caller = aliased(User)
+    representative = aliased(User)
+    query = (
+        select(
+            UserRequest.id, UserRequest.confirmed, UserRequest.created_at, UserRequest.updated_at,
+            UserRequest.closed_at,
+            Post.alternative_id.label("post_id"),
+            caller.username.label("caller"),
+            representative.username.label("representative")
+        )
+        .join(Post, Post.outgoing_requet_id == UserRequest.id)
+        .join(caller, caller.id == UserRequest.calling_user_id)
+        .join(representative, representative.id == UserRequest.receiving_representative_id)
+        .where(Post.private == False)
+        .order_by(UserRequest.id)
+    )
+    if since is not None:
+        query = query.where(UserRequest.updated_at > since)
+
+    for rows in _stream(query, chunk_size):
+        yield [
+            {
+                "id": row.id,
+                "post_id": row.post_id,
+                "caller": row.caller,
+                "representative": row.representative,
+                "confirmed": row.confirmed,
+                "created_at": _isoformat(row.created_at),
+                "updated_at": _isoformat(row.updated_at),
+                "closed_at": _isoformat(row.closed_at)
+            }
+            for row in rows
+        ]
+
+
+def _chunks(resource: str, fmt: str, since: Optional[datetime], chunk_size: int) -> Iterator[List[dict]]:
+    if resource == "posts":
+        # CSV has no room for nested comments; export them separately
+        return export_posts(since, chunk_size, with_comments=fmt == "ndjson")
+    if resource == "comments":
+        return export_comments(since, chunk_size)
+    return export_requests(since, chunk_size)
+
+
+def _flat(record: dict) -> dict:
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            for inner_key, inner_value in value.items():
+                flat[f"{key}_{inner_key}"] = inner_value
+        elif isinstance(value, list):
+            flat[key] = ";".join(value)
+        else:
+            flat[key] = value
+    return flat
+
+
+def serialize(chunks: Iterator[List[dict]], fmt: str) -> Iterator[str]:
+    """One string per chunk: NDJSON lines, or CSV rows after a header."""
+    if fmt == "ndjson":
+        for chunk in chunks:
+            if chunk:
+                yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in chunk)
+        return
+
+    fieldnames = None
+    for chunk in chunks:
+        rows = [_flat(record) for record in chunk]
+        if not rows:
+            continue
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames or list(rows[0]))
+        if fieldnames is None:
+            writer.writeheader()
+            fieldnames = writer.fieldnames
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def parse_since(value: Optional[str]) -> Optional[datetime]:
+    """
+    ISO 8601 time as naive UTC, like the stored times; naive values are
+    taken as UTC. Raises ValueError.
+    """
+    if not value:
+        return None
+    since = datetime.fromisoformat(value)
+    return since.astimezone(timezone.utc).replace(tzinfo=None) if since.tzinfo else since
+
+
+export_bp = Blueprint("export", __name__, url_prefix="/export")
+
+
+@export_bp.get("/<string:resource>.<string:fmt>")
+@login_required
+@reads_from_replica
+def Export(resource: str, fmt: str):
+    if resource not in RESOURCES or fmt not in FORMATS:
+        abort(404)
+    try:
+        since = parse_since(request.args.get("since"))
+    except ValueError:
+        abort(400)
+
+    watermark = _watermark()
+    body = serialize(
+        _chunks(resource, fmt, since, current_app.config["EXPORT_CHUNK_SIZE"]), fmt
+    )
+    return Response(
+        stream_with_context(body),
+        mimetype=FORMATS[fmt],
+        headers={
+            "Content-Disposition": f"attachment; filename={resource}.{fmt}",
+            "X-Export-Watermark": watermark
+        }
+    )
+
+
+export_cli = AppGroup("export", help="Stream public data to a file.")
+
+
+@export_cli.command("dump")
+@click.argument("resource", type=click.Choice(RESOURCES))
+@click.option("--format", "fmt", type=click.Choice(list(FORMATS)), default="ndjson", show_default=True)
+@click.option("--since", help="Only posts updated after this ISO 8601 time.")
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-", help="Defaults to stdout.")
+def dump_command(resource, fmt, since, output):
+    """Write RESOURCE; prints the watermark for the next --since."""
+    try:
+        since = parse_since(since)
+    except ValueError:
+        raise click.BadParameter("not an ISO 8601 time", param_hint="--since")
+
+    watermark = _watermark()
+    for text in serialize(_chunks(resource, fmt, since, current_app.config["EXPORT_CHUNK_SIZE"]), fmt):
+        output.write(text)
+    click.echo(f"Watermark: {watermark}", err=True)
+
+
+def init_app(app) -> None:
+    app.register_blueprint(export_bp)
+    app.cli.add_command(export_cli)
@@ -0,0 +1,323 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Iterable, Optional
+import click
+from flask import current_app, has_app_context, render_template
+from flask.cli import AppGroup
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from flaskr.database import Post, PostCategory, PostComment
+from flaskr import rendering, votes
+
+
+# Cached markup of post cards (listings) and comment threads (post pages).
+#
+# An entry is stored under the object it renders ("card:<post id>",
+# "thread:<discussion id>") with its version: a digest of every value the
+# fragment shows, taken from the rows the request loaded anyway (a card's
+# post info with its author and category names; the post's updated_at,
+# which moves with every comment insert and delete, and each comment's
+# upvotes, renderer version and author). A lookup only hits when the
+# versions match, so rows written by other processes or outside the ORM
+# cannot bring back stale markup, whichever store is used. Commits that
+# change a Post or PostComment also delete its entry, and a changed
+# PostCategory deletes all cards, but only in this process's store: that
+# just frees the space early.
+#
+# A thread shows delete buttons to the authors of its comments, so they get
+# a variant of their own; every other viewer shares one.
+#
+# FRAGMENT_CACHE picks the store: "memory" (an LRU per process), "sqlite"
+# (one file shared by all workers, FRAGMENT_CACHE_PATH) or None. Hit ratios
+# per fragment kind are part of the SQL instrumentation report.
+
+CARD = "card"
+THREAD = "thread"
+
+
+class MemoryStore:
+    """LRU of `size` entries in this process."""
+
+    name = "memory"
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, version: str, variant: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1].get(variant)
+
+    def put(self, key: str, version: str, variant: str, html: str) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                entry = self._entries[key] = (version, {})
+            entry[1][variant] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteStore:
+    """
+    Entries in a SQLite file shared by every process that opens `path`;
+    the oldest beyond `size` are pruned every PRUNE_EVERY writes. Errors
+    (a busy file, a full disk) count as misses.
+    """
+
+    name = "sqlite"
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._local = threading.local()
+        self._writes = 0
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS fragment ("
+            " key TEXT NOT NULL, variant TEXT NOT NULL, version TEXT NOT NULL,"
+            " html TEXT NOT NULL, stored_at REAL NOT NULL,"
+            " PRIMARY KEY (key, variant))"
+        )
+        self._connection().execute(
+            "CREATE INDEX IF NOT EXISTS ix_fragment_stored_at ON fragment (stored_at)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, and none inherited across a fork
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def get(self, key: str, version: str, variant: str) -> Optional[str]:
+        try:
+            row = self._connection().execute(
+                "SELECT html FROM fragment WHERE key = ? AND variant = ? AND version = ?",
+                (key, variant, version)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def put(self, key: str, version: str, variant: str, html: str) -> None:
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("BEGIN")
+                # Variants of an older version go with it
+                connection.execute("DELETE FROM fragment WHERE key = ? AND version <> ?", (key, version))
+                connection.execute(
+                    "INSERT OR REPLACE INTO fragment VALUES (?, ?, ?, ?, ?)",
+                    (key, variant, version, html, time.time())
+                )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune()
+        except sqlite3.Error:
+            pass
+
+    def _prune(self) -> None:
+        self._connection().execute(
+            "DELETE FROM fragment WHERE stored_at < ("
+            " SELECT stored_at FROM fragment ORDER BY stored_at DESC LIMIT 1 OFFSET ?)",
+            (self.size,)
+        )
+
+    def delete(self, keys: Iterable[str]) -> None:
+        try:
+            self._connection().executemany(
+                "DELETE FROM fragment WHERE key = ?", [(key,) for key in keys]
+            )
+        except sqlite3.Error:
+            pass
+
+    def clear(self, prefix: str = "") -> None:
+        try:
+            self._connection().execute(
+                "DELETE FROM fragment WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            )
+        except sqlite3.Error:
+            pass
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT count(*) FROM fragment").fetchone()[0]
+
+
+class FragmentCache:
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def fetch(self, kind: str, key: str, version: str, variant: str, render: Callable[[], str]) -> Markup:
+        html = self.store.get(key, version, variant)
+        with self._lock:
+            if html is None:
+                self.misses[kind] += 1
+            else:
+                self.hits[kind] += 1
+        if html is None:
+            html = render()
+            self.store.put(key, version, variant, html)
+        return Markup(html)
+
+    def stats(self) -> dict:
+        with self._lock:
+            kinds = {}
+            for kind in sorted(set(self.hits) | set(self.misses)):
+                lookups = self.hits[kind] + self.misses[kind]
+                kinds[kind] = {
+                    "hits": self.hits[kind],
+                    "misses": self.misses[kind],
+                    "hit_ratio": round(self.hits[kind] / lookups, 4) if lookups else None
+                }
+        return {"store": self.store.name, "entries": self.store.count(), "kinds": kinds}
+
+
+def _cache() -> Optional[FragmentCache]:
+    return current_app.extensions.get("fragment_cache")
+
+
+def _fetch(kind: str, key: str, version: str, variant: str, render: Callable[[], str]) -> Markup:
+    cache = _cache()
+    if cache is None:
+        return Markup(render())
+    return cache.fetch(kind, key, version, variant, render)
+
+
+def _version(*parts) -> str:
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def post_card(post: Post) -> Markup:
+    """The listing card of `post` (loaded with its author, type and categories)."""
+    info = post.get_public_info(short=True)
+    return _fetch(
+        CARD, f"{CARD}:{post.id}", _version(post.updated_at, info), "",
+        lambda: render_template("post_tmps/_post_card.html", post=info)
+    )
+
+
+def comment_thread(post: Post, render: Callable[[], str]) -> Markup:
+    """
+    The comments of `post` (loaded with their authors); `render` makes them
+    when they are not cached.
+    """
+    comments = post.post_discussion.post_comments
+    version = _version(post.updated_at, rendering.RENDERER_VERSION, [
+        (
+            comment.id,
+            comment.text_html_version,
+            votes.upvotes(votes.COMMENT, comment.id, comment.upvotes),
+            comment.author.alternative_id,
+            comment.author.username
+        )
+        for comment in comments
+    ])
+    authored = any(comment.author_id == current_user.id for comment in comments)
+    return _fetch(
+        THREAD, f"{THREAD}:{post.post_discussion.id}", version,
+        str(current_user.id) if authored else "",
+        render
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    keys = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, PostComment):
+            # A new comment changes the thread's version anyway; deleting
+            # the entry frees its space at once
+            keys.add(f"{THREAD}:{obj.post_discussion_id}")
+        elif obj in session.new:
+            continue
+        elif isinstance(obj, Post):
+            keys.add(f"{CARD}:{obj.id}")
+        elif isinstance(obj, PostCategory):
+            session.info["fragments_clear_cards"] = True
+    if keys:
+        session.info.setdefault("fragments_stale", set()).update(keys)
+
+
+@event.listens_for(Session, "after_commit")
+def _delete_stale(session):
+    keys = session.info.pop("fragments_stale", None)
+    clear_cards = session.info.pop("fragments_clear_cards", False)
+    if not (keys or clear_cards) or not has_app_context() or _cache() is None:
+        return
+    store = _cache().store
+    if clear_cards:
+        store.clear(f"{CARD}:")
+    if keys:
+        store.delete(keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_stale(session):
+    session.info.pop("fragments_stale", None)
+    session.info.pop("fragments_clear_cards", None)
+
+
+fragments_cli = AppGroup("fragments", help="Manage the fragment cache.")
+
+
+@fragments_cli.command("clear")
+def clear_command():
+    """Drop every cached fragment (for the memory store: this process only)."""
+    cache = _cache()
+    if cache is None:
+        click.echo("The fragment cache is off.")
+        return
+    cache.store.clear()
+    click.echo("Fragment cache cleared.")
+
+
+def init_app(app) -> None:
+    app.cli.add_command(fragments_cli)
+
+    kind = app.config["FRAGMENT_CACHE"]
+    size = app.config["FRAGMENT_CACHE_SIZE"]
+    if kind == "memory":
+        store = MemoryStore(size)
+    elif kind == "sqlite":
+        path = app.config["FRAGMENT_CACHE_PATH"] or os.path.join(app.instance_path, "fragments.db")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        store = SQLiteStore(path, size)
+    else:
+        return
+    app.extensions["fragment_cache"] = FragmentCache(store)
@@ -0,0 +1,405 @@
+import threading
+import time
+from array import array
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from flask import Blueprint, abort, current_app, has_app_context, jsonify, request
+from flask_login import current_user, login_required
+from sqlalchemy import event, func, inspect, literal, or_, select
+from sqlalchemy.orm import Session, joinedload
+from flaskr.database import db, Post, post_to_post_association_table
+from flaskr.reference import reference_data
+from flaskr.replicas import reads_from_replica
+
+
+# Walking the linked-post graph (post_to_post_association_table: post_id ->
+# linked_post_id, e.g. an Issue linked to its Solutions).
+#
+# neighbourhood() returns every post within `depth` hops in one recursive
+# CTE. With GRAPH_INDEX on, reachable() walks an in-memory CSR copy of the
+# edges instead (two int arrays per direction), which makes unbounded
+# multi-hop questions such as "all solutions reachable from this issue"
+# cheap. Link changes committed through the ORM are applied to the index
+# incrementally; writers that bypass the ORM are picked up by the rebuild
+# every GRAPH_INDEX_TTL seconds, which also bounds the staleness seen by
+# other worker processes.
+#
+# Both return post ids and depths and never step onto a private post of
+# another user, so such a post is neither returned nor a way through to
+# its links. A post type filter only selects what is returned: the walk
+# goes through posts of every type.
+#
+# The index is rebuilt by the request that finds it stale, without holding
+# the lock readers take: they keep walking the old arrays meanwhile, and
+# changes committed during the rebuild are replayed onto the new ones.
+
+OUT = "out"
+IN = "in"
+BOTH = "both"
+
+links = post_to_post_association_table
+
+
+def neighbourhood(post_id: int, depth: int, direction: str = BOTH, viewer_id: Optional[int] = None,
+                  post_type_ids: Optional[Set[int]] = None) -> List[Tuple[int, int]]:
+    """
+    [(post_id, hops)] within `depth` hops of `post_id` that `viewer_id` may
+    see, nearest first, optionally only of the given types.
+    """
+    walk = select(
+        literal(post_id).label("id"), literal(0).label("depth"), literal(0).label("post_type_id")
+    ).cte("walk", recursive=True)
+
+    visible = or_(Post.private == False, Post.original_author_id == viewer_id)
+    steps = []
+    if direction in (OUT, BOTH):
+        steps.append(
+            select(links.c.linked_post_id, walk.c.depth + 1, Post.post_type_id)
+            .join(walk, links.c.post_id == walk.c.id)
+            .join(Post, Post.id == links.c.linked_post_id)
+            .where(walk.c.depth < depth)
+            .where(visible)
+        )
+    if direction in (IN, BOTH):
+        steps.append(
+            select(links.c.post_id, walk.c.depth + 1, Post.post_type_id)
+            .join(walk, links.c.linked_post_id == walk.c.id)
+            .join(Post, Post.id == links.c.post_id)
+            .where(walk.c.depth < depth)
+            .where(visible)
+        )
+    # UNION (not UNION ALL) drops repeated (id, depth) rows, so cycles end
+    walk = walk.union(*steps)
+
+    hops = func.min(walk.c.depth).label("hops")
+    query = select(walk.c.id, hops).where(walk.c.id != post_id)
+    if post_type_ids is not None:
+        query = query.where(walk.c.post_type_id.in_(post_type_ids))
+    return [
+        tuple(row) for row in db.session.execute(
+            query.group_by(walk.c.id).order_by(hops, walk.c.id)
+        ).all()
+    ]
+
+
+def _csr(edges: List[Tuple[int, int]], size: int) -> Tuple[array, array]:
+    """Compressed sparse rows: targets of node n are targets[offsets[n]:offsets[n + 1]]."""
+    offsets = array("l", bytes(array("l").itemsize * (size + 1)))
+    for source, _ in edges:
+        offsets[source + 1] += 1
+    for node in range(size):
+        offsets[node + 1] += offsets[node]
+
+    targets = array("l", bytes(array("l").itemsize * len(edges)))
+    cursor = array("l", offsets)
+    for source, target in edges:
+        targets[cursor[source]] = target
+        cursor[source] += 1
+    return offsets, targets
+
+
+# Who may see a post in the index: PUBLIC, the author's id for a private
+# post, or None for a deleted one (nobody)
+PUBLIC = -1
+
+PostInfo = Tuple[int, Optional[int]]
+
+
+def _post_info(post: Post, deleted: bool = False) -> PostInfo:
+    if deleted:
+        return post.post_type_id or 0, None
+    return post.post_type_id or 0, post.original_author_id if post.private else PUBLIC
+
+
+class AdjacencyIndex:
+    """
+    Immutable CSR arrays built from the database plus a small overlay of
+    the link and post changes committed since, rebuilt once the overlay
+    grows past `max_overlay` changes or the arrays are older than `ttl`
+    seconds.
+    """
+
+    def __init__(self, ttl: float, max_overlay: int):
+        self.ttl = ttl
+        self.max_overlay = max_overlay
+        self._built_at = None
+        self._size = 0
+        self._out = self._in = None
+        self._post_types = array("l")
+        self._private: Dict[int, Optional[int]] = {}
+        self._added: Dict[str, Dict[int, Set[int]]] = {OUT: defaultdict(set), IN: defaultdict(set)}
+        self._removed: Set[Tuple[int, int]] = set()
+        self._posts: Dict[int, PostInfo] = {}
+        self._overlay_size = 0
+        # Changes applied while a rebuild reads the database
+        self._journal: Optional[list] = None
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+
+    def _stale(self) -> bool:
+        return (
+            self._built_at is None
+            or time.monotonic() - self._built_at >= self.ttl
+            or self._overlay_size > self.max_overlay
+        )
+
+    def rebuild(self) -> None:
+        with self._lock:
+            self._journal = []
+        try:
+            edges = db.session.execute(select(links.c.post_id, links.c.linked_post_id)).all()
+            posts = db.session.execute(
+                select(Post.id, Post.post_type_id, Post.private, Post.original_author_id)
+            ).all()
+            size = max([row.id for row in posts], default=0) + 1
+
+            types = array("l", bytes(array("l").itemsize * size))
+            for row in posts:
+                types[row.id] = row.post_type_id or 0
+            private = {row.id: row.original_author_id for row in posts if row.private}
+
+            edges = [(source, target) for source, target in edges if source < size and target < size]
+            out_index = _csr(edges, size)
+            in_index = _csr([(target, source) for source, target in edges], size)
+        except Exception:
+            with self._lock:
+                self._journal = None
+            raise
+
+        with self._lock:
+            self._size = size
+            self._out, self._in = out_index, in_index
+            self._post_types = types
+            self._private = private
+            self._added = {OUT: defaultdict(set), IN: defaultdict(set)}
+            self._removed = set()
+            self._posts = {}
+            self._overlay_size = 0
+            self._built_at = time.monotonic()
+            # The read may have missed them; replaying a change is harmless
+            journal, self._journal = self._journal, None
+            for changes in journal:
+                self._apply(*changes)
+
+    def ensure_fresh(self) -> None:
+        if not self._stale():
+            return
+        # One caller rebuilds; the others keep walking the current arrays,
+        # unless there are none yet
+        if self._build_lock.acquire(blocking=self._out is None):
+            try:
+                if self._stale():
+                    self.rebuild()
+            finally:
+                self._build_lock.release()
+
+    def apply(self, added: Iterable[Tuple[int, int]], removed: Iterable[Tuple[int, int]],
+              posts: Dict[int, PostInfo]) -> None:
+        """Record committed link and post changes without a rebuild."""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((added, removed, posts))
+            self._apply(added, removed, posts)
+
+    def _apply(self, added, removed, posts) -> None:
+        for source, target in removed:
+            self._added[OUT][source].discard(target)
+            self._added[IN][target].discard(source)
+            self._removed.add((source, target))
+            self._overlay_size += 1
+        for source, target in added:
+            self._removed.discard((source, target))
+            self._added[OUT][source].add(target)
+            self._added[IN][target].add(source)
+            self._overlay_size += 1
+        self._posts.update(posts)
+        self._overlay_size += len(posts)
+
+    def post_type(self, post_id: int) -> int:
+        if post_id in self._posts:
+            return self._posts[post_id][0]
+        return self._post_types[post_id] if post_id < self._size else 0
+
+    def visible(self, post_id: int, viewer_id: Optional[int]) -> bool:
+        if post_id in self._posts:
+            owner = self._posts[post_id][1]
+        else:
+            owner = self._private.get(post_id, PUBLIC)
+        return owner == PUBLIC or (owner is not None and owner == viewer_id)
+
+    def _neighbours(self, node: int, direction: str) -> Iterable[int]:
+        offsets, targets = self._out if direction == OUT else self._in
+        if node < self._size:
+            for position in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[position]
+                edge = (node, neighbour) if direction == OUT else (neighbour, node)
+                if edge not in self._removed:
+                    yield neighbour
+        yield from self._added[direction].get(node, ())
+
+    def reachable(self, post_id: int, max_depth: Optional[int] = None, direction: str = BOTH,
+                  post_type_ids: Optional[Set[int]] = None,
+                  viewer_id: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Breadth-first [(post_id, hops)] over the posts `viewer_id` may see,
+        optionally only of the given types.
+        """
+        self.ensure_fresh()
+        directions = (OUT, IN) if direction == BOTH else (direction,)
+        with self._lock:
+            seen = {post_id: 0}
+            queue = deque([post_id])
+            while queue:
+                node = queue.popleft()
+                hops = seen[node]
+                if max_depth is not None and hops >= max_depth:
+                    continue
+                for way in directions:
+                    for neighbour in self._neighbours(node, way):
+                        if neighbour not in seen and self.visible(neighbour, viewer_id):
+                            seen[neighbour] = hops + 1
+                            queue.append(neighbour)
+
+            return [
+                (node, hops) for node, hops in seen.items()
+                if node != post_id
+                and (post_type_ids is None or self.post_type(node) in post_type_ids)
+            ]
+
+
+def reachable(post_id: int, max_depth: Optional[int], direction: str,
+              post_type_ids: Optional[Set[int]], viewer_id: Optional[int]) -> List[Tuple[int, int]]:
+    index = current_app.extensions.get("graph_index")
+    if index is not None:
+        return index.reachable(post_id, max_depth, direction, post_type_ids, viewer_id)
+
+    depth = min(max_depth or current_app.config["GRAPH_MAX_DEPTH"], current_app.config["GRAPH_MAX_DEPTH"])
+    return neighbourhood(post_id, depth, direction, viewer_id, post_type_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_link_changes(session, flush_context):
+    added, removed, posts = set(), set(), {}
+    for post in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(post, Post):
+            continue
+        if post in session.dirty and not session.is_modified(post):
+            continue
+        state = inspect(post)
+        for key, outgoing in (("linked_posts", True), ("linked_to", False)):
+            history = state.attrs[key].history
+            for other in history.added:
+                added.add((post.id, other.id) if outgoing else (other.id, post.id))
+                posts.setdefault(other.id, _post_info(other))
+            for other in history.deleted:
+                removed.add((post.id, other.id) if outgoing else (other.id, post.id))
+        # Type and privacy; edges of a deleted post linger until the next
+        # rebuild, but nobody can walk onto it any more
+        posts[post.id] = _post_info(post, deleted=post in session.deleted)
+
+    if added or removed or posts:
+        changes = session.info.setdefault("graph_changes", ([], [], {}))
+        changes[0].extend(added)
+        changes[1].extend(removed)
+        changes[2].update(posts)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_link_changes(session):
+    changes = session.info.pop("graph_changes", None)
+    if changes and has_app_context():
+        index = current_app.extensions.get("graph_index")
+        if index is not None:
+            index.apply(*changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_link_changes(session):
+    session.info.pop("graph_changes", None)
+
+
+graph_bp = Blueprint("graph", __name__, url_prefix="/graph")
+
+
+def _visible_post(alternative_id: str) -> Post:
+    post = db.session.execute(
+        select(Post).filter_by(alternative_id=alternative_id)
+    ).scalar_one_or_none()
+    if post is None or (post.private and post.original_author_id != current_user.id):
+        abort(404)
+    return post
+
+
+def _post_type_ids() -> Optional[Set[int]]:
+    names = request.args.getlist("post_type")
+    if not names:
+        return None
+    reference = reference_data()
+    return {
+        entry["id"] for entry in map(reference.post_type_by_name, names) if entry is not None
+    }
+
+
+def _direction() -> str:
+    direction = request.args.get("direction", BOTH)
+    return direction if direction in (OUT, IN, BOTH) else BOTH
+
+
+def _response(start: Post, found: List[Tuple[int, int]]):
+    limit = current_app.config["GRAPH_MAX_RESULTS"]
+    hops = dict(found[:limit])
+    posts = db.session.execute(
+        select(Post)
+        .where(Post.id.in_(list(hops)))
+        .where((Post.private == False) | (Post.original_author_id == current_user.id))
+        .options(joinedload(Post.post_type))
+    ).scalars().all()
+    posts.sort(key=lambda post: (hops[post.id], post.id))
+
+    return jsonify({
+        "post": start.alternative_id,
+        "truncated": len(found) > limit,
+        "posts": [
+            {
+                "alternative_id": post.alternative_id,
+                "title": post.title,
+                "post_type": post.post_type.name if post.post_type else None,
+                "hops": hops[post.id]
+            }
+            for post in posts
+        ]
+    })
+
+
+@graph_bp.get("/posts/<string:post_id>/neighbourhood")
+@login_required
+@reads_from_replica
+def Neighbourhood(post_id: str):
+    start = _visible_post(post_id)
+    depth = request.args.get("depth", "1")
+    depth = max(1, min(int(depth) if depth.isdigit() else 1, current_app.config["GRAPH_MAX_DEPTH"]))
+
+    found = neighbourhood(start.id, depth, _direction(), current_user.id, _post_type_ids())
+    return _response(start, found)
+
+
+@graph_bp.get("/posts/<string:post_id>/reachable")
+@login_required
+@reads_from_replica
+def Reachable(post_id: str):
+    start = _visible_post(post_id)
+    depth = request.args.get("depth", "")
+    found = reachable(
+        start.id, int(depth) if depth.isdigit() else None, _direction(), _post_type_ids(),
+        current_user.id
+    )
+    found.sort(key=lambda item: (item[1], item[0]))
+    return _response(start, found)
+
+
+def init_app(app) -> None:
+    app.register_blueprint(graph_bp)
+    if app.config["GRAPH_INDEX"]:
+        app.extensions["graph_index"] = AdjacencyIndex(
+            app.config["GRAPH_INDEX_TTL"], app.config["GRAPH_INDEX_MAX_OVERLAY"]
+        )
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from flaskr.database import db, User
+
+
+# Bounded TTL/LRU cache in front of login_manager.user_loader.
+#
+# Entries are detached copies of the polymorphic User row (column values
+# only), keyed by alternative_id. A hit is attached to the request's
+# session with merge(load=False), which emits no SQL; relationships such as
+# current_user.requests still lazy-load through that session as before.
+#
+# Commits that change or delete a User (profile, password, role subtype
+# columns) evict that user. Anything writing users outside the ORM must call
+# invalidate(); other worker processes converge within USER_CACHE_TTL.
+
+
+class IdentityCache:
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, alternative_id: str):
+        with self._lock:
+            entry = self._entries.get(alternative_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[alternative_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(alternative_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, alternative_id: str, user) -> None:
+        with self._lock:
+            self._entries[alternative_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(alternative_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, alternative_id: str) -> None:
+        with self._lock:
+            self._entries.pop(alternative_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+def _detached_copy(user: User):
+    mapper = inspect(user).mapper
+    copy = mapper.class_manager.new_instance()
+    for attr in mapper.column_attrs:
+        set_committed_value(copy, attr.key, getattr(user, attr.key))
+    make_transient_to_detached(copy)
+    return copy
+
+
+def load_user(alternative_id: str) -> Optional[User]:
+    cache: IdentityCache = current_app.extensions.get("identity_cache")
+
+    if cache is not None:
+        cached = cache.get(alternative_id)
+        if cached is not None:
+            return db.session.merge(cached, load=False)
+
+    user = db.session.execute(
+        db.select(User).filter_by(alternative_id=alternative_id)
+    ).scalars().first()
+
+    if cache is not None and user is not None:
+        cache.put(alternative_id, _detached_copy(user))
+    return user
+
+
+def invalidate(alternative_id: str) -> None:
+    cache = current_app.extensions.get("identity_cache")
+    if cache is not None:
+        cache.invalidate(alternative_id)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_user_changes(session, flush_context, instances):
+    changed = session.info.setdefault("changed_users", set())
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, User) and (
+            obj in session.deleted
+            or session.is_modified(obj, include_collections=False)
+        ):
+            changed.add(obj.previous("alternative_id"))
+            changed.add(obj.alternative_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_changed_users(session):
+    changed = session.info.pop("changed_users", None)
+    if changed and has_app_context():
+        for alternative_id in changed:
+            invalidate(alternative_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_user_changes(session):
+    session.info.pop("changed_users", None)
+
+
+def init_app(app) -> None:
+    if app.config["USER_CACHE_SIZE"] > 0:
+        app.extensions["identity_cache"] = IdentityCache(
+            app.config["USER_CACHE_SIZE"],
+            app.config["USER_CACHE_TTL"]
+        )
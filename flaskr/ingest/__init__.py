@@ -0,0 +1,364 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import click
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask.cli import AppGroup
+from flask_login import current_user, login_required
+from sqlalchemy import and_, delete, exists, insert, or_, select
+from sqlalchemy.orm import aliased
+from flaskr import rendering, statistics
+from flaskr.database import (
+    db,
+    ImportedPost,
+    Post,
+    PostDiscussion,
+    User,
+    import_pending_link_table,
+    post_category_association_table,
+    post_to_post_association_table
+)
+from flaskr.reference import reference_data
+
+
+# Bulk import of posts from NDJSON, one JSON object per line:
+#
+#   {"external_id": "8812", "title": "...", "body": "...", "post_type": 4,
+#    "categories": [1, 7], "author": "<user alternative_id>", "private": false,
+#    "created_at": "2024-05-01T10:00:00", "links": ["8790", "8801"]}
+#
+# Only external_id, title, body, post_type and categories are required;
+# author defaults to the importing user. Lines are validated and written
+# INGEST_CHUNK_SIZE at a time: the posts, their discussions, category
+# links, links between posts and the (source, external_id) -> post mapping
+# of a chunk are one transaction of a few executemany statements. Invalid
+# lines are rejected with their errors and the rest of the chunk goes on.
+#
+# external_id is unique per source, so feeding a file again skips what is
+# already imported: after a crash the CLI restarts from its checkpoint (the
+# byte offset after the last committed chunk) and at worst redoes nothing.
+# Links may point forward in the file; they wait in import_pending_link_table
+# until their target arrives.
+#
+# The rows bypass the ORM events: bodies are rendered while parsing, per-user
+# statistics get one upsert per author in each chunk's transaction, insight
+# jobs come from `flask insights enqueue` and the related-posts index from
+# `flask related build`.
+
+TITLE_MIN = 10
+TITLE_MAX = 100
+BODY_MIN = 50
+EXTERNAL_ID_MAX = 100
+
+Line = Tuple[int, str]
+RejectHandler = Callable[[dict], None]
+
+
+def _reject(line_number: int, text: str, errors: List[str]) -> dict:
+    return {"line": line_number, "errors": errors, "record": text}
+
+
+def _parse(line_number: int, text: str, reference) -> Tuple[Optional[dict], List[str]]:
+    """The post row a line describes, or None and why it is invalid."""
+    try:
+        record = json.loads(text)
+    except ValueError as error:
+        return None, [f"invalid JSON: {error}"]
+    if not isinstance(record, dict):
+        return None, ["not a JSON object"]
+
+    errors = []
+    external_id = record.get("external_id")
+    if isinstance(external_id, int):
+        external_id = str(external_id)
+    if not isinstance(external_id, str) or not external_id or len(external_id) > EXTERNAL_ID_MAX:
+        errors.append(f"external_id must be a string of 1 to {EXTERNAL_ID_MAX} characters")
+
+    title, body = record.get("title"), record.get("body")
+    if not isinstance(title, str) or not TITLE_MIN <= len(title) <= TITLE_MAX:
+        errors.append(f"title must be {TITLE_MIN} to {TITLE_MAX} characters")
+    if not isinstance(body, str) or len(body) < BODY_MIN:
+        errors.append(f"body must be at least {BODY_MIN} characters")
+
+    post_type = reference.post_type(record.get("post_type"))
+    if post_type is None:
+        errors.append("unknown post_type")
+
+    categories = record.get("categories")
+    category_ids = reference.category_ids(categories) if isinstance(categories, list) else None
+    if not category_ids:
+        errors.append("categories must list at least one known category id")
+
+    private = record.get("private", False)
+    if not isinstance(private, bool):
+        errors.append("private must be true or false")
+
+    created_at = None
+    if record.get("created_at") is not None:
+        try:
+            created_at = datetime.fromisoformat(record["created_at"])
+        except (TypeError, ValueError):
+            errors.append("created_at must be an ISO 8601 time")
+
+    links = record.get("links", [])
+    if not isinstance(links, list) or not all(isinstance(link, (str, int)) for link in links):
+        errors.append("links must be a list of external ids")
+        links = []
+
+    author = record.get("author")
+    if author is not None and not isinstance(author, str):
+        errors.append("author must be a user's alternative_id")
+
+    if errors:
+        return None, errors
+    return {
+        "line": line_number,
+        "text": text,
+        "external_id": external_id,
+        "author": author,
+        "category_ids": category_ids,
+        "links": {str(link) for link in links} - {external_id},
+        "post": {
+            "title": title,
+            "body": body,
+            "preview": Post.make_preview(body),
+            "body_html": rendering.render(body),
+            "body_html_version": rendering.RENDERER_VERSION,
+            "post_type_id": post_type["id"],
+            "private": private,
+            "created_at": created_at or datetime.now(timezone.utc)
+        }
+    }, []
+
+
+def _write_chunk(lines: List[Line], source: str, author_id: int, on_reject: RejectHandler) -> Dict[str, int]:
+    """Validate and import one chunk in one transaction."""
+    reference = reference_data()
+    records, seen, rejected = [], set(), 0
+    for line_number, text in lines:
+        record, errors = _parse(line_number, text, reference)
+        if record is not None and record["external_id"] in seen:
+            record, errors = None, ["duplicate external_id in the same chunk"]
+        if record is None:
+            on_reject(_reject(line_number, text, errors))
+            rejected += 1
+            continue
+        seen.add(record["external_id"])
+        records.append(record)
+
+    # Already imported (a resumed or repeated file)
+    imported = set(db.session.execute(
+        select(ImportedPost.external_id)
+        .where(ImportedPost.source == source)
+        .where(ImportedPost.external_id.in_([record["external_id"] for record in records]))
+    ).scalars())
+    skipped = sum(1 for record in records if record["external_id"] in imported)
+    records = [record for record in records if record["external_id"] not in imported]
+
+    authors = {record["author"] for record in records if record["author"]}
+    author_ids = dict(db.session.execute(
+        select(User.alternative_id, User.id).where(User.alternative_id.in_(authors))
+    ).all()) if authors else {}
+    valid = []
+    for record in records:
+        if record["author"] and record["author"] not in author_ids:
+            on_reject(_reject(record["line"], record["text"], ["unknown author"]))
+            rejected += 1
+            continue
+        record["post"]["original_author_id"] = author_ids.get(record["author"], author_id)
+        valid.append(record)
+
+    if valid:
+        post_ids = Post.insert_rows([record["post"] for record in valid], commit=False)
+        statistics.count_inserted_posts(record["post"] for record in valid)
+        PostDiscussion.insert_rows([{"post_id": post_id} for post_id in post_ids], commit=False)
+        db.session.execute(insert(post_category_association_table), [
+            {"post_id": post_id, "post_category_id": category_id}
+            for post_id, record in zip(post_ids, valid)
+            for category_id in record["category_ids"]
+        ])
+        db.session.execute(insert(ImportedPost.__table__), [
+            {"source": source, "external_id": record["external_id"], "post_id": post_id}
+            for post_id, record in zip(post_ids, valid)
+        ])
+        pending = [
+            {"source": source, "external_id": record["external_id"], "linked_external_id": link}
+            for record in valid for link in sorted(record["links"])
+        ]
+        if pending:
+            db.session.execute(insert(import_pending_link_table), pending)
+        _resolve_links(source, [record["external_id"] for record in valid])
+    db.session.commit()
+
+    return {"imported": len(valid), "skipped": skipped, "rejected": rejected}
+
+
+def _resolve_links(source: str, external_ids: List[str]) -> None:
+    """
+    Turn the pending links whose both ends are imported into post links.
+    Only links from or to the posts just imported can have become whole.
+    """
+    pending = import_pending_link_table
+    touching = and_(
+        pending.c.source == source,
+        or_(pending.c.external_id.in_(external_ids), pending.c.linked_external_id.in_(external_ids))
+    )
+    origin, target = aliased(ImportedPost), aliased(ImportedPost)
+    db.session.execute(
+        insert(post_to_post_association_table).from_select(
+            ["post_id", "linked_post_id"],
+            select(origin.post_id, target.post_id)
+            .select_from(pending)
+            .join(origin, and_(origin.source == pending.c.source, origin.external_id == pending.c.external_id))
+            .join(target, and_(target.source == pending.c.source, target.external_id == pending.c.linked_external_id))
+            .where(touching)
+        )
+    )
+    db.session.execute(
+        delete(pending)
+        .where(touching)
+        .where(exists().where(
+            ImportedPost.source == pending.c.source,
+            ImportedPost.external_id == pending.c.linked_external_id
+        ))
+    )
+
+
+def _chunks(lines: Iterable[Line], size: int) -> Iterator[List[Line]]:
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest(lines: Iterable[Line], source: str, author_id: int, chunk_size: int,
+           on_reject: RejectHandler, on_chunk: Optional[Callable[[int, dict], None]] = None) -> dict:
+    """
+    Import (line number, text) pairs. Calls on_chunk(last line number,
+    totals) after every committed chunk; returns the totals.
+    """
+    totals = {"imported": 0, "skipped": 0, "rejected": 0, "seconds": 0.0}
+    started = time.perf_counter()
+    for chunk in _chunks(((number, text) for number, text in lines if text.strip()), chunk_size):
+        for key, value in _write_chunk(chunk, source, author_id, on_reject).items():
+            totals[key] += value
+        totals["seconds"] = time.perf_counter() - started
+        if on_chunk:
+            on_chunk(chunk[-1][0], totals)
+    totals["seconds"] = time.perf_counter() - started
+    return totals
+
+
+def _decoded(raw_lines: Iterable[bytes], first_line: int = 1) -> Iterator[Line]:
+    for number, raw in enumerate(raw_lines, first_line):
+        yield number, raw.decode("utf-8", errors="replace")
+
+
+ingest_bp = Blueprint("ingest", __name__, url_prefix="/import")
+
+
+@ingest_bp.post("/posts")
+@login_required
+def ImportPosts():
+    if current_user.type != "representative":
+        abort(403)
+    source = request.args.get("source", "")
+    if not source or len(source) > 50:
+        abort(400)
+
+    limit = current_app.config["INGEST_MAX_REJECTS_SHOWN"]
+    rejects = []
+    checkpoint = {"line": 0}
+
+    def keep(reject):
+        if len(rejects) < limit:
+            rejects.append(reject)
+
+    def committed(line_number, totals):
+        checkpoint["line"] = line_number
+
+    # The body is read line by line, never held in memory as a whole
+    totals = ingest(
+        _decoded(request.stream), source, current_user.id,
+        current_app.config["INGEST_CHUNK_SIZE"], keep, committed
+    )
+    return jsonify({
+        **totals,
+        # Lines up to here are committed; sending the file again is safe
+        "checkpoint": checkpoint["line"],
+        "rejects": rejects,
+        "rejects_truncated": totals["rejected"] > len(rejects)
+    })
+
+
+ingest_cli = AppGroup("ingest", help="Bulk import content.")
+
+
+def _read_checkpoint(path: str) -> dict:
+    try:
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except FileNotFoundError:
+        return {"offset": 0, "line": 0}
+
+
+def _write_checkpoint(path: str, checkpoint: dict) -> None:
+    with open(f"{path}.tmp", "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(f"{path}.tmp", path)
+
+
+@ingest_cli.command("posts")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--source", required=True, help="Namespace of the file's external ids, e.g. the forum name.")
+@click.option("--author", "username", required=True, help="Username credited with posts that name no author.")
+@click.option("--chunk-size", type=int, help="Defaults to INGEST_CHUNK_SIZE.")
+@click.option("--rejects", "rejects_path", type=click.Path(dir_okay=False), help="Defaults to PATH.rejects.ndjson.")
+@click.option("--restart", is_flag=True, help="Ignore the checkpoint and read the file from the top.")
+def posts_command(path, source, username, chunk_size, rejects_path, restart):
+    """Import posts from the NDJSON file PATH, resuming from its checkpoint."""
+    author_id = db.session.execute(select(User.id).filter_by(username=username)).scalar()
+    if author_id is None:
+        raise click.BadParameter(f"no user named {username}", param_hint="--author")
+
+    checkpoint_path = f"{path}.checkpoint"
+    checkpoint = {"offset": 0, "line": 0} if restart else _read_checkpoint(checkpoint_path)
+    if checkpoint["line"]:
+        click.echo(f"Resuming after line {checkpoint['line']}.")
+
+    with open(path, "rb") as source_file, \
+            open(rejects_path or f"{path}.rejects.ndjson", "a" if checkpoint["line"] else "w") as rejects_file:
+        source_file.seek(checkpoint["offset"])
+
+        def reject(entry):
+            rejects_file.write(json.dumps(entry) + "\n")
+
+        def committed(line_number, totals):
+            rejects_file.flush()
+            _write_checkpoint(checkpoint_path, {"offset": source_file.tell(), "line": line_number})
+            click.echo(
+                f"line {line_number}: {totals['imported']} imported, {totals['skipped']} skipped, "
+                f"{totals['rejected']} rejected ({totals['imported'] / totals['seconds']:.0f} posts/s)"
+            )
+
+        totals = ingest(
+            _decoded(iter(source_file.readline, b""), checkpoint["line"] + 1),
+            source, author_id, chunk_size or current_app.config["INGEST_CHUNK_SIZE"],
+            reject, committed
+        )
+
+    click.echo(
+        f"Done: {totals['imported']} imported, {totals['skipped']} skipped, "
+        f"{totals['rejected']} rejected in {totals['seconds']:.1f}s."
+    )
+
+
+def init_app(app) -> None:
+    app.register_blueprint(ingest_bp)
+    app.cli.add_command(ingest_cli)
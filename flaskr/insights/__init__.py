@@ -0,0 +1,344 @@
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import repeat
+from multiprocessing import get_context
+from typing import List, Optional, Tuple
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import DateTime, bindparam, event, exists, func, literal, select, update
+from sqlalchemy.dialects.sqlite import insert
+from werkzeug.utils import import_string
+from flaskr.database import db, Insight, InsightJob, Post, Representative, UserRequest
+
+
+# Insight generation pipeline.
+#
+# insight_job_table is a durable queue with one job per post. A post gets
+# its job in the same transaction that sets confirmed_for_insights (mapper
+# events); `flask insights enqueue` sweeps up posts written in bulk.
+#
+# `flask insights run` is the worker. It claims INSIGHT_BATCH_SIZE jobs at
+# a time by leasing them for INSIGHT_LEASE_SECONDS, summarises them on a
+# thread or process pool and commits the Insights together with the job
+# status. Every batch is a checkpoint: a restarted worker only sees the
+# jobs still pending, plus the ones whose lease ran out in a crash. Jobs
+# failing INSIGHT_MAX_ATTEMPTS times are marked failed.
+#
+# A worker slower than its lease may find its jobs claimed again by
+# another one. The checkpoint only writes the jobs still running under the
+# lease this worker took (matched on lease_until), and a post has at most
+# one Insight (unique source_post_id), so a late worker writes nothing.
+#
+# INSIGHT_SUMMARIZER is the import path of a `(title, body) -> str`
+# callable. The default, extractive_summary, is local and deterministic.
+# Nothing here runs on the request path.
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"[a-z']{4,}")
+
+
+def extractive_summary(title: str, body: str, sentences: int = 2, keywords: int = 5) -> str:
+    """Leading sentences of the body and its most frequent longer words."""
+    lead = " ".join(_SENTENCE.split(body.strip())[:sentences])
+    counts = Counter(_WORD.findall(f"{title} {body}".lower()))
+    terms = sorted(counts, key=lambda word: (-counts[word], word))[:keywords]
+    return f"{lead}\n\nKey terms: {', '.join(terms)}" if terms else lead
+
+
+@lru_cache(maxsize=None)
+def _backend(path: str):
+    return import_string(path)
+
+
+def _summarize(path: str, title: str, body: str):
+    # Runs in the pool; exceptions are returned, not raised, so one bad
+    # post does not fail its whole batch
+    try:
+        return _backend(path)(title, body)
+    except Exception as error:
+        return error
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _enqueue(connection, post_id: int) -> None:
+    connection.execute(
+        insert(InsightJob.__table__)
+        .values(post_id=post_id, created_at=_now(), updated_at=_now())
+        .on_conflict_do_nothing(index_elements=["post_id"])
+    )
+
+
+@event.listens_for(Post, "after_insert")
+def _post_inserted(mapper, connection, post):
+    if post.confirmed_for_insights:
+        _enqueue(connection, post.id)
+
+
+@event.listens_for(Post, "after_update")
+def _post_updated(mapper, connection, post):
+    if post.confirmed_for_insights and not post.previous("confirmed_for_insights"):
+        _enqueue(connection, post.id)
+
+
+def enqueue_confirmed() -> int:
+    """Create the missing jobs for confirmed posts; returns how many."""
+    table = InsightJob.__table__
+    now = _now()
+    result = db.session.execute(
+        insert(table).from_select(
+            ["post_id", "created_at", "updated_at"],
+            select(Post.id, literal(now, DateTime()), literal(now, DateTime()))
+            .where(Post.confirmed_for_insights == True)
+            .where(~exists().where(table.c.post_id == Post.id))
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def claim_batch(size: int, lease_seconds: int) -> Tuple[List[int], datetime]:
+    """Lease up to `size` runnable jobs; returns their ids and the lease."""
+    table = InsightJob.__table__
+    now = _now()
+    lease_until = now + timedelta(seconds=lease_seconds)
+    runnable = (
+        select(table.c.id)
+        .where(
+            (table.c.status == PENDING)
+            | ((table.c.status == RUNNING) & (table.c.lease_until < now))
+        )
+        .order_by(table.c.id)
+        .limit(size)
+    )
+    job_ids = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(runnable.scalar_subquery()))
+        .values(
+            status=RUNNING,
+            attempts=table.c.attempts + 1,
+            lease_until=lease_until,
+            updated_at=now
+        )
+        .returning(table.c.id)
+    ).scalars().all()
+    db.session.commit()
+    return job_ids, lease_until
+
+
+def _default_representative() -> Optional[int]:
+    configured = current_app.config["INSIGHT_REPRESENTATIVE_ID"]
+    if configured is not None:
+        return configured
+    return db.session.execute(select(func.min(Representative.id))).scalar()
+
+
+def _still_leased(job_ids: List[int], lease_until: datetime) -> set:
+    # Also takes the write lock, so no other worker can claim these jobs
+    # again before the checkpoint commits
+    table = InsightJob.__table__
+    return set(db.session.execute(
+        update(table)
+        .where(table.c.id.in_(job_ids))
+        .where(table.c.status == RUNNING)
+        .where(table.c.lease_until == lease_until)
+        .values(updated_at=_now())
+        .returning(table.c.id)
+    ).scalars())
+
+
+def process_batch(job_ids: List[int], lease_until: datetime, executor, backend: str,
+                  max_attempts: int) -> dict:
+    """
+    Summarise the jobs claimed with `lease_until` and commit their Insights
+    and statuses; jobs claimed again by another worker meanwhile are skipped.
+    """
+    rows = db.session.execute(
+        select(
+            InsightJob.id, InsightJob.attempts, Post.id.label("post_id"), Post.title, Post.body,
+            UserRequest.receiving_representative_id
+        )
+        .join(Post, Post.id == InsightJob.post_id)
+        .outerjoin(UserRequest, UserRequest.id == Post.outgoing_requet_id)
+        .where(InsightJob.id.in_(job_ids))
+        .order_by(InsightJob.id)
+    ).all()
+
+    summaries = executor.map(
+        _summarize, repeat(backend), [row.title for row in rows], [row.body for row in rows]
+    )
+
+    fallback_representative = _default_representative()
+    insights, done, retry = [], [], []
+    for row, summary in zip(rows, summaries):
+        representative_id = row.receiving_representative_id or fallback_representative
+        if representative_id is None:
+            summary = LookupError("No representative to attribute the insight to.")
+        if isinstance(summary, Exception):
+            retry.append({
+                "job_id": row.id,
+                "status": FAILED if row.attempts >= max_attempts else PENDING,
+                "error": repr(summary)
+            })
+            continue
+        insights.append({
+            "ai_tuned_text": summary,
+            "source_post_id": row.post_id,
+            "inserting_representative_id": representative_id
+        })
+        done.append({"job_id": row.id, "status": DONE, "error": None})
+
+    # Insights and job statuses commit together: the batch checkpoint
+    owned = _still_leased(job_ids, lease_until)
+    insights = [insight for insight, job in zip(insights, done) if job["job_id"] in owned]
+    done = [job for job in done if job["job_id"] in owned]
+    retry = [job for job in retry if job["job_id"] in owned]
+    Insight.upsert_rows(insights, ["source_post_id"], commit=False)
+    table = InsightJob.__table__
+    if done or retry:
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam("job_id"))
+            .values(
+                status=bindparam("status"),
+                error=bindparam("error"),
+                lease_until=None,
+                updated_at=_now()
+            ),
+            done + retry
+        )
+    db.session.commit()
+
+    return {
+        "done": len(done),
+        "retried": sum(1 for job in retry if job["status"] == PENDING),
+        "failed": sum(1 for job in retry if job["status"] == FAILED),
+        "lost": len(job_ids) - len(owned)
+    }
+
+
+def make_executor(kind: str, workers: int):
+    if kind == "process":
+        # Spawned for the reason given in flaskr.passwords: the CLI worker
+        # may run inside a process that already has threads
+        return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="insights")
+
+
+def run(batch_size: int, workers: int, pool: str, max_batches: Optional[int] = None,
+        on_batch=None) -> dict:
+    """
+    Work the queue until it is empty (or `max_batches` ran). Calls
+    on_batch(totals) after every batch; returns the totals.
+    """
+    config = current_app.config
+    totals = {"batches": 0, "done": 0, "retried": 0, "failed": 0, "lost": 0, "seconds": 0.0}
+    started = time.perf_counter()
+
+    with make_executor(pool, workers) as executor:
+        while max_batches is None or totals["batches"] < max_batches:
+            job_ids, lease_until = claim_batch(batch_size, config["INSIGHT_LEASE_SECONDS"])
+            if not job_ids:
+                break
+            result = process_batch(
+                job_ids, lease_until, executor,
+                config["INSIGHT_SUMMARIZER"], config["INSIGHT_MAX_ATTEMPTS"]
+            )
+            totals["batches"] += 1
+            for key in ("done", "retried", "failed", "lost"):
+                totals[key] += result[key]
+            totals["seconds"] = time.perf_counter() - started
+            if on_batch:
+                on_batch(totals)
+
+    totals["seconds"] = time.perf_counter() - started
+    return totals
+
+
+def backlog() -> dict:
+    """Job counts per status, the oldest pending job and the last hour's output."""
+    counts = dict(db.session.execute(
+        select(InsightJob.status, func.count()).group_by(InsightJob.status)
+    ).all())
+    oldest = db.session.execute(
+        select(func.min(InsightJob.created_at)).where(InsightJob.status == PENDING)
+    ).scalar()
+    last_hour = db.session.execute(
+        select(func.count())
+        .where(InsightJob.status == DONE)
+        .where(InsightJob.updated_at >= _now() - timedelta(hours=1))
+    ).scalar()
+    return {
+        **{status: counts.get(status, 0) for status in (PENDING, RUNNING, DONE, FAILED)},
+        "oldest_pending": oldest,
+        "done_last_hour": last_hour
+    }
+
+
+insights_cli = AppGroup("insights", help="Generate Insights for confirmed posts.")
+
+
+@insights_cli.command("enqueue")
+def enqueue_command():
+    """Create jobs for confirmed posts that have none."""
+    click.echo(f"{enqueue_confirmed()} jobs enqueued.")
+
+
+@insights_cli.command("run")
+@click.option("--batch-size", type=int, help="Jobs per batch. Defaults to INSIGHT_BATCH_SIZE.")
+@click.option("--workers", type=int, help="Pool size. Defaults to INSIGHT_WORKERS.")
+@click.option("--pool", type=click.Choice(["thread", "process"]), help="Defaults to INSIGHT_POOL.")
+@click.option("--max-batches", type=int, help="Stop after this many batches.")
+@click.option("--follow", is_flag=True, help="Keep polling for new jobs instead of exiting.")
+def run_command(batch_size, workers, pool, max_batches, follow):
+    """Work the queue; safe to interrupt and restart."""
+    config = current_app.config
+    batch_size = batch_size or config["INSIGHT_BATCH_SIZE"]
+    workers = workers or config["INSIGHT_WORKERS"]
+    pool = pool or config["INSIGHT_POOL"]
+
+    def report(totals):
+        rate = totals["done"] / totals["seconds"] if totals["seconds"] else 0
+        click.echo(
+            f"batch {totals['batches']}: {totals['done']} done, {totals['retried']} retried, "
+            f"{totals['failed']} failed, {totals['lost']} lost to other workers ({rate:.1f} jobs/s)"
+        )
+
+    while True:
+        enqueue_confirmed()
+        totals = run(batch_size, workers, pool, max_batches, report)
+        if not follow:
+            break
+        if not totals["batches"]:
+            time.sleep(config["INSIGHT_POLL_INTERVAL"])
+
+    status = backlog()
+    click.echo(
+        f"Backlog: {status[PENDING]} pending, {status[RUNNING]} running, "
+        f"{status[DONE]} done, {status[FAILED]} failed."
+    )
+
+
+@insights_cli.command("status")
+def status_command():
+    """Show the queue backlog and recent throughput."""
+    status = backlog()
+    for key, value in status.items():
+        click.echo(f"{key}: {value}")
+
+
+def init_app(app) -> None:
+    app.cli.add_command(insights_cli)
@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import Counter, deque
+from flask import Blueprint, current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from flaskr.database import db
+
+
+# Opt-in per-request SQL instrumentation (SQL_INSTRUMENTATION=True).
+#
+# When disabled nothing is registered at all: no engine listeners, no
+# request hooks and no report route, so the cost is zero.
+#
+# When enabled every statement run during a Flask request is timed and
+# counted. Statements are grouped by their SQL text, which SQLAlchemy
+# renders with bound-parameter placeholders, so the same text executed
+# many times within one request is the N+1 pattern (one query per row of
+# an earlier result).
+
+instrumentation_bp = Blueprint("instrumentation", __name__, url_prefix="/_debug")
+
+
+class RequestStats:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.statements: Counter = Counter()
+        self.slowest: list = []
+
+    def record(self, statement: str, duration: float, keep: int):
+        self.count += 1
+        self.total += duration
+        self.statements[statement] += 1
+
+        self.slowest.append((duration, statement))
+        if len(self.slowest) > keep:
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[keep:]
+
+    def repeated(self, threshold: int):
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+class SQLReport:
+    """Rolling in-process window of the last N instrumented requests."""
+
+    def __init__(self, size: int):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=size)
+
+    def add(self, entry: dict):
+        with self._lock:
+            self._entries.append(entry)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            entries = list(self._entries)
+
+        endpoints = {}
+        for entry in entries:
+            summary = endpoints.setdefault(entry["endpoint"], {
+                "requests": 0,
+                "statements": 0,
+                "db_ms": 0.0,
+                "max_statements": 0,
+                "n_plus_one_requests": 0
+            })
+            summary["requests"] += 1
+            summary["statements"] += entry["statements"]
+            summary["db_ms"] += entry["db_ms"]
+            summary["max_statements"] = max(summary["max_statements"], entry["statements"])
+            if entry["repeated"]:
+                summary["n_plus_one_requests"] += 1
+
+        for summary in endpoints.values():
+            summary["avg_statements"] = summary["statements"] / summary["requests"]
+            summary["avg_db_ms"] = round(summary["db_ms"] / summary["requests"], 3)
+            summary["db_ms"] = round(summary["db_ms"], 3)
+
+        return {"endpoints": endpoints, "recent": entries}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "sql_stats" in g:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not (has_request_context() and "sql_stats" in g):
+        return
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    g.sql_stats.record(
+        statement, duration, current_app.config["SQL_INSTRUMENTATION_SLOWEST"]
+    )
+
+
+def _start_request():
+    g.sql_stats = RequestStats()
+
+
+def _finish_request(response):
+    stats: RequestStats = g.pop("sql_stats", None)
+    if stats is None:
+        return response
+
+    config = current_app.config
+    repeated = stats.repeated(config["SQL_N_PLUS_ONE_THRESHOLD"])
+    db_ms = stats.total * 1000
+
+    response.headers.add(
+        "Server-Timing", f'db;dur={db_ms:.2f};desc="{stats.count} queries"'
+    )
+    response.headers["X-SQL-Count"] = str(stats.count)
+    if repeated:
+        response.headers["X-SQL-Repeated"] = str(len(repeated))
+        current_app.logger.warning(
+            "Possible N+1 in %s: %s",
+            request.endpoint,
+            "; ".join(f"{count}x {statement[:80]}" for statement, count in repeated)
+        )
+
+    current_app.extensions["sql_report"].add({
+        "endpoint": request.endpoint or request.path,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "statements": stats.count,
+        "db_ms": round(db_ms, 3),
+        "slowest": [
+            {"ms": round(duration * 1000, 3), "sql": statement}
+            for duration, statement in sorted(stats.slowest, reverse=True)
+        ],
+        "repeated": [
+            {"count": count, "sql": statement} for statement, count in repeated
+        ]
+    })
+    return response
+
+
+@instrumentation_bp.get("/sql")
+def SQLReportView():
+    report = current_app.extensions["sql_report"].snapshot()
+    if "identity_cache" in current_app.extensions:
+        report["user_cache"] = current_app.extensions["identity_cache"].stats()
+    if "fragment_cache" in current_app.extensions:
+        report["fragment_cache"] = current_app.extensions["fragment_cache"].stats()
+    return jsonify(report)
+
+
+def instrument_engine(engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def init_app(app) -> None:
+    if not app.config["SQL_INSTRUMENTATION"]:
+        return
+
+    app.extensions["sql_report"] = SQLReport(app.config["SQL_INSTRUMENTATION_REPORT_SIZE"])
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        instrument_engine(engine)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.register_blueprint(instrumentation_bp)
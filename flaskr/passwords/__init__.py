@@ -0,0 +1,139 @@
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from flask import current_app, has_app_context
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash
+)
+
+
+# Password hashing off the request worker.
+#
+# werkzeug's KDFs are deliberately slow and memory hard; running them inline
+# holds the GIL of the serving process and stalls every other request it is
+# handling. HashingPool runs them on a small process pool instead and bounds
+# the number of pending jobs: once PASSWORD_HASH_MAX_PENDING hashes are in
+# flight further callers get an immediate 503 instead of queueing up. A hash
+# taking longer than PASSWORD_HASH_TIMEOUT, or a pool whose worker died,
+# gets the same 503; a broken pool is replaced on the next call. A hash that
+# timed out keeps its slot until the worker is done with it.
+#
+# Workers are spawned, not forked: a fork of a threaded server copies
+# locks held by its other threads and can deadlock in the child.
+#
+# This module must not import flaskr.database, which depends on it.
+
+
+class PasswordHasherBusy(ServiceUnavailable):
+    description = "Too many sign-ins right now. Please, try again in a moment."
+
+
+DEFAULT_METHOD = "scrypt"
+
+
+def normalize_method(method: str) -> str:
+    """Expand a method name to the prefix werkzeug writes into the hash."""
+    name, *params = method.split(":")
+    if name == "scrypt" and not params:
+        return "scrypt:32768:8:1"
+    if name == "pbkdf2":
+        digest = params[0] if params else "sha256"
+        iterations = params[1] if len(params) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{digest}:{iterations}"
+    return method
+
+
+class HashingPool:
+
+    def __init__(self, workers: int, max_pending: int, timeout: float):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created on first use so that pre-forking servers start the pool in
+        # each worker process rather than sharing one across a fork
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=get_context("spawn")
+                    )
+                    atexit.register(self._executor.shutdown, wait=False, cancel_futures=True)
+        return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy(retry_after=1)
+        executor = self._get_executor()
+        try:
+            try:
+                future = executor.submit(fn, *args)
+            except BaseException:
+                self._slots.release()
+                raise
+            # Released when the job ends, not when the caller stops waiting:
+            # cancel() cannot stop a hash that a worker has already started
+            future.add_done_callback(lambda _: self._slots.release())
+            try:
+                return future.result(timeout=self.timeout)
+            except TimeoutError:
+                future.cancel()
+                raise PasswordHasherBusy(retry_after=1)
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise PasswordHasherBusy(retry_after=1)
+
+
+def _pool():
+    if has_app_context():
+        return current_app.extensions.get("password_hasher")
+    return None
+
+
+def _method() -> str:
+    if has_app_context():
+        return current_app.config["PASSWORD_HASH_METHOD"]
+    return DEFAULT_METHOD
+
+
+def hash_password(password: str) -> str:
+    pool = _pool()
+    if pool is None:
+        return generate_password_hash(password, _method())
+    return pool.run(generate_password_hash, password, _method())
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    pool = _pool()
+    if pool is None:
+        return check_password_hash(password_hash, password)
+    return pool.run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return password_hash.split("$", 1)[0] != normalize_method(_method())
+
+
+def init_app(app) -> None:
+    app.extensions["password_hasher"] = HashingPool(
+        app.config["PASSWORD_HASH_WORKERS"],
+        app.config["PASSWORD_HASH_MAX_PENDING"],
+        app.config["PASSWORD_HASH_TIMEOUT"]
+    )
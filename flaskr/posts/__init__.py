@@ -1,5 +1,6 @@
 from flask import (
     Blueprint,
+    current_app,
     render_template,
     redirect,
     request,
@@ -9,13 +10,20 @@ from flask import (
 )
 from flask_login import login_required, current_user
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import select
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import joinedload, selectinload, undefer
 from flaskr.database import (
-        db, User, Post, 
+        db, Base, User, Post, 
         PostDiscussion, 
         PostComment, 
         PostCategory, PostType
 )
+from flaskr.utils import encode_cursor, decode_cursor, parse_page_size
+from flaskr.search import search_posts
+from flaskr.related import related_posts
+from flaskr.reference import reference_data
+from flaskr.replicas import reads_from_replica
+from flaskr import conditional, fragments, rendering, votes
 
 
 posts_bp = Blueprint("posts", __name__, url_prefix="/posts")
@@ -23,77 +31,175 @@ posts_bp = Blueprint("posts", __name__, url_prefix="/posts")
 
 @posts_bp.get("/")
 @login_required
+@reads_from_replica
 def ViewPosts():
     author_id = request.args.get("author_id", None)
     post_type_name = request.args.get("post_type", None)
-    print(post_type_name)
     post_category_name = request.args.get("post_category", None)
-    post_types = []
+    per_page = parse_page_size(
+        request.args.get("per_page"),
+        current_app.config["POSTS_PER_PAGE"],
+        current_app.config["POSTS_MAX_PER_PAGE"]
+    )
+    after = decode_cursor(request.args.get("after"))
+    before = decode_cursor(request.args.get("before"))
+
+    if conditional.revalidating():
+        stamp_query = posts_stamp_query(current_user, post_type_name, post_category_name, author_id)
+        rows = db.session.execute(page_query(stamp_query, per_page, after, before)).all()
+        cached = conditional.listing_not_modified(*page_result(rows, per_page, after, before))
+        if cached is not None:
+            return cached
+
+    author = None
+    if author_id:
+        author = db.session.execute(
+            select(User).filter_by(alternative_id=author_id)
+        ).scalars().first()
 
+    base_query = posts_query(
+        current_user, post_type_name, post_category_name, author_id, author
+    )
 
-    if post_type_name:
-        post_types = db.session.execute(
-            select(PostType).filter_by(name=post_type_name)
-        ).scalars().all()
+    page, next_cursor, prev_cursor = paginate_posts(base_query, per_page, after, before)
+    conditional.validate_listing(page, next_cursor, prev_cursor)
+
+    return render_template(
+        "post_tmps/posts.html",
+        post_type_name=post_type_name,
+        post_category_name=post_category_name,
+        author=author,
+        post_cards=[fragments.post_card(post) for post in page],
+        per_page=per_page,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor
+    )
 
-    if post_category_name:
-        post_categories = db.session.execute(
-            select(PostCategory).filter_by(name=post_category_name)
-            .join(Post.post_categories).distinct()
-        ).scalars().all()
 
+def posts_query(viewer, post_type_name=None, post_category_name=None, author_id=None, author=None):
+    """The ViewPosts listing for `viewer`, before pagination."""
+    query = select(Post).options(
+        joinedload(Post.original_author),
+        joinedload(Post.post_type),
+        selectinload(Post.post_categories)
+    )
+    return filter_posts(query, viewer, post_type_name, post_category_name, author_id, author)
+
+
+def posts_stamp_query(viewer, post_type_name=None, post_category_name=None, author_id=None):
+    """The columns of the ViewPosts listing its validator depends on."""
+    return filter_posts(
+        select(Post.id, Post.created_at, Post.updated_at),
+        viewer, post_type_name, post_category_name, author_id
+    )
 
-    base_query = select(Post).distinct()
 
+def filter_posts(query, viewer, post_type_name=None, post_category_name=None, author_id=None, author=None):
+    """The ViewPosts filters, on any select from Post (`author` saves a subquery)."""
     if post_type_name:
-        base_query = base_query.join(PostType).filter(PostType.name == post_type_name)
+        query = query.join(Post.post_type).filter(PostType.name == post_type_name)
     
     if post_category_name:
-        base_query = (
-            base_query
-            .join(Post.post_categories)
-            .filter(PostCategory.name == post_category_name)
+        # EXISTS instead of a join keeps one row per post, so no DISTINCT is needed
+        query = query.filter(
+            Post.post_categories.any(PostCategory.name == post_category_name)
         )
-    
-    if author_id and current_user.alternative_id == author_id:
-        base_query = base_query.join(Post.original_author).filter(User.alternative_id == current_user.alternative_id)
-    elif author_id:
-        base_query = base_query.join(Post.original_author).filter(User.alternative_id == author_id).filter(Post.private == False)
+
+    if author_id:
+        query = query.filter(
+            Post.original_author_id == (
+                author.id if author
+                else select(User.id).filter_by(alternative_id=author_id).scalar_subquery()
+            )
+        )
+        if author_id != viewer.alternative_id:
+            query = query.filter(Post.private == False)
     else:
-        base_query = base_query.filter(
-            (Post.private == False) | (Post.original_author == current_user)
+        query = query.filter(
+            (Post.private == False) | (Post.original_author_id == viewer.id)
         )
 
-    all_posts = [post.get_public_info(short=True) for post in db.session.execute(base_query).scalars().all()]
+    return query
 
-    return render_template(
-        "post_tmps/posts.html",
-        post_type_name=post_type_name,
-        post_category_name=post_category_name,
-        author=db.session.execute(
-            select(User).filter_by(alternative_id=author_id)
-        ).scalars().first(),
-        all_posts=all_posts
+
+def paginate_posts(query, per_page: int, after=None, before=None):
+    """
+    Keyset pagination over (created_at, id), newest first.
+
+    Fetches one extra row to find out whether a further page exists, so a
+    page costs a single index range scan no matter how deep it is.
+    """
+    rows = db.session.execute(page_query(query, per_page, after, before)).scalars().unique().all()
+    return page_result(rows, per_page, after, before)
+
+
+def page_query(query, per_page: int, after=None, before=None):
+    sort_key = tuple_(Post.created_at, Post.id)
+
+    if before:
+        query = query.filter(sort_key > before).order_by(
+            Post.created_at.asc(), Post.id.asc()
+        )
+    else:
+        if after:
+            query = query.filter(sort_key < after)
+        query = query.order_by(Post.created_at.desc(), Post.id.desc())
+
+    return query.limit(per_page + 1)
+
+
+def page_result(rows, per_page: int, after=None, before=None):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if before:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        first, last = rows[0], rows[-1]
+        # Going forward, a previous page exists whenever we came from a cursor;
+        # going backward, a next page always exists (the one we came from).
+        if has_more or before:
+            next_cursor = encode_cursor(last.created_at, last.id)
+        if after or (before and has_more):
+            prev_cursor = encode_cursor(first.created_at, first.id)
+
+    return rows, next_cursor, prev_cursor
+
+
+
+@posts_bp.get("/search")
+@login_required
+@reads_from_replica
+def SearchPosts():
+    search_query = request.args.get("q", "").strip()
+    per_page = parse_page_size(
+        request.args.get("per_page"),
+        current_app.config["POSTS_PER_PAGE"],
+        current_app.config["POSTS_MAX_PER_PAGE"]
+    )
+    page = request.args.get("page", "1")
+    page = int(page) if page.isdigit() and int(page) > 0 else 1
+
+    results, has_more = search_posts(
+        search_query, current_user, per_page, (page - 1) * per_page
     )
 
+    return render_template(
+        "post_tmps/search.html",
+        search_query=search_query,
+        results=results,
+        page=page,
+        per_page=per_page,
+        has_more=has_more
+    )
 
 
 @posts_bp.route("/add-post", methods=("GET", "POST"))
 @login_required
 def AddPost():
-    post_types = [
-        p_type.get_info()
-        for p_type in db.session.execute(
-                            select(PostType)
-                    ).scalars().all()
-    ]
-    post_categories = [
-        p_cat.get_info()
-        for p_cat in 
-        db.session.execute(
-            select(PostCategory)
-        ).scalars().all()
-    ]
+    reference = reference_data()
 
     if request.method == "POST":
         title = request.form.get("title", "")
@@ -101,10 +207,8 @@ def AddPost():
         private = request.form.get("private", False)
         if private:
             private = True
-        p_type = request.form.get("post_type", None)
-        categories = request.form.getlist("post_categories")
-        print(p_type)
-        print(categories)
+        p_type = reference.post_type(request.form.get("post_type", None))
+        categories = reference.category_ids(request.form.getlist("post_categories"))
 
         if len(title) < 10 or len(body) < 50:
             flash("Invalid data in either title or body fields. Please keep title length over 6 chars and body length over 50 chars.")
@@ -118,33 +222,16 @@ def AddPost():
             post = Post(
                 title=title,
                 body=body,
-                private=private
+                private=private,
+                post_type_id=p_type["id"],
+                original_author=current_user
             )
-            post.original_author = current_user
-
-
-            post_type = db.session.execute(
-                select(PostType).filter_by(id=int(p_type))
-            ).scalars().first()
-
-            print(post_type)
-            post.post_type = post_type
-
-
-            for category_id in categories:
-                category_id = int(category_id)
-                post.post_categories.append(
-                    db.session.execute(
-                        select(PostCategory).filter_by(id=category_id)
-                    ).scalars().first()
-                )
-
-            post_discussion = PostDiscussion()
-            post_discussion.post = post
-
-            db.session.add_all([post, post_discussion])
-
+            post_discussion = PostDiscussion(post=post)
 
+            # Post and discussion in one flush, category links in one
+            # statement: the count does not depend on len(categories)
+            Base.insert_all([post, post_discussion], commit=False)
+            post.attach_categories(categories)
             db.session.commit()
 
             flash("Successfully published!")
@@ -161,17 +248,41 @@ def AddPost():
 
     return render_template(
         "post_tmps/add_post.html",
-        post_types=post_types,
-        post_categories=post_categories
+        post_types=reference.post_types,
+        post_categories=reference.post_categories
+    )
+
+
+def post_detail_query(post_id: str):
+    return (
+        select(Post).filter_by(alternative_id=post_id)
+        .options(
+            undefer(Post.body),
+            undefer(Post.body_html),
+            joinedload(Post.original_author),
+            joinedload(Post.post_type),
+            joinedload(Post.outgoing_request),
+            selectinload(Post.post_categories),
+            selectinload(Post.contributing_authors),
+            selectinload(Post.post_discussion)
+            .selectinload(PostDiscussion.post_comments)
+            .joinedload(PostComment.author)
+        )
     )
 
 
 @posts_bp.get("/<string:post_id>")
 @login_required
+@reads_from_replica
 def ViewPost(post_id: str):
-    post: Post = db.one_or_404(
-        db.select(Post).filter_by(alternative_id=post_id)
-    )
+    if conditional.revalidating():
+        cached = conditional.post_not_modified(
+            db.session.execute(conditional.post_stamp_query(post_id)).first()
+        )
+        if cached is not None:
+            return cached
+
+    post: Post = db.one_or_404(post_detail_query(post_id))
     
     is_author_viewing = False
 
@@ -180,18 +291,51 @@ def ViewPost(post_id: str):
     elif post.private:
             abort(404)
     
-    comments = [comment.get_info() for comment in post.post_discussion.post_comments]
-    
-
-
+    conditional.validate_post(post)
     return render_template(
         "post_tmps/post_detail.html",
         post=post,
-        comments=comments,
+        body_html=rendering.html(post.body, post.body_html),
+        upvotes=votes.upvotes(votes.POST, post.id, post.upvotes),
+        comments_html=None if post.private else comment_thread(post),
         is_author_viewing=is_author_viewing
     )
 
 
+@posts_bp.get("/<string:post_id>/related")
+@login_required
+@reads_from_replica
+def RelatedPosts(post_id: str):
+    post: Post = db.one_or_404(
+        select(Post).filter_by(alternative_id=post_id).options(undefer(Post.body))
+    )
+    if post.private and post.original_author_id != current_user.id:
+        abort(404)
+
+    return render_template(
+        "post_tmps/related.html",
+        post=post,
+        results=related_posts(post, current_user, current_app.config["RELATED_RESULTS"])
+    )
+
+
+def comment_thread(post: Post):
+    return fragments.comment_thread(
+        post,
+        lambda: render_template("post_tmps/_comments.html", post=post, comments=comment_infos(post))
+    )
+
+
+def comment_infos(post: Post) -> list:
+    comments = []
+    for comment in post.post_discussion.post_comments:
+        info = comment.get_info()
+        info["upvotes"] = votes.upvotes(votes.COMMENT, comment.id, comment.upvotes)
+        info["html"] = rendering.html(comment.text, comment.text_html)
+        comments.append(info)
+    return comments
+
+
 @posts_bp.post("/<string:post_id>/add-comment")
 @login_required
 def AddComment(post_id: str):
@@ -218,6 +362,39 @@ def AddComment(post_id: str):
         db.session.close()
 
 
+@posts_bp.post("/<string:post_id>/upvote")
+@login_required
+def UpvotePost(post_id: str):
+    post = db.session.execute(
+        select(Post.id, Post.private, Post.original_author_id).filter_by(alternative_id=post_id)
+    ).first()
+    # Private posts are only visible (and so votable) by their author
+    if post is None or (post.private and post.original_author_id != current_user.id):
+        abort(404)
+
+    if not votes.upvote(votes.POST, post.id, current_user.id):
+        flash("You have already upvoted this publication.")
+    return redirect(url_for("posts.ViewPost", post_id=post_id))
+
+
+@posts_bp.post("/<string:post_id>/comments/<int:comment_id>/upvote")
+@login_required
+def UpvoteComment(post_id: str, comment_id: int):
+    post = db.session.execute(
+        select(Post.private, Post.original_author_id)
+        .join(PostDiscussion, PostDiscussion.post_id == Post.id)
+        .join(PostComment, PostComment.post_discussion_id == PostDiscussion.id)
+        .where(Post.alternative_id == post_id, PostComment.id == comment_id)
+    ).first()
+    # The comment must belong to a post the user can see
+    if post is None or (post.private and post.original_author_id != current_user.id):
+        abort(404)
+
+    if not votes.upvote(votes.COMMENT, comment_id, current_user.id):
+        flash("You have already upvoted this comment.")
+    return redirect(url_for("posts.ViewPost", post_id=post_id) + f"#comment-{comment_id}")
+
+
 @posts_bp.get("/<string:post_id>/comments/<int:comment_id>/delete")
 @login_required
 def DeleteComment(post_id: str, comment_id: int):
@@ -0,0 +1,178 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Iterable, List, Mapping, Optional, Tuple
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from flaskr.database import (
+    db,
+    Post,
+    PostType,
+    PostCategory,
+    post_category_association_table
+)
+
+
+# Read-mostly, in-process cache of the reference tables (post types and
+# categories).
+#
+# Readers get an immutable ReferenceSnapshot and never touch the database.
+# Any commit that inserts, updates or deletes a PostType or PostCategory
+# bumps the cache version and the next reader builds a fresh snapshot with
+# two small queries. Post counts are as of the snapshot; they are refreshed
+# at least every REFERENCE_DATA_TTL seconds, which is also the upper bound
+# for other worker processes to see reference table changes.
+
+
+@dataclass(frozen=True)
+class ReferenceSnapshot:
+    version: int
+    built_at: float
+    post_types: Tuple[Mapping, ...]
+    post_categories: Tuple[Mapping, ...]
+    _types_by_id: Mapping[int, Mapping] = field(repr=False)
+    _types_by_name: Mapping[str, Mapping] = field(repr=False)
+    _categories_by_id: Mapping[int, Mapping] = field(repr=False)
+
+    def post_type(self, type_id) -> Optional[Mapping]:
+        return self._types_by_id.get(_as_id(type_id))
+
+    def post_type_by_name(self, name: str) -> Optional[Mapping]:
+        return self._types_by_name.get(name)
+
+    def post_category(self, category_id) -> Optional[Mapping]:
+        return self._categories_by_id.get(_as_id(category_id))
+
+    def category_ids(self, submitted: Iterable) -> Optional[List[int]]:
+        """Validated, de-duplicated ids, or None if any id is unknown."""
+        ids = []
+        for value in submitted:
+            category_id = _as_id(value)
+            if category_id not in self._categories_by_id:
+                return None
+            if category_id not in ids:
+                ids.append(category_id)
+        return ids
+
+
+def _as_id(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _entries(model, counts) -> Tuple[Mapping, ...]:
+    rows = db.session.execute(select(model.id, model.name).order_by(model.id)).all()
+    return tuple(
+        MappingProxyType({"id": row.id, "name": row.name, "posts_count": counts.get(row.id, 0)})
+        for row in rows
+    )
+
+
+def _build(version: int) -> ReferenceSnapshot:
+    type_counts = dict(db.session.execute(
+        select(Post.post_type_id, func.count()).group_by(Post.post_type_id)
+    ).all())
+    category_counts = dict(db.session.execute(
+        select(
+            post_category_association_table.c.post_category_id,
+            func.count()
+        ).group_by(post_category_association_table.c.post_category_id)
+    ).all())
+
+    post_types = _entries(PostType, type_counts)
+    post_categories = _entries(PostCategory, category_counts)
+
+    return ReferenceSnapshot(
+        version=version,
+        built_at=time.monotonic(),
+        post_types=post_types,
+        post_categories=post_categories,
+        _types_by_id=MappingProxyType({entry["id"]: entry for entry in post_types}),
+        _types_by_name=MappingProxyType({entry["name"]: entry for entry in post_types}),
+        _categories_by_id=MappingProxyType({entry["id"]: entry for entry in post_categories})
+    )
+
+
+class ReferenceDataCache:
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.version = 0
+        self._snapshot: Optional[ReferenceSnapshot] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.version += 1
+
+    def _fresh(self, snapshot: Optional[ReferenceSnapshot]) -> bool:
+        return (
+            snapshot is not None
+            and snapshot.version == self.version
+            and time.monotonic() - snapshot.built_at < self.ttl
+        )
+
+    def get(self) -> ReferenceSnapshot:
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            return snapshot
+
+        with self._lock:
+            if not self._fresh(self._snapshot):
+                self._snapshot = _build(self.version)
+            return self._snapshot
+
+
+def reference_data() -> ReferenceSnapshot:
+    return current_app.extensions["reference_data"].get()
+
+
+def invalidate() -> None:
+    """For writers that bypass the ORM session, e.g. bulk Core inserts."""
+    cache = current_app.extensions.get("reference_data")
+    if cache is not None:
+        cache.invalidate()
+
+
+_REFERENCE_MODELS = (PostType, PostCategory)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_reference_changes(session, flush_context, instances):
+    # Attaching posts to a category only touches its `posts` collection,
+    # which is not part of the snapshot, so collections are ignored here
+    changed = (
+        *session.new,
+        *session.deleted,
+        *(obj for obj in session.dirty if session.is_modified(obj, include_collections=False))
+    )
+    if any(isinstance(obj, _REFERENCE_MODELS) for obj in changed):
+        session.info["reference_data_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_version(session):
+    if session.info.pop("reference_data_changed", False) and has_app_context():
+        invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changes(session):
+    session.info.pop("reference_data_changed", None)
+
+
+def init_app(app) -> None:
+    cache = ReferenceDataCache(app.config["REFERENCE_DATA_TTL"])
+    app.extensions["reference_data"] = cache
+
+    with app.app_context():
+        try:
+            cache.get()
+        except OperationalError:
+            # Schema not created yet; the first reader builds the snapshot
+            pass
@@ -0,0 +1,469 @@
+import fcntl
+import json
+import os
+import re
+import shutil
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+import click
+import numpy as np
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect, or_, select
+from sqlalchemy.orm import Session, joinedload, selectinload
+from flaskr.database import db, Post
+
+
+# Related posts: cosine similarity of TF-IDF vectors over title and body.
+#
+# Words are hashed into RELATED_DIMENSIONS buckets (no vocabulary to keep
+# in sync), weighted 1 + log(tf) times the idf of the last build and
+# L2-normalised. The vectors live in flat files under RELATED_INDEX_PATH,
+# which every worker memory-maps: the page cache holds one copy however
+# many processes serve requests.
+#
+# `flask related build` writes the vectors inverted, by bucket (CSC:
+# colptr, rows, values), so a query reads only the postings of its own
+# buckets. Posts committed afterwards, new or with an edited title or
+# body, are appended by the process that commits them, under a file lock,
+# as rows of a small CSR segment (indptr, indices, data) scored in full;
+# the last vector of a post supersedes its earlier ones. Appended posts
+# reuse the idf of the build, so rebuild now and then. Private posts are
+# indexed and filtered out when the results are loaded.
+
+_TOKEN = re.compile(r"[a-z0-9]{2,}")
+
+# A word in the title counts as much as this many in the body
+TITLE_WEIGHT = 2
+
+# Bumped when the files change shape; an index of another format is ignored
+FORMAT = 2
+
+# The post id of each row: the build's rows (sorted by id), then the appended ones
+_IDS = {"post_ids": np.int64}
+# The build's vectors by bucket
+_BUILT = {
+    "colptr": np.int64,
+    "rows": np.int32,
+    "values": np.float32,
+}
+# The appended vectors by post
+_APPENDED = {
+    "indptr": np.int64,
+    "indices": np.int32,
+    "data": np.float32,
+}
+_FILES = {**_IDS, **_BUILT, **_APPENDED}
+
+# Posts updated this long before a build read them are indexed again after
+# it, in case their transaction committed only once the build had read them
+_BUILD_OVERLAP = timedelta(seconds=10)
+
+
+def _buckets(title: str, body: str, dimensions: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct hash buckets of a post's words and their counts."""
+    words = _TOKEN.findall(title.lower()) * TITLE_WEIGHT + _TOKEN.findall(body.lower())
+    hashes = np.fromiter(
+        (zlib.crc32(word.encode()) for word in words), dtype=np.int64, count=len(words)
+    )
+    return np.unique(hashes % dimensions, return_counts=True)
+
+
+def _vector(buckets: np.ndarray, counts: np.ndarray, idf: np.ndarray) -> np.ndarray:
+    weights = ((1 + np.log(counts)) * idf[buckets]).astype(np.float32)
+    norm = np.linalg.norm(weights)
+    return weights / norm if norm else weights
+
+
+def _read_meta(path: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+    except FileNotFoundError:
+        return None
+    return meta if meta.get("format") == FORMAT else None
+
+
+def _write_meta(path: str, meta: dict) -> None:
+    temporary = os.path.join(path, "meta.json.tmp")
+    with open(temporary, "w") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(temporary, os.path.join(path, "meta.json"))
+
+
+def _lengths(meta: dict) -> dict:
+    return {
+        "post_ids": meta["documents"] + meta["appended"],
+        "colptr": meta["dimensions"] + 1,
+        "rows": meta["nnz"],
+        "values": meta["nnz"],
+        "indptr": meta["appended"] + 1,
+        "indices": meta["appended_nnz"],
+        "data": meta["appended_nnz"],
+    }
+
+
+def _map(path: str, name: str, length: int, mode: str = "r") -> np.ndarray:
+    dtype = _FILES[name]
+    if not length:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(os.path.join(path, name), dtype=dtype, mode=mode, shape=(length,))
+
+
+@contextmanager
+def _locked(path: str):
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _append(path: str, meta: dict, posts: Iterable[Tuple[int, str, str]], idf: np.ndarray,
+            batch: int = 10000) -> dict:
+    """Append vectors of `posts` to the files under `path`; returns the new meta."""
+    lengths = _lengths(meta)
+    # Drop whatever an interrupted append left past the recorded lengths
+    for name in (*_IDS, *_APPENDED):
+        os.truncate(os.path.join(path, name), lengths[name] * np.dtype(_FILES[name]).itemsize)
+
+    appended, appended_nnz, last_post_id = meta["appended"], meta["appended_nnz"], meta["last_post_id"]
+    post_ids, indptr, indices, data = [], [], [], []
+
+    def write():
+        chunks = {
+            "post_ids": np.asarray(post_ids, dtype=np.int64),
+            "indptr": np.asarray(indptr, dtype=np.int64),
+            "indices": np.concatenate(indices),
+            "data": np.concatenate(data),
+        }
+        for name, chunk in chunks.items():
+            with open(os.path.join(path, name), "ab") as array_file:
+                array_file.write(chunk.tobytes())
+        for pending in (post_ids, indptr, indices, data):
+            pending.clear()
+
+    for post_id, title, body in posts:
+        buckets, counts = _buckets(title, body, meta["dimensions"])
+        post_ids.append(post_id)
+        indices.append(buckets.astype(np.int32))
+        data.append(_vector(buckets, counts, idf))
+        appended_nnz += len(buckets)
+        indptr.append(appended_nnz)
+        appended += 1
+        last_post_id = max(last_post_id, post_id)
+        if len(post_ids) >= batch:
+            write()
+    if post_ids:
+        write()
+
+    if appended == meta["appended"]:
+        return meta
+    # Readers only see the new rows once the meta counts them
+    meta = dict(meta, appended=appended, appended_nnz=appended_nnz, last_post_id=last_post_id)
+    _write_meta(path, meta)
+    return meta
+
+
+def _invert(path: str, meta: dict, batch: int = 10000) -> dict:
+    """Move the appended rows under `path` into the by-bucket arrays."""
+    lengths = _lengths(meta)
+    indptr = _map(path, "indptr", lengths["indptr"])
+    indices = _map(path, "indices", lengths["indices"])
+    data = _map(path, "data", lengths["data"])
+    documents, nnz = meta["appended"], meta["appended_nnz"]
+
+    colptr = np.zeros(meta["dimensions"] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=meta["dimensions"]), out=colptr[1:])
+    colptr.tofile(os.path.join(path, "colptr"))
+    for name in ("rows", "values"):
+        open(os.path.join(path, name), "wb").close()
+        os.truncate(os.path.join(path, name), nnz * np.dtype(_FILES[name]).itemsize)
+    rows = _map(path, "rows", nnz, mode="r+")
+    values = _map(path, "values", nnz, mode="r+")
+
+    # Rows go in order, so each bucket's postings end up sorted by row
+    filled = colptr[:-1].copy()
+    for start in range(0, documents, batch):
+        stop = min(start + batch, documents)
+        low, high = indptr[start], indptr[stop]
+        order = np.argsort(indices[low:high], kind="stable")
+        buckets = indices[low:high][order]
+        rank = np.arange(len(buckets)) - np.searchsorted(buckets, buckets)
+        positions = filled[buckets] + rank
+        rows[positions] = np.repeat(
+            np.arange(start, stop, dtype=np.int32), np.diff(indptr[start:stop + 1])
+        )[order]
+        values[positions] = data[low:high][order]
+        filled += np.bincount(buckets, minlength=meta["dimensions"])
+    for array in (rows, values):
+        if isinstance(array, np.memmap):
+            array.flush()
+    del indptr, indices, data, rows, values
+
+    for name in _APPENDED:
+        open(os.path.join(path, name), "wb").close()
+    np.zeros(1, dtype=np.int64).tofile(os.path.join(path, "indptr"))
+    meta = dict(meta, documents=documents, nnz=nnz, appended=0, appended_nnz=0)
+    _write_meta(path, meta)
+    return meta
+
+
+def _post_texts(after_id: int = 0, updated_since: Optional[datetime] = None, chunk: int = 1000):
+    condition = Post.id > after_id
+    if updated_since is not None:
+        condition = or_(condition, Post.updated_at >= updated_since)
+    return db.session.execute(
+        select(Post.id, Post.title, Post.body)
+        .where(condition)
+        .order_by(Post.id)
+        .execution_options(yield_per=chunk)
+    )
+
+
+def build(path: str, dimensions: int) -> dict:
+    """Index every post into a fresh directory and swap it in for `path`."""
+    documents = 0
+    df = np.zeros(dimensions, dtype=np.int64)
+    for _, title, body in _post_texts():
+        df[_buckets(title, body, dimensions)[0]] += 1
+        documents += 1
+    idf = (np.log((1 + documents) / (1 + df)) + 1).astype(np.float32)
+
+    staging = f"{path}.new"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name in _FILES:
+        open(os.path.join(staging, name), "wb").close()
+    np.zeros(1, dtype=np.int64).tofile(os.path.join(staging, "indptr"))
+    idf.tofile(os.path.join(staging, "idf"))
+
+    meta = {
+        "format": FORMAT, "dimensions": dimensions, "documents": 0, "nnz": 0,
+        "appended": 0, "appended_nnz": 0, "last_post_id": 0, "built_at": time.time()
+    }
+    # Stored times are naive UTC
+    started = datetime.now(timezone.utc).replace(tzinfo=None)
+    meta = _append(staging, meta, _post_texts(), idf)
+    meta = _invert(staging, meta)
+
+    with _locked(path):
+        # Posts committed while the build ran, and posts edited meanwhile
+        meta = _append(staging, meta, _post_texts(meta["last_post_id"], started - _BUILD_OVERLAP), idf)
+        _write_meta(staging, meta)
+        retired = f"{path}.old"
+        shutil.rmtree(retired, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, retired)
+        os.rename(staging, path)
+        shutil.rmtree(retired, ignore_errors=True)
+    return meta
+
+
+def _superseded(post_ids: np.ndarray, documents: int) -> np.ndarray:
+    """Rows whose post has a later row."""
+    built, appended = post_ids[:documents], np.asarray(post_ids[documents:])
+    if not appended.size:
+        return np.zeros(0, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(built, appended), max(documents - 1, 0))
+    rebuilt = positions[built[positions] == appended] if documents else positions[:0]
+    # np.unique on the reversed ids finds the last row of each post
+    last = appended.size - 1 - np.unique(appended[::-1], return_index=True)[1]
+    repeated = np.setdiff1d(np.arange(appended.size), last) + documents
+    return np.concatenate([rebuilt, repeated]).astype(np.int64)
+
+
+class RelatedIndex:
+    """Read side: memory maps of the index files, remapped when they change."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._stamp = None
+        self._arrays = None
+
+    def _maps(self) -> Optional[dict]:
+        try:
+            stat = os.stat(os.path.join(self.path, "meta.json"))
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp != self._stamp:
+            meta = _read_meta(self.path)
+            if meta is None:
+                return None
+            lengths = _lengths(meta)
+            arrays = {name: _map(self.path, name, lengths[name]) for name in _FILES}
+            arrays["idf"] = np.memmap(
+                os.path.join(self.path, "idf"), dtype=np.float32, mode="r", shape=(meta["dimensions"],)
+            )
+            arrays["superseded"] = _superseded(arrays["post_ids"], meta["documents"])
+            arrays["meta"] = meta
+            self._arrays, self._stamp = arrays, stamp
+        return self._arrays
+
+    def meta(self) -> Optional[dict]:
+        arrays = self._maps()
+        return arrays["meta"] if arrays else None
+
+    def scores(self, title: str, body: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(post_ids, cosine similarity) of every indexed row, or None without an index."""
+        arrays = self._maps()
+        if arrays is None:
+            return None
+        meta = arrays["meta"]
+        documents = meta["documents"]
+
+        buckets, counts = _buckets(title, body, meta["dimensions"])
+        weights = _vector(buckets, counts, arrays["idf"])
+        scores = np.zeros(documents + meta["appended"], dtype=np.float32)
+        if not buckets.size:
+            return arrays["post_ids"], scores
+
+        # Built rows: only the postings of the query's buckets (a row
+        # appears once per bucket, so the fancy-indexed adds do not collide)
+        colptr, rows, values = arrays["colptr"], arrays["rows"], arrays["values"]
+        for bucket, weight in zip(buckets, weights):
+            start, stop = colptr[bucket], colptr[bucket + 1]
+            scores[rows[start:stop]] += values[start:stop] * weight
+
+        # Appended rows: few, scored in full
+        indptr, indices = arrays["indptr"], arrays["indices"]
+        if indices.size:
+            positions = np.minimum(np.searchsorted(buckets, indices), buckets.size - 1)
+            products = np.where(buckets[positions] == indices, arrays["data"] * weights[positions], 0)
+            filled = indptr[1:] > indptr[:-1]
+            scores[documents:][filled] = np.add.reduceat(products, indptr[:-1][filled])
+
+        scores[arrays["superseded"]] = 0
+        return arrays["post_ids"], scores
+
+
+def _index() -> Optional[RelatedIndex]:
+    return current_app.extensions.get("related_index")
+
+
+def rebuild_index() -> dict:
+    """build() the index of this app; returns its meta."""
+    return build(_index().path, current_app.config["RELATED_DIMENSIONS"])
+
+
+def related_posts(post: Post, viewer, limit: int) -> Optional[List[Tuple[Post, float]]]:
+    """
+    The `limit` posts most similar to `post` that `viewer` may see, best
+    first, or None when the index has not been built.
+    """
+    index = _index()
+    result = index.scores(post.title, post.body) if index else None
+    if result is None:
+        return None
+    post_ids, scores = result
+
+    ranked = []
+    candidates = limit * 2
+    while len(ranked) < limit:
+        # Only the top candidates are sorted; widen if privacy drops too many
+        count = min(candidates + 1, len(scores))
+        top = np.argpartition(-scores, count - 1)[:count] if count else np.zeros(0, dtype=np.int64)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[(scores[top] > 0) & (post_ids[top] != post.id)]
+
+        found = {
+            candidate.id: candidate for candidate in db.session.execute(
+                select(Post)
+                .where(Post.id.in_([int(post_id) for post_id in post_ids[top]]))
+                .where((Post.private == False) | (Post.original_author_id == viewer.id))
+                .options(
+                    joinedload(Post.original_author),
+                    joinedload(Post.post_type),
+                    selectinload(Post.post_categories)
+                )
+            ).scalars()
+        }
+        ranked = [
+            (found[int(post_ids[row])], float(scores[row]))
+            for row in top if int(post_ids[row]) in found
+        ][:limit]
+        if count >= len(scores) or len(top) < count - 1:
+            break
+        candidates *= 4
+    return ranked
+
+
+def _text_changed(post: Post) -> bool:
+    state = inspect(post)
+    return state.attrs.title.history.has_changes() or state.attrs.body.history.has_changes()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_posts(session, flush_context):
+    changed = {post.id: (post.title, post.body) for post in session.new if isinstance(post, Post)}
+    edited = [
+        post.id for post in session.dirty
+        if isinstance(post, Post) and post.id not in changed and _text_changed(post)
+    ]
+    if edited:
+        # The body may not be loaded (it is deferred); read both as flushed
+        for post_id, title, body in session.connection().execute(
+            select(Post.id, Post.title, Post.body).where(Post.id.in_(edited))
+        ):
+            changed[post_id] = (title, body)
+    if changed:
+        session.info.setdefault("related_changed", {}).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _index_changed_posts(session):
+    changed = session.info.pop("related_changed", None)
+    if not changed or not has_app_context() or _index() is None:
+        return
+    path = _index().path
+    try:
+        with _locked(path):
+            meta = _read_meta(path)
+            if meta is None:
+                return
+            idf = np.fromfile(os.path.join(path, "idf"), dtype=np.float32)
+            _append(path, meta, [(post_id, *changed[post_id]) for post_id in sorted(changed)], idf)
+    except OSError:
+        # The next build picks them up
+        current_app.logger.exception("Could not append %d posts to the related index", len(changed))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_posts(session):
+    session.info.pop("related_changed", None)
+
+
+related_cli = AppGroup("related", help="Manage the related-posts index.")
+
+
+@related_cli.command("build")
+def build_command():
+    """(Re)build the index from all posts."""
+    started = time.perf_counter()
+    meta = rebuild_index()
+    click.echo(
+        f"Indexed {meta['documents']} posts ({meta['nnz']} non-zeros) "
+        f"in {time.perf_counter() - started:.1f}s."
+    )
+
+
+@related_cli.command("status")
+def status_command():
+    meta = _index().meta()
+    if meta is None:
+        click.echo("No index; run `flask related build`.")
+        return
+    for key, value in meta.items():
+        click.echo(f"{key}: {value}")
+
+
+def init_app(app) -> None:
+    path = app.config["RELATED_INDEX_PATH"] or os.path.join(app.instance_path, "related")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    app.extensions["related_index"] = RelatedIndex(path)
+    app.cli.add_command(related_cli)
@@ -0,0 +1,148 @@
+import re
+from typing import Optional
+import click
+from flask.cli import AppGroup
+from markdown_it import MarkdownIt
+from markupsafe import Markup
+from sqlalchemy import Text, bindparam, event, func, inspect, or_, select, update
+from flaskr import schema
+from flaskr.database import db, CompressedText, Post, PostComment
+from flaskr.utils import PeriodicTask
+
+
+# Markdown for post bodies and comments, rendered once when they are
+# written.
+#
+# The HTML is stored next to the source (post_table.body_html,
+# post_comment.text_html) with the RENDERER_VERSION that produced it. Any
+# ORM write of a body or comment renders it (mapper events); Core writers
+# call render() themselves. Views only print the stored HTML.
+#
+# Raw HTML in the source is escaped and unsafe link schemes are dropped by
+# markdown-it, so the stored HTML is safe to print as is.
+#
+# Bump RENDERER_VERSION whenever the output changes (options, plugins, a
+# markdown-it upgrade): `flask markdown rerender`, or the background task
+# every MARKDOWN_RERENDER_INTERVAL seconds, re-renders the outdated rows in
+# batches. A row is only written back if it is still outdated and its
+# source is still the one that was rendered; one edited meanwhile keeps
+# the editor's HTML.
+
+RENDERER_VERSION = 1
+
+BATCH_SIZE = 1000
+
+_markdown = MarkdownIt("commonmark", {"html": False})
+
+
+def _link_open(renderer, tokens, index, options, env):
+    tokens[index].attrSet("rel", "nofollow noopener")
+    return renderer.renderToken(tokens, index, options, env)
+
+
+_markdown.add_render_rule("link_open", _link_open)
+
+# One line of words and punctuation that means nothing to Markdown
+# renders to a single paragraph; skip the parser for it
+_PLAIN = re.compile(r"[^\W\d_](?:[^\W_]|[ ,.;:?!%-])*")
+
+
+def render(source: str) -> str:
+    if _PLAIN.fullmatch(source) and not source.endswith(" "):
+        return f"<p>{source}</p>\n"
+    return _markdown.render(source)
+
+
+def html(source: str, rendered: Optional[str]) -> Markup:
+    """The stored HTML; rows written before rendering existed are rendered now."""
+    return Markup(rendered if rendered is not None else render(source))
+
+
+# Updates only re-render a changed source; rows left without HTML (or
+# with an old version) are the rerender job's
+
+@event.listens_for(Post, "before_insert")
+def _render_new_post(mapper, connection, post):
+    post.body_html = render(post.body)
+    post.body_html_version = RENDERER_VERSION
+
+
+@event.listens_for(Post, "before_update")
+def _render_changed_post(mapper, connection, post):
+    if inspect(post).attrs.body.history.has_changes():
+        _render_new_post(mapper, connection, post)
+
+
+@event.listens_for(PostComment, "before_insert")
+def _render_new_comment(mapper, connection, comment):
+    comment.text_html = render(comment.text)
+    comment.text_html_version = RENDERER_VERSION
+
+
+@event.listens_for(PostComment, "before_update")
+def _render_changed_comment(mapper, connection, comment):
+    if inspect(comment).attrs.text.history.has_changes():
+        _render_new_comment(mapper, connection, comment)
+
+
+_TARGETS = (
+    # Rendering is not a content change: post_table.updated_at stays put
+    (Post.__table__, "body", "body_html", "body_html_version", {"updated_at": Post.__table__.c.updated_at}),
+    (PostComment.__table__, "text", "text_html", "text_html_version", {}),
+)
+
+
+def rerender(max_batches: Optional[int] = None) -> int:
+    """Re-render rows of an older (or no) renderer version; returns how many."""
+    rendered = 0
+    batches = 0
+    for table, source, target, version, unchanged in _TARGETS:
+        outdated = or_(table.c[version].is_(None), table.c[version] < RENDERER_VERSION)
+        # Compared as text: the stored form of a compressed body depends on settings
+        stored = table.c[source]
+        if isinstance(stored.type, CompressedText):
+            stored = func.post_body(stored, type_=Text)
+        while max_batches is None or batches < max_batches:
+            rows = db.session.execute(
+                select(table.c.id, table.c[source]).where(outdated).limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            result = db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam("row_id"))
+                .where(outdated)
+                .where(stored.is_not_distinct_from(bindparam("source", type_=Text)))
+                .values({target: bindparam("html"), version: RENDERER_VERSION, **unchanged}),
+                [{"row_id": row_id, "source": text, "html": render(text)} for row_id, text in rows]
+            )
+            db.session.commit()
+            rendered += result.rowcount
+            batches += 1
+    return rendered
+
+
+markdown_cli = AppGroup("markdown", help="Manage the rendered HTML of posts and comments.")
+
+
+@markdown_cli.command("rerender")
+def rerender_command():
+    """Render every post and comment not rendered by the current version."""
+    # Databases created before rendering lack the columns
+    for table, _, target, version, _ in _TARGETS:
+        added = schema.ensure_columns(table, [target, version])
+        if added:
+            click.echo(f"Added {', '.join(added)} to {table.name}.")
+    schema.ensure_indexes()
+    click.echo(f"{rerender()} rows rendered (renderer version {RENDERER_VERSION}).")
+
+
+def init_app(app) -> None:
+    app.cli.add_command(markdown_cli)
+
+    interval = app.config["MARKDOWN_RERENDER_INTERVAL"]
+    if interval:
+        # A few batches per run keep each run short
+        rerenderer = PeriodicTask(app, interval, lambda: rerender(max_batches=10), "markdown-rerender")
+        app.extensions["markdown_rerender"] = rerenderer
+        app.before_request(rerenderer.ensure_started)
@@ -0,0 +1,147 @@
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Optional
+import click
+from flask import current_app, g, has_request_context, session as http_session
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from flaskr.utils import PeriodicTask
+
+
+# Read/write splitting.
+#
+# READ_REPLICAS lists database URIs holding copies of the primary. They are
+# registered as extra binds, and views decorated with @reads_from_replica
+# send their SELECTs to one of them (picked once per request). Everything
+# else goes to the primary, and so does a replica-routed request from the
+# moment its session flushes anything.
+#
+# Read-your-writes: a request that wrote pins its browser session to the
+# primary for REPLICA_STICKY_SECONDS, longer than the replicas lag behind.
+# `with primary():` forces the primary for a block of code.
+#
+# SQLite replicas are refreshed from the primary with the online backup API,
+# by `flask replicas sync` or every REPLICA_SYNC_INTERVAL seconds.
+#
+# This module must not import flaskr.database, which depends on it.
+
+_STICKY_KEY = "_primary_until"
+
+
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not self.info.get("wrote"):
+            if not getattr(clause, "is_dml", False):
+                bind_key = replica_bind_key()
+                if bind_key is not None:
+                    return self._db.engines[bind_key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _after_flush(session, flush_context):
+    session.info["wrote"] = True
+    if has_request_context():
+        g.wrote_to_primary = True
+
+
+def replica_bind_key() -> Optional[str]:
+    """
+    The replica bind the current request reads from, picked once per
+    request, or None when it has to use the primary.
+    """
+    if not has_request_context() or not current_app.extensions["replicas"]:
+        return None
+    if not g.get("read_replica") or g.get("force_primary") or g.get("wrote_to_primary"):
+        return None
+    if http_session.get(_STICKY_KEY, 0) > time.time():
+        return None
+    if "replica_key" not in g:
+        g.replica_key = random.choice(current_app.extensions["replicas"])
+    return g.replica_key
+
+
+def reads_from_replica(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def primary():
+    previous = g.get("force_primary", False)
+    g.force_primary = True
+    try:
+        yield
+    finally:
+        g.force_primary = previous
+
+
+def _stick_to_primary(response):
+    if g.get("wrote_to_primary"):
+        http_session[_STICKY_KEY] = time.time() + current_app.config["REPLICA_STICKY_SECONDS"]
+    return response
+
+
+def _sqlite_path(engine) -> str:
+    return make_url(str(engine.url)).database
+
+
+def sync_replicas() -> int:
+    """Copy the primary into every SQLite replica; returns the count."""
+    db = current_app.extensions["sqlalchemy"]
+    source = db.engine.raw_connection()
+    try:
+        for bind_key in current_app.extensions["replicas"]:
+            target = sqlite3.connect(_sqlite_path(db.engines[bind_key]), timeout=30)
+            try:
+                # Copies in steps so the primary's writers are not blocked
+                # for the whole copy; restarts if the primary changes midway
+                source.driver_connection.backup(target, pages=1024, sleep=0.005)
+            finally:
+                target.close()
+    finally:
+        source.close()
+    return len(current_app.extensions["replicas"])
+
+
+replicas_cli = AppGroup("replicas", help="Manage read replicas.")
+
+
+@replicas_cli.command("sync")
+def sync_command():
+    """Refresh the SQLite replicas from the primary."""
+    click.echo(f"{sync_replicas()} replicas synced.")
+
+
+def configure(app) -> None:
+    """Register READ_REPLICAS as binds; must run before db.init_app()."""
+    binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+    keys = []
+    for number, uri in enumerate(app.config["READ_REPLICAS"]):
+        key = f"replica_{number}"
+        binds[key] = uri
+        keys.append(key)
+    app.extensions["replicas"] = keys
+
+
+def init_app(app) -> None:
+    app.cli.add_command(replicas_cli)
+    if not app.extensions["replicas"]:
+        return
+
+    app.after_request(_stick_to_primary)
+
+    interval = app.config["REPLICA_SYNC_INTERVAL"]
+    if interval:
+        syncer = PeriodicTask(app, interval, sync_replicas, "replica-sync")
+        app.extensions["replica_sync"] = syncer
+        app.before_request(syncer.ensure_started)
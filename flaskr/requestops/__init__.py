@@ -9,6 +9,7 @@ from flask import (
 )
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 from flask_login import login_required, current_user
 from flaskr.database import (
     db,
@@ -19,14 +20,77 @@ from flaskr.database import (
     RepresentativeRequest,
     Board
 )
+from flaskr.routing import pick_representative, pick_board
+from flaskr.replicas import reads_from_replica
 
 requests_bp = Blueprint("requests", __name__, url_prefix="/requests")
 
 
 @requests_bp.route("/")
 @login_required
+@reads_from_replica
 def GetRequests():
-    return render_template("requests_tmps/main.html")
+    outgoing_requests = db.session.execute(
+        outgoing_requests_query(current_user.id)
+    ).scalars().all()
+
+    incoming_requests = []
+    repr_requests = []
+    if current_user.type == "representative":
+        incoming_requests = db.session.execute(
+            incoming_requests_query(current_user.id)
+        ).scalars().all()
+        repr_requests = db.session.execute(
+            repr_requests_query(current_user.id)
+        ).scalars().all()
+
+    return render_template(
+        "requests_tmps/main.html",
+        outgoing_requests=outgoing_requests,
+        incoming_requests=incoming_requests,
+        repr_requests=repr_requests
+    )
+
+
+# The GetRequests lists, loaded with every related row the template reads
+
+def outgoing_requests_query(user_id: int):
+    return (
+        select(UserRequest)
+        .filter(UserRequest.calling_user_id == user_id)
+        .options(
+            joinedload(UserRequest.receiving_representative),
+            joinedload(UserRequest.request_object),
+            joinedload(UserRequest.linked_repr_request)
+        )
+        .order_by(UserRequest.id)
+    )
+
+
+def incoming_requests_query(representative_id: int):
+    return (
+        select(UserRequest)
+        .filter(UserRequest.receiving_representative_id == representative_id)
+        .options(
+            joinedload(UserRequest.calling_user),
+            joinedload(UserRequest.request_object)
+        )
+        .order_by(UserRequest.id)
+    )
+
+
+def repr_requests_query(representative_id: int):
+    return (
+        select(RepresentativeRequest)
+        .filter(RepresentativeRequest.representative_id == representative_id)
+        .options(
+            joinedload(RepresentativeRequest.calling_user_request)
+            .joinedload(UserRequest.calling_user),
+            joinedload(RepresentativeRequest.calling_user_request)
+            .joinedload(UserRequest.request_object)
+        )
+        .order_by(RepresentativeRequest.id)
+    )
 
 
 
@@ -35,8 +99,6 @@ def GetRequests():
 def CreateRequest(req_type):
     request_caller_type = current_user.type
 
-    print(req_type)
-
     if req_type == "user_req":
         # if request_caller_type == "representative":
         #     flash("The request cannot be proceeded. Do not try again.")
@@ -46,24 +108,17 @@ def CreateRequest(req_type):
         source_object: Post = db.one_or_404(
             select(Post).filter_by(alternative_id=source_object_id)
         )
-        print(source_object)
-
-
-        all_reprs = db.session.execute(
-            select(Representative)
-        ).scalars().all()
 
-        incoming_reqs_count = [len(repr.incoming_requests) for repr in all_reprs]
-        min_count = min(incoming_reqs_count)
+        target_repr = pick_representative(exclude_user_id=current_user.id)
 
-        target_repr: Representative = None
-        targets= [
-            repr for repr in all_reprs if len(repr.incoming_requests) == min_count
-        ]
-        for t in targets:
-            if t.alternative_id != current_user.alternative_id:
-                target_repr = t
-                break
+        # A post links one request (outgoing_requet_id): a second one would
+        # orphan the first, which still counts as open for its representative.
+        # The pick above holds the write lock, so this re-read is current
+        db.session.refresh(source_object, ["outgoing_requet_id"])
+        if source_object.outgoing_requet_id is not None:
+            db.session.rollback()
+            flash("A request for this publication already exists.")
+            return redirect(url_for("posts.ViewPost", post_id=source_object_id))
 
         if not target_repr:
             flash("The request cannot be proceeded.")
@@ -89,7 +144,6 @@ def CreateRequest(req_type):
             abort(404)
 
         user_request_id = int(user_request_id)
-        print(user_request_id)
 
         user_request = db.one_or_404(
             select(UserRequest).filter(UserRequest.id == user_request_id)
@@ -105,16 +159,7 @@ def CreateRequest(req_type):
             flash("The request already exists.")
             return redirect(url_for("requests.GetRequests"))
 
-        all_boards = db.session.execute(select(Board)).scalars().all()
-        incoming_reqs_count = [len(board.incoming_requests) for board in all_boards]
-        min_count = min(incoming_reqs_count)
-
-        target_board: Board | None = None
-
-        for board in all_boards:
-            if len(board.incoming_requests) == min_count:
-                target_board = board
-                break
+        target_board = pick_board()
 
         if not target_board:
             flash("The request cannot be proceeded.")
@@ -0,0 +1,134 @@
+from typing import Optional
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, select, update
+from flaskr.database import (
+    db,
+    Board,
+    Representative,
+    RepresentativeRequest,
+    UserRequest
+)
+
+
+# Least-loaded routing of requests.
+#
+# Representative.open_requests_count and Board.open_requests_count hold the
+# number of open (closed_at IS NULL) requests assigned to each of them. The
+# counters are adjusted by mapper events with a single relative UPDATE on
+# the flush connection, i.e. inside the same transaction as the
+# insert/delete/close of the request itself, so they can never drift from
+# a committed state.
+#
+# Picking a target is one indexed "ORDER BY open_requests_count, id LIMIT 1"
+# lookup done as an UPDATE ... RETURNING on the chosen row. The UPDATE takes
+# the database write lock before the choice is made, so two concurrent
+# routers are serialised and the second one sees the first one's increment
+# instead of picking the same target.
+
+
+def _adjust(connection, table, row_id: Optional[int], delta: int) -> None:
+    if row_id is None:
+        return
+    connection.execute(
+        update(table)
+        .where(table.c.id == row_id)
+        .values(open_requests_count=table.c.open_requests_count + delta)
+    )
+
+
+def _track(request_cls, owner_key: str, owner_table) -> None:
+
+    @event.listens_for(request_cls, "after_insert")
+    def after_insert(mapper, connection, target):
+        if target.closed_at is None:
+            _adjust(connection, owner_table, getattr(target, owner_key), 1)
+
+    @event.listens_for(request_cls, "after_delete")
+    def after_delete(mapper, connection, target):
+        if target.closed_at is None:
+            _adjust(connection, owner_table, getattr(target, owner_key), -1)
+
+    @event.listens_for(request_cls, "after_update")
+    def after_update(mapper, connection, target):
+        old_owner, new_owner = target.previous(owner_key), getattr(target, owner_key)
+        was_open, is_open = target.previous("closed_at") is None, target.closed_at is None
+
+        if old_owner == new_owner and was_open == is_open:
+            return
+        if was_open:
+            _adjust(connection, owner_table, old_owner, -1)
+        if is_open:
+            _adjust(connection, owner_table, new_owner, 1)
+
+
+_track(UserRequest, "receiving_representative_id", Representative.__table__)
+_track(RepresentativeRequest, "board_id", Board.__table__)
+
+
+def _claim_least_loaded(table, exclude_id: Optional[int] = None) -> Optional[int]:
+    candidates = table.alias()
+    candidate = select(candidates.c.id)
+    if exclude_id is not None:
+        candidate = candidate.where(candidates.c.id != exclude_id)
+    candidate = (
+        candidate
+        .order_by(candidates.c.open_requests_count, candidates.c.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    return db.session.execute(
+        update(table)
+        .where(table.c.id == candidate)
+        .values(open_requests_count=table.c.open_requests_count)
+        .returning(table.c.id)
+    ).scalar()
+
+
+def pick_representative(exclude_user_id: Optional[int] = None) -> Optional[Representative]:
+    """
+    Least-loaded representative other than `exclude_user_id`. Must be
+    followed by the request insert in the same transaction.
+    """
+    representative_id = _claim_least_loaded(Representative.__table__, exclude_user_id)
+    if representative_id is None:
+        return None
+    return db.session.get(Representative, representative_id)
+
+
+def pick_board() -> Optional[Board]:
+    board_id = _claim_least_loaded(Board.__table__)
+    if board_id is None:
+        return None
+    return db.session.get(Board, board_id)
+
+
+def recount_open_requests() -> None:
+    """Recompute every counter from scratch, e.g. after bulk loads."""
+    for owner_table, request_table, owner_column in (
+        (Representative.__table__, UserRequest.__table__, "receiving_representative_id"),
+        (Board.__table__, RepresentativeRequest.__table__, "board_id"),
+    ):
+        open_count = (
+            select(func.count())
+            .select_from(request_table)
+            .where(request_table.c[owner_column] == owner_table.c.id)
+            .where(request_table.c.closed_at.is_(None))
+            .scalar_subquery()
+        )
+        db.session.execute(update(owner_table).values(open_requests_count=open_count))
+    db.session.commit()
+
+
+routing_cli = AppGroup("requests", help="Maintain request routing state.")
+
+
+@routing_cli.command("recount")
+def recount_command():
+    recount_open_requests()
+    click.echo("Open request counters recomputed.")
+
+
+def init_app(app) -> None:
+    app.cli.add_command(routing_cli)
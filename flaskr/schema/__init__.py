@@ -0,0 +1,222 @@
+import uuid
+from typing import List
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+from flaskr import search
+from flaskr.database import db, CompressedText, Post, RepresentativeRequest, User, UserRequest
+
+
+# Upgrades for databases created before a schema change. New databases get
+# everything from db.create_all(); these commands bring old ones in line
+# without dropping data.
+
+PUBLIC_ID_TABLES = (User.__table__, Post.__table__)
+
+BATCH_SIZE = 5000
+
+
+def ensure_indexes() -> int:
+    """Create every index declared on the models that the database lacks."""
+    created = 0
+    connection = db.session.connection()
+    existing = {
+        name for name in db.session.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index'")
+        ).scalars()
+    }
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                created += 1
+    db.session.commit()
+    return created
+
+
+def ensure_public_id_indexes() -> None:
+    for table in PUBLIC_ID_TABLES:
+        db.session.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{table.name}_alternative_id "
+            f"ON {table.name} (alternative_id)"
+        ))
+    db.session.commit()
+
+
+def convert_public_ids(binary: bool) -> int:
+    """
+    Rewrite every stored alternative_id into the requested representation,
+    in batches of BATCH_SIZE rows per transaction. Returns the number of
+    converted rows; re-running is a no-op.
+    """
+    source_type = "text" if binary else "blob"
+    converted = 0
+
+    for table in PUBLIC_ID_TABLES:
+        while True:
+            rows = db.session.execute(text(
+                f"SELECT id, alternative_id FROM {table.name} "
+                f"WHERE typeof(alternative_id) = :source_type LIMIT :limit"
+            ), {"source_type": source_type, "limit": BATCH_SIZE}).all()
+            if not rows:
+                break
+
+            updates = []
+            for row_id, value in rows:
+                public_id = uuid.UUID(bytes=value) if isinstance(value, bytes) else uuid.UUID(value)
+                updates.append({
+                    "id": row_id,
+                    "value": public_id.bytes if binary else str(public_id)
+                })
+
+            db.session.execute(
+                text(f"UPDATE {table.name} SET alternative_id = :value WHERE id = :id"),
+                updates
+            )
+            db.session.commit()
+            converted += len(updates)
+
+    return converted
+
+
+def ensure_columns(table, names: List[str]) -> List[str]:
+    """
+    Add the (nullable) model columns `names` missing from `table`; returns
+    those added. Their indexes come from ensure_indexes().
+    """
+    existing = {row[1] for row in db.session.execute(text(f"PRAGMA table_info({table.name})"))}
+    added = []
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        column_type = column.type.compile(dialect=db.engine.dialect)
+        db.session.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+        added.append(name)
+    db.session.commit()
+    return added
+
+
+def ensure_preview_column() -> bool:
+    """Add post_table.preview if the database predates it."""
+    return bool(ensure_columns(Post.__table__, ["preview"]))
+
+
+def ensure_request_updated_at() -> int:
+    """
+    Add updated_at to the request tables that predate it, filled with the
+    latest of created_at and closed_at; returns how many were upgraded.
+    """
+    upgraded = 0
+    for table in (UserRequest.__table__, RepresentativeRequest.__table__):
+        if ensure_columns(table, ["updated_at"]):
+            db.session.execute(text(
+                f"UPDATE {table.name} SET updated_at = max(created_at, coalesce(closed_at, created_at))"
+            ))
+            upgraded += 1
+    db.session.commit()
+    return upgraded
+
+
+def convert_post_bodies(compress: bool, threshold: int) -> int:
+    """
+    Fill missing previews and rewrite bodies compressed (those of at least
+    `threshold` bytes) or plain, BATCH_SIZE rows per transaction. The
+    search index is rebuilt afterwards. Returns the number of rewritten rows.
+    """
+    if compress:
+        outdated = "typeof(body) = 'text' AND length(CAST(body AS BLOB)) >= :threshold"
+    else:
+        outdated = "typeof(body) = 'blob'"
+    converted = 0
+
+    # The triggers would index every intermediate state
+    search.drop_index()
+    while True:
+        rows = db.session.execute(text(
+            f"SELECT id, body FROM post_table WHERE preview IS NULL OR ({outdated}) LIMIT :limit"
+        ), {"threshold": threshold, "limit": BATCH_SIZE}).all()
+        if not rows:
+            break
+
+        updates = []
+        for row_id, stored in rows:
+            body = CompressedText.decode(stored)
+            updates.append({
+                "id": row_id,
+                "body": CompressedText.encode(body, compress, threshold),
+                "preview": Post.make_preview(body)
+            })
+        db.session.execute(
+            text("UPDATE post_table SET body = :body, preview = :preview WHERE id = :id"),
+            updates
+        )
+        db.session.commit()
+        converted += len(updates)
+
+    search.rebuild_index()
+    return converted
+
+
+schema_cli = AppGroup("schema", help="Upgrade existing databases in place.")
+
+
+@schema_cli.command("indexes")
+def indexes_command():
+    """Create indexes added to the models since the database was created."""
+    click.echo(f"{ensure_indexes()} indexes created.")
+
+
+@schema_cli.command("requests")
+def requests_command():
+    """Add and fill updated_at on the request tables, and index it."""
+    upgraded = ensure_request_updated_at()
+    created = ensure_indexes()
+    click.echo(f"updated_at added to {upgraded} request tables; {created} indexes created.")
+
+
+@schema_cli.command("public-ids")
+@click.option(
+    "--binary/--text",
+    default=None,
+    help="Storage to convert to. Defaults to the PUBLIC_ID_BINARY setting."
+)
+def public_ids_command(binary):
+    """Index alternative_id columns and convert their storage (app stopped)."""
+    configured = current_app.config["PUBLIC_ID_BINARY"]
+    if binary is None:
+        binary = configured
+    ensure_public_id_indexes()
+    converted = convert_public_ids(binary)
+    click.echo(
+        f"alternative_id indexed; {converted} rows converted to "
+        f"{'16-byte binary' if binary else 'text'}."
+    )
+    if binary != configured:
+        click.echo(f"Remember to set PUBLIC_ID_BINARY={binary} for the application.")
+
+
+@schema_cli.command("post-bodies")
+@click.option(
+    "--compress/--plain",
+    default=None,
+    help="Storage to convert to. Defaults to the POST_BODY_COMPRESSION setting."
+)
+def post_bodies_command(compress):
+    """Add and fill post previews and convert the storage of post bodies."""
+    configured = current_app.config["POST_BODY_COMPRESSION"]
+    if compress is None:
+        compress = configured
+    added = ensure_preview_column()
+    converted = convert_post_bodies(compress, current_app.config["POST_BODY_COMPRESSION_THRESHOLD"])
+    click.echo(
+        f"{'preview column added; ' if added else ''}{converted} posts rewritten "
+        f"{'compressed' if compress else 'plain'}; search index rebuilt."
+    )
+    if compress != configured:
+        click.echo(f"Remember to set POST_BODY_COMPRESSION={compress} for the application.")
+
+
+def init_app(app) -> None:
+    app.cli.add_command(schema_cli)
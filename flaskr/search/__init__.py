@@ -0,0 +1,190 @@
+import click
+from flask.cli import AppGroup
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, event, func, select, table, column, text
+from sqlalchemy.orm import joinedload
+from flaskr.database import db, Post
+
+
+# Full-text index over post_table.title/body.
+#
+# post_search is an external-content FTS5 table: it stores only the inverted
+# index and reads the text back from post_table, so the post bodies are not
+# duplicated. Triggers keep it in sync on every INSERT/UPDATE/DELETE of a
+# post, which covers AddPost, edits and deletions without any view code.
+# Bodies may be stored compressed (CompressedText): the triggers and the
+# post_search_content view read them through post_body().
+
+FTS_TABLE = "post_search"
+CONTENT_VIEW = "post_search_content"
+
+post_search = table(FTS_TABLE, column("rowid"), column(FTS_TABLE))
+
+# Column weights for bm25(): a hit in the title counts more than in the body
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+# Sentinels wrapped around matched terms by snippet(); they are swapped for
+# <mark> tags after the snippet text has been HTML-escaped.
+_HL_START = "\x02"
+_HL_END = "\x03"
+
+_CREATE_STATEMENTS = [
+    f"""
+    CREATE VIEW IF NOT EXISTS {CONTENT_VIEW} AS
+    SELECT id, title, post_body(body) AS body FROM post_table
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, body,
+        content='{CONTENT_VIEW}', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS post_search_ai AFTER INSERT ON post_table BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body)
+        VALUES (new.id, new.title, post_body(new.body));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS post_search_ad AFTER DELETE ON post_table BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body)
+        VALUES ('delete', old.id, old.title, post_body(old.body));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS post_search_au AFTER UPDATE OF title, body ON post_table BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body)
+        VALUES ('delete', old.id, old.title, post_body(old.body));
+        INSERT INTO {FTS_TABLE}(rowid, title, body)
+        VALUES (new.id, new.title, post_body(new.body));
+    END
+    """,
+]
+
+_DROP_STATEMENTS = [
+    "DROP TRIGGER IF EXISTS post_search_ai",
+    "DROP TRIGGER IF EXISTS post_search_ad",
+    "DROP TRIGGER IF EXISTS post_search_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+    f"DROP VIEW IF EXISTS {CONTENT_VIEW}",
+]
+
+
+for statement in _CREATE_STATEMENTS:
+    event.listen(
+        Post.__table__, "after_create",
+        DDL(statement).execute_if(dialect="sqlite")
+    )
+
+for statement in _DROP_STATEMENTS:
+    event.listen(
+        Post.__table__, "before_drop",
+        DDL(statement).execute_if(dialect="sqlite")
+    )
+
+
+def create_index() -> None:
+    for statement in _CREATE_STATEMENTS:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def drop_triggers() -> None:
+    """
+    Stop per-row index maintenance, e.g. for a bulk load. The index is
+    stale until rebuild_index(), which also restores the triggers.
+    """
+    for statement in _DROP_STATEMENTS:
+        if statement.startswith("DROP TRIGGER"):
+            db.session.execute(text(statement))
+    db.session.commit()
+
+
+def drop_index() -> None:
+    """Drop the index, its triggers and its content view."""
+    for statement in _DROP_STATEMENTS:
+        db.session.execute(text(statement))
+    db.session.commit()
+
+
+def rebuild_index() -> None:
+    """Create the index if missing and repopulate it from post_table."""
+    create_index()
+    db.session.execute(
+        text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    )
+    db.session.execute(
+        text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    )
+    db.session.commit()
+
+
+def build_match_query(user_query: str) -> str:
+    """
+    Turn free text into a safe FTS5 query: every word becomes a quoted
+    phrase (so operators and punctuation in user input cannot raise syntax
+    errors) and all words must match. The last word is prefix-matched.
+    """
+    terms = [
+        '"' + term.replace('"', '""') + '"'
+        for term in user_query.split()
+    ]
+    if not terms:
+        return ""
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def highlight(snippet: str) -> Markup:
+    return Markup(
+        str(escape(snippet))
+        .replace(_HL_START, "<mark>")
+        .replace(_HL_END, "</mark>")
+    )
+
+
+def search_posts(user_query: str, viewer, limit: int, offset: int = 0):
+    """
+    Return [(post, snippet)] best-first for the posts visible to `viewer`,
+    plus a flag telling whether more results follow.
+    """
+    match_query = build_match_query(user_query)
+    if not match_query:
+        return [], False
+
+    rank = func.bm25(text(FTS_TABLE), TITLE_WEIGHT, BODY_WEIGHT).label("rank")
+    snippet = func.snippet(
+        text(FTS_TABLE), 1, _HL_START, _HL_END, "…", 16
+    ).label("snippet")
+
+    query = (
+        select(Post, snippet)
+        .join(post_search, post_search.c.rowid == Post.id)
+        .where(post_search.c[FTS_TABLE].match(match_query))
+        .where((Post.private == False) | (Post.original_author_id == viewer.id))
+        .options(
+            joinedload(Post.original_author),
+            joinedload(Post.post_type)
+        )
+        .order_by(rank, Post.id)
+        .limit(limit + 1)
+        .offset(offset)
+    )
+
+    rows = db.session.execute(query).all()
+    return [(post, highlight(snip)) for post, snip in rows[:limit]], len(rows) > limit
+
+
+search_cli = AppGroup("search", help="Manage the post full-text index.")
+
+
+@search_cli.command("rebuild")
+def rebuild_command():
+    rebuild_index()
+    click.echo("Post search index rebuilt.")
+
+
+def init_app(app) -> None:
+    app.cli.add_command(search_cli)
@@ -0,0 +1,144 @@
+from collections import defaultdict
+from typing import Iterable, List, Optional
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, event, func, select
+from sqlalchemy.dialects.sqlite import insert
+from flaskr.database import db, Post, User, UserStatistics
+
+
+# Per-user post statistics.
+#
+# user_statistics_table holds one row of counters per author. Mapper events
+# on Post apply the difference between a post's old and new state as a
+# single upsert on the flush connection, so the counters change in the same
+# transaction as the post itself (create, confirm, privatise, delete or
+# change of author). Reading a profile's statistics is then a primary key
+# lookup instead of loading every post of the user. Bulk writers that skip
+# the ORM call count_inserted_posts() in their own transaction.
+
+COUNTERS = (
+    "publications",
+    "public_publications",
+    "confirmed_for_deployment",
+    "confirmed_for_insights"
+)
+
+
+def _contribution(private: bool, deployment: bool, insights: bool) -> dict:
+    return {
+        "publications": 1,
+        "public_publications": int(not private),
+        "confirmed_for_deployment": int(bool(deployment)),
+        "confirmed_for_insights": int(bool(insights))
+    }
+
+
+def _add(connection, rows: List[dict]) -> None:
+    # Rows of user_id and counter deltas, added to the existing counters
+    table = UserStatistics.__table__
+    statement = insert(table)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={key: table.c[key] + statement.excluded[key] for key in COUNTERS}
+        ),
+        rows
+    )
+
+
+def _apply(connection, user_id: Optional[int], delta: dict, sign: int = 1) -> None:
+    if user_id is None:
+        return
+    _add(connection, [{"user_id": user_id, **{key: sign * delta[key] for key in COUNTERS}}])
+
+
+def _current(post: Post) -> dict:
+    return _contribution(post.private, post.confirmed_for_deployment, post.confirmed_for_insights)
+
+
+def _before_change(post: Post) -> dict:
+    return _contribution(
+        post.previous("private"),
+        post.previous("confirmed_for_deployment"),
+        post.previous("confirmed_for_insights")
+    )
+
+
+@event.listens_for(Post, "after_insert")
+def _post_inserted(mapper, connection, post):
+    _apply(connection, post.original_author_id, _current(post))
+
+
+@event.listens_for(Post, "after_delete")
+def _post_deleted(mapper, connection, post):
+    _apply(connection, post.original_author_id, _current(post), -1)
+
+
+@event.listens_for(Post, "after_update")
+def _post_updated(mapper, connection, post):
+    old_author, new_author = post.previous("original_author_id"), post.original_author_id
+    old, new = _before_change(post), _current(post)
+    if old_author == new_author and old == new:
+        return
+    _apply(connection, old_author, old, -1)
+    _apply(connection, new_author, new)
+
+
+def count_inserted_posts(posts: Iterable[dict]) -> None:
+    """
+    Add post rows written without the ORM (dicts of post_table columns) to
+    their authors' counters: one upsert per author, in the session's
+    transaction.
+    """
+    deltas = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for post in posts:
+        contribution = _contribution(
+            post.get("private", False),
+            post.get("confirmed_for_deployment", False),
+            post.get("confirmed_for_insights", False)
+        )
+        for key in COUNTERS:
+            deltas[post["original_author_id"]][key] += contribution[key]
+    if deltas:
+        _add(db.session.connection(), [{"user_id": user_id, **delta} for user_id, delta in deltas.items()])
+
+
+def get_statistics(user: User) -> dict:
+    return counters(db.session.get(UserStatistics, user.id))
+
+
+def counters(stats: Optional[UserStatistics]) -> dict:
+    return {key: getattr(stats, key) if stats else 0 for key in COUNTERS}
+
+
+def recount_statistics() -> None:
+    """Rebuild every user's counters from post_table, e.g. after bulk loads."""
+    table = UserStatistics.__table__
+    db.session.execute(table.delete())
+    db.session.execute(
+        insert(table).from_select(
+            ["user_id", *COUNTERS],
+            select(
+                Post.original_author_id,
+                func.count(),
+                func.sum(case((Post.private == False, 1), else_=0)),
+                func.sum(case((Post.confirmed_for_deployment == True, 1), else_=0)),
+                func.sum(case((Post.confirmed_for_insights == True, 1), else_=0))
+            ).group_by(Post.original_author_id)
+        )
+    )
+    db.session.commit()
+
+
+statistics_cli = AppGroup("stats", help="Maintain per-user statistics.")
+
+
+@statistics_cli.command("recount")
+def recount_command():
+    recount_statistics()
+    click.echo("User statistics recomputed.")
+
+
+def init_app(app) -> None:
+    app.cli.add_command(statistics_cli)
@@ -0,0 +1,163 @@
+import os
+import random
+import sqlite3
+import time
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import make_url
+from flaskr.database import db
+from flaskr.utils import PeriodicTask
+
+
+# SQLite storage profile.
+#
+# Every new DBAPI connection gets the SQLITE_* pragmas: WAL lets readers run
+# alongside the single writer, synchronous=NORMAL is durable across crashes
+# of the application in WAL mode (only a power loss can drop the last
+# commits), and busy_timeout makes a locked writer wait instead of failing.
+# A statement that is still refused after the timeout is retried a few
+# times with jittered backoff before the error reaches the view.
+#
+# File databases use a QueuePool sized by SQLITE_POOL_SIZE/_OVERFLOW; pooled
+# connections are never reused across a fork (pre-forking servers).
+#
+# Maintenance (passive WAL checkpoint + PRAGMA optimize) runs every
+# SQLITE_MAINTENANCE_INTERVAL seconds from a PeriodicTask in each serving
+# process; `flask storage maintain --analyze` does a full pass for cron.
+
+_BUSY_MESSAGES = ("database is locked", "database table is locked")
+
+
+def is_file_database(uri: str) -> bool:
+    url = make_url(uri)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def configure(app) -> None:
+    """Engine options; must run before db.init_app() creates the engine."""
+    if not is_file_database(app.config["SQLALCHEMY_DATABASE_URI"]):
+        return
+    options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+    options.setdefault("pool_size", app.config["SQLITE_POOL_SIZE"])
+    options.setdefault("max_overflow", app.config["SQLITE_POOL_OVERFLOW"])
+    options.setdefault("pool_timeout", app.config["SQLITE_POOL_TIMEOUT"])
+
+
+def _pragmas(config) -> list:
+    return [
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA cache_size = {int(config['SQLITE_CACHE_SIZE'])}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA temp_store = {config['SQLITE_TEMP_STORE']}",
+    ]
+
+
+def is_busy(error: Exception) -> bool:
+    return isinstance(error, sqlite3.OperationalError) and str(error) in _BUSY_MESSAGES
+
+
+def _retrying(execute, retries: int, backoff: float):
+    for attempt in range(retries + 1):
+        try:
+            return execute()
+        except sqlite3.OperationalError as error:
+            if attempt == retries or not is_busy(error):
+                raise
+            time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+
+
+def install_profile(engine, config) -> None:
+    pragmas = _pragmas(config)
+    retries = config["SQLITE_BUSY_RETRIES"]
+    backoff = config["SQLITE_BUSY_BACKOFF"]
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        connection_record.info["pid"] = os.getpid()
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        # Connection inherited from the parent process: let the pool replace it
+        if connection_record.info["pid"] != os.getpid():
+            connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+            raise exc.DisconnectionError("Connection belongs to another process.")
+
+    @event.listens_for(engine, "do_execute")
+    def _do_execute(cursor, statement, parameters, context):
+        _retrying(lambda: cursor.execute(statement, parameters), retries, backoff)
+        return True
+
+    @event.listens_for(engine, "do_execute_no_params")
+    def _do_execute_no_params(cursor, statement, context):
+        _retrying(lambda: cursor.execute(statement), retries, backoff)
+        return True
+
+    @event.listens_for(engine, "do_executemany")
+    def _do_executemany(cursor, statement, parameters, context):
+        _retrying(lambda: cursor.executemany(statement, parameters), retries, backoff)
+        return True
+
+
+def maintain(analyze: bool = False) -> dict:
+    """
+    Checkpoint the WAL and refresh planner statistics. PRAGMA optimize only
+    re-analyzes tables whose statistics are stale; analyze=True runs a full
+    ANALYZE first. Safe to run while the application is serving.
+    """
+    report = {}
+    with db.engine.connect() as connection:
+        if analyze:
+            connection.execute(text("ANALYZE"))
+        connection.execute(text("PRAGMA optimize"))
+        busy, log_frames, checkpointed = connection.execute(
+            text("PRAGMA wal_checkpoint(PASSIVE)")
+        ).one()
+        connection.commit()
+    report["wal_frames"] = log_frames
+    report["checkpointed_frames"] = checkpointed
+    report["checkpoint_blocked"] = bool(busy)
+    return report
+
+
+storage_cli = AppGroup("storage", help="SQLite storage maintenance.")
+
+
+@storage_cli.command("maintain")
+@click.option("--analyze", is_flag=True, help="Run a full ANALYZE before PRAGMA optimize.")
+def maintain_command(analyze):
+    report = maintain(analyze)
+    click.echo(
+        f"Checkpointed {report['checkpointed_frames']}/{report['wal_frames']} WAL frames"
+        f"{' (readers still active)' if report['checkpoint_blocked'] else ''}; statistics refreshed."
+    )
+
+
+@storage_cli.command("pragmas")
+def pragmas_command():
+    """Show the pragmas in effect on a pooled connection."""
+    with db.engine.connect() as connection:
+        for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size",
+                     "mmap_size", "temp_store"):
+            value = connection.execute(text(f"PRAGMA {name}")).scalar()
+            click.echo(f"{name} = {value}")
+
+
+def init_app(app) -> None:
+    with app.app_context():
+        for engine in db.engines.values():
+            install_profile(engine, app.config)
+
+    app.cli.add_command(storage_cli)
+
+    interval = app.config["SQLITE_MAINTENANCE_INTERVAL"]
+    if interval and is_file_database(app.config["SQLALCHEMY_DATABASE_URI"]):
+        maintenance = PeriodicTask(app, interval, maintain, "sqlite-maintenance")
+        app.extensions["sqlite_maintenance"] = maintenance
+        app.before_request(maintenance.ensure_started)
@@ -1,7 +1,11 @@
-from flask import Blueprint, render_template, redirect
+from flask import Blueprint, abort, render_template, redirect
 from flask_login import login_required, current_user
 from sqlalchemy import select
-from flaskr.database import db, User, Post, PostType
+from flaskr.database import db, User, UserStatistics
+from flaskr.reference import reference_data
+from flaskr.statistics import counters
+from flaskr.replicas import reads_from_replica
+from flaskr import conditional
 
 
 users_bp = Blueprint("users", __name__, url_prefix="/users")
@@ -9,34 +13,43 @@ users_bp = Blueprint("users", __name__, url_prefix="/users")
 
 @users_bp.route("/<string:alternative_id>")
 @login_required
+@reads_from_replica
 def UserProfile(alternative_id: str):
-    user: User = db.one_or_404(
-        db.select(User).filter_by(alternative_id=alternative_id)
+    row = db.session.execute(profile_query(alternative_id)).first()
+    if row is None:
+        abort(404)
+
+    user, user_statistics = row
+    context = profile_context(user, counters(user_statistics))
+    # The user row and counters are all the page shows: the context is its
+    # own validator, and a 304 skips the template
+    cached = conditional.not_modified((context,))
+    if cached is not None:
+        return cached
+    return render_template("profile.html", **context)
+
+
+def profile_query(alternative_id: str):
+    return (
+        select(User, UserStatistics)
+        .outerjoin(UserStatistics, UserStatistics.user_id == User.id)
+        .filter(User.alternative_id == alternative_id)
     )
 
-    user_short_data = user.get_short_info()
 
-    post_types = [
-        post_type.name 
-        for post_type in db.session.execute(
-            db.select(PostType)
-        ).scalars().all()
-    ]
-
-    confirmed_for_deployment_count = len([True for post in user.authored_posts if post.confirmed_for_deployment])
-    confirmed_for_insights_count = len([1 for post in user.authored_posts if post.confirmed_for_insights])
-
-    authored_posts_count = len(user.authored_posts) if current_user == user else len(db.session.execute(select(Post).filter_by(private=False)).scalars().all())
-    statistics = {
-        "publications": authored_posts_count,
-        "confirmed_for_deployment": confirmed_for_deployment_count,
-        "confirmed_for_insights": confirmed_for_insights_count
+def profile_context(user: User, user_statistics: dict) -> dict:
+    is_this_current_user = current_user.id == user.id
+    return {
+        "user_short_data": user.get_short_info(),
+        "post_types": [post_type["name"] for post_type in reference_data().post_types],
+        "statistics": {
+            "publications": (
+                user_statistics["publications"]
+                if is_this_current_user
+                else user_statistics["public_publications"]
+            ),
+            "confirmed_for_deployment": user_statistics["confirmed_for_deployment"],
+            "confirmed_for_insights": user_statistics["confirmed_for_insights"]
+        },
+        "is_this_current_user": is_this_current_user
     }
-    is_this_current_user = current_user.alternative_id == alternative_id
-    return render_template(
-        "profile.html", 
-        user_short_data=user_short_data, 
-        post_types=post_types, 
-        statistics=statistics,
-        is_this_current_user=is_this_current_user
-    )
@@ -1,4 +1,79 @@
+import base64
+import os
+import random
+import threading
+from datetime import datetime
+from typing import Optional, Tuple
+
+
 def validate_string(value: str) -> bool:
     if not (value and isinstance(value, str) and len(value) > 4):
         return False
     return True
+
+
+# Keyset pagination cursors: an opaque, url-safe token holding the
+# (created_at, id) pair of the boundary row of a page.
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        return None
+
+
+def parse_page_size(value: Optional[str], default: int, maximum: int) -> int:
+    if value is None or not value.isdigit():
+        return default
+    return max(1, min(int(value), maximum))
+
+
+class PeriodicTask:
+    """
+    Runs `task` in an app context every `interval` seconds (with jitter) on a
+    daemon thread. The thread is started by the first request of each
+    serving process, so pre-forking servers get one per worker. `wake()`
+    runs it early.
+    """
+
+    def __init__(self, app, interval: float, task, name: str):
+        self.app = app
+        self.interval = interval
+        self.task = task
+        self.name = name
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def wake(self) -> None:
+        self.ensure_started()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval * (0.9 + 0.2 * random.random()))
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    self.task()
+                except Exception:
+                    # Keep the thread alive; the next run may succeed
+                    self.app.logger.exception("%s failed", self.name)
@@ -0,0 +1,227 @@
+import atexit
+import threading
+from collections import defaultdict
+from typing import Dict, Set, Tuple
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, exists, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError
+from flaskr.database import (
+    db,
+    Post,
+    PostComment,
+    post_comment_vote_table,
+    post_vote_table
+)
+from flaskr.utils import PeriodicTask
+
+
+# Write-behind upvotes.
+#
+# A click only records (user, target) in this process's buffer. Every
+# VOTES_FLUSH_INTERVAL seconds (or as soon as VOTES_MAX_PENDING votes are
+# buffered) the flusher thread writes the buffer in one transaction:
+#
+#   1. INSERT ... ON CONFLICT DO NOTHING RETURNING into the vote tables,
+#      whose primary key (user, target) makes a vote count once even
+#      across processes;
+#   2. one UPDATE per target for the votes that were actually new, so a
+#      hot post costs one row write per flush instead of one per click.
+#
+# The flush writes on a connection of its own, never through a request's
+# session, and never on the request thread that filled the buffer: it
+# neither commits that request's changes nor waits for its locks. It also
+# leaves updated_at alone (a vote is not an edit: exports, validators and
+# cached fragments key on that column). Counts shown to users add the
+# votes still buffered or being written by this process. A crash loses at
+# most one interval of votes.
+
+POST = "post"
+COMMENT = "comment"
+
+_TARGETS = {
+    POST: (Post, post_vote_table, post_vote_table.c.post_id),
+    COMMENT: (PostComment, post_comment_vote_table, post_comment_vote_table.c.comment_id),
+}
+
+Votes = Dict[Tuple[str, int], Set[int]]
+
+
+class VoteBuffer:
+
+    def __init__(self, max_pending: int, on_full=None):
+        self.max_pending = max_pending
+        # Called instead of flush() once max_pending votes are buffered
+        self.on_full = on_full or self.flush
+        self._pending: Votes = defaultdict(set)
+        self._in_flight: Votes = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, kind: str, target_id: int, user_id: int) -> bool:
+        """Buffer a vote; False if this process already holds it."""
+        key = (kind, target_id)
+        with self._lock:
+            if user_id in self._pending[key] or user_id in self._in_flight.get(key, ()):
+                return False
+            self._pending[key].add(user_id)
+            self._size += 1
+            full = self._size >= self.max_pending
+        if full:
+            self.on_full()
+        return True
+
+    def holds(self, kind: str, target_id: int, user_id: int) -> bool:
+        key = (kind, target_id)
+        with self._lock:
+            return user_id in self._pending.get(key, ()) or user_id in self._in_flight.get(key, ())
+
+    def pending(self, kind: str, target_id: int) -> int:
+        key = (kind, target_id)
+        with self._lock:
+            return len(self._pending.get(key, ())) + len(self._in_flight.get(key, ()))
+
+    def pending_total(self, kind: str) -> int:
+        with self._lock:
+            return sum(
+                len(user_ids)
+                for votes in (self._pending, self._in_flight)
+                for (vote_kind, _), user_ids in votes.items() if vote_kind == kind
+            )
+
+    def flush(self) -> int:
+        """Write the buffered votes; returns how many were new."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._size:
+                    return 0
+                self._in_flight, self._pending = self._pending, defaultdict(set)
+                self._size = 0
+
+            try:
+                written = _write(self._in_flight)
+            except SQLAlchemyError:
+                with self._lock:
+                    # Keep them for the next flush
+                    for key, user_ids in self._in_flight.items():
+                        self._pending[key] |= user_ids
+                        self._size += len(user_ids)
+                    self._in_flight = {}
+                raise
+
+            with self._lock:
+                self._in_flight = {}
+            return written
+
+
+def _write(votes: Votes) -> int:
+    with db.engine.begin() as connection:
+        return _write_on(connection, votes)
+
+
+def _write_on(connection, votes: Votes) -> int:
+    written = 0
+    for kind, (model, table, target_column) in _TARGETS.items():
+        rows = [
+            {"user_id": user_id, target_column.key: target_id}
+            for (vote_kind, target_id), user_ids in votes.items() if vote_kind == kind
+            for user_id in user_ids
+        ]
+        if not rows:
+            continue
+
+        new_votes = connection.execute(
+            insert(table).on_conflict_do_nothing().returning(target_column),
+            rows
+        ).scalars().all()
+
+        deltas = defaultdict(int)
+        for target_id in new_votes:
+            deltas[target_id] += 1
+        if deltas:
+            columns = model.__table__.c
+            values = {"upvotes": columns.upvotes + bindparam("delta")}
+            if "updated_at" in columns:
+                # Otherwise its onupdate would stamp the time of the flush
+                values["updated_at"] = columns.updated_at
+            connection.execute(
+                update(model.__table__)
+                .where(columns.id == bindparam("target_id"))
+                .values(**values),
+                [{"target_id": target_id, "delta": delta} for target_id, delta in deltas.items()]
+            )
+        written += len(new_votes)
+    return written
+
+
+def _buffer() -> VoteBuffer:
+    return current_app.extensions["votes"]
+
+
+def upvote(kind: str, target_id: int, user_id: int) -> bool:
+    """Record an upvote; False if the user already voted for the target."""
+    _, table, target_column = _TARGETS[kind]
+    buffer = _buffer()
+    if buffer.holds(kind, target_id, user_id):
+        return False
+    already_voted = db.session.execute(
+        select(exists().where(table.c.user_id == user_id, target_column == target_id))
+    ).scalar()
+    if already_voted:
+        return False
+    return buffer.add(kind, target_id, user_id)
+
+
+def upvotes(kind: str, target_id: int, stored: int) -> int:
+    """`stored` (the counter column) plus the votes not written yet."""
+    return stored + _buffer().pending(kind, target_id)
+
+
+def pending_total(kind: str) -> int:
+    """Votes of `kind` this process has not written yet."""
+    return _buffer().pending_total(kind)
+
+
+def flush() -> int:
+    return _buffer().flush()
+
+
+def recount_upvotes() -> None:
+    """Rebuild the counter columns from the vote tables."""
+    for model, table, target_column in _TARGETS.values():
+        db.session.execute(
+            update(model.__table__).values(
+                upvotes=select(func.count())
+                .where(target_column == model.__table__.c.id)
+                .scalar_subquery()
+            )
+        )
+    db.session.commit()
+
+
+votes_cli = AppGroup("votes", help="Maintain upvote counters.")
+
+
+@votes_cli.command("recount")
+def recount_command():
+    recount_upvotes()
+    click.echo("Upvote counters rebuilt.")
+
+
+def init_app(app) -> None:
+    buffer = VoteBuffer(app.config["VOTES_MAX_PENDING"])
+    app.extensions["votes"] = buffer
+    app.cli.add_command(votes_cli)
+
+    def _flush():
+        with app.app_context():
+            buffer.flush()
+
+    flusher = PeriodicTask(app, app.config["VOTES_FLUSH_INTERVAL"], buffer.flush, "votes-flush")
+    buffer.on_full = flusher.wake
+    app.extensions["votes_flush"] = flusher
+    app.before_request(flusher.ensure_started)
+    atexit.register(_flush)
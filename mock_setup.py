@@ -2,6 +2,7 @@ from typing import List
 from flaskr import create_app
 from flaskr.database import (
     db,
+    Base,
     Board,
     User,
     PostCategory,
@@ -81,7 +82,6 @@ def setup() -> None:
         
         # Create board
         board = Board()
-        board.insert()
         
         # Create roles
             
@@ -89,38 +89,38 @@ def setup() -> None:
         
         # Create users and their specialized types
         
+        accounts = []
+
         for user_data_index in range(len(regular_users)):
             user_dict = dict(zip(fields, regular_users[user_data_index]))
             user = User(**user_dict)
             user.set_password(reg_passwds[user_data_index])
-            user.insert()
+            accounts.append(user)
 
 
         for repr_data_index in range(len(reprs)):
             repr_dict = dict(zip(fields, reprs[repr_data_index]))
             repr = Representative(**repr_dict)
             repr.set_password(repr_passwds[repr_data_index])
-            repr.insert()
+            accounts.append(repr)
 
         
         for bmember_data_index in range(len(board_members)):
             bmember_dict = dict(zip(fields, board_members[bmember_data_index]))
             bmb = BoardMember(**bmember_dict, board=board)
             bmb.set_password(board_passwds[bmember_data_index])
-            bmb.insert()
+            accounts.append(bmb)
+
+        # Board and accounts in one flush and one commit
+        Base.insert_all([board, *accounts])
         
 
         # Create post types
-        for post_type in post_types:
-            db_ptype = PostType(name=post_type)
-            db_ptype.insert()
+        PostType.insert_rows([{"name": post_type} for post_type in post_types])
             
         # Create categories
-        for post_category in categories:
-            db_ctype = PostCategory(name=post_category)
-            db_ctype.insert()
+        PostCategory.insert_rows([{"name": post_category} for post_category in categories])
 
 
 if __name__ == "__main__":
     setup()
-    
\ No newline at end of file
@@ -0,0 +1,40 @@
+import pytest
+from flaskr import create_app
+from flaskr.database import db, PostType, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+        "RELATED_INDEX_PATH": str(tmp_path / "related"),
+        "FRAGMENT_CACHE": None,
+        "VOTES_FLUSH_INTERVAL": 3600,
+        "SQLITE_MAINTENANCE_INTERVAL": 0,
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def make_user(username: str, cls=User, **columns) -> User:
+    user = cls(
+        full_name=username.title(),
+        username=username,
+        email=f"{username}@example.com",
+        profession="Tester",
+        password_hash="-",
+        **columns
+    )
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def make_post_type(name: str = "Issues") -> PostType:
+    post_type = PostType(name=name)
+    db.session.add(post_type)
+    db.session.commit()
+    return post_type
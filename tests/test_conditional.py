@@ -0,0 +1,35 @@
+from flaskr.conditional import PostStamp, post_stamp_query
+from flaskr.database import db, Post, PostComment, PostDiscussion
+from conftest import make_post_type, make_user
+
+
+def _stamp(post: Post) -> PostStamp:
+    return PostStamp(*db.session.execute(post_stamp_query(post.alternative_id)).one())
+
+
+def test_replacing_the_newest_comment_changes_the_stamp(app):
+    author = make_user("author")
+    post = Post(
+        title="A post title",
+        body="A body long enough to be a post body, well over fifty characters.",
+        post_type_id=make_post_type().id,
+        original_author=author
+    )
+    db.session.add_all([post, PostDiscussion(post=post)])
+    db.session.commit()
+
+    comment = PostComment(text="First", post_discussion=post.post_discussion, author=author)
+    db.session.add(comment)
+    db.session.commit()
+    comment_id, before = comment.id, _stamp(post)
+    assert before == PostStamp.of(post)
+
+    db.session.delete(comment)
+    db.session.commit()
+    # SQLite hands the freed id to the next comment
+    replacement = PostComment(text="Second", post_discussion=post.post_discussion, author=author)
+    db.session.add(replacement)
+    db.session.commit()
+
+    assert replacement.id == comment_id
+    assert _stamp(post).validator() != before.validator()
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import IntegrityError
+from flaskr.database import db, Base, PostType, User
+from conftest import make_user
+
+
+def _user(username) -> User:
+    return User(full_name=username.title(), username=username, email=f"{username}@example.com",
+                profession="Tester", password_hash="-")
+
+
+def _row(username) -> dict:
+    return {"full_name": username.title(), "username": username, "email": f"{username}@example.com",
+            "profession": "Tester", "password_hash": "-"}
+
+
+def _count(model) -> int:
+    return db.session.scalar(select(func.count()).select_from(model))
+
+
+@pytest.fixture
+def recorded():
+    calls = []
+    session = db.session()
+    listeners = [
+        (session, "after_flush", lambda *args: calls.append("flush")),
+        (session, "after_commit", lambda *args: calls.append("commit")),
+        (db.engine, "before_cursor_execute",
+         lambda conn, cursor, statement, *args: calls.append(statement.split()[0])),
+    ]
+    for target, name, listener in listeners:
+        event.listen(target, name, listener)
+    yield calls
+    for target, name, listener in listeners:
+        event.remove(target, name, listener)
+
+
+def test_insert_all_writes_a_batch_in_one_flush_and_commit(app, recorded):
+    users = [_user(f"member{number}") for number in range(5)]
+    ids = Base.insert_all([PostType(name="Issues"), *users])
+
+    assert recorded == ["INSERT"] * 6 + ["flush", "commit"]
+    assert ids[1:] == [user.id for user in users]
+    assert _count(User) == 5
+
+
+def test_insert_rows_writes_a_batch_in_one_commit(app, recorded):
+    ids = PostType.insert_rows([{"name": f"Type {number}"} for number in range(5)])
+
+    assert recorded == ["INSERT"] * 5 + ["commit"]
+    assert db.session.scalars(select(PostType.name).order_by(PostType.id)).all() == [
+        f"Type {number}" for number in range(5)
+    ]
+    assert ids == sorted(ids)
+
+
+def test_a_failing_row_rolls_the_whole_batch_back(app):
+    make_user("taken")
+
+    with pytest.raises(IntegrityError):
+        Base.insert_all([PostType(name="Issues"), _user("first"), _user("taken")])
+    db.session.rollback()
+    with pytest.raises(IntegrityError):
+        User.insert_rows([_row("second"), _row("taken")])
+    db.session.rollback()
+
+    assert _count(PostType) == 0
+    assert db.session.scalars(select(User.username)).all() == ["taken"]
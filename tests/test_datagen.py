@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import text
+from flaskr import datagen, related
+from flaskr.database import db
+
+SIZES = dict(users=20, representatives=2, boards=1, board_members=3, posts=40, comments=60,
+             links=8, requests=4, batch_size=16)
+
+
+def _triggers():
+    return set(db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'post_search_%'")
+    ).scalars())
+
+
+def test_generate_rebuilds_the_derived_indexes(app):
+    datagen.generate(**SIZES, password="secret")
+    assert _triggers() == {"post_search_ai", "post_search_ad", "post_search_au"}
+    assert related._index().meta()["documents"] == SIZES["posts"]
+
+
+def test_a_failed_load_restores_the_search_triggers(app, monkeypatch):
+    def fail(self, table, rows, label):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(datagen.Generator, "insert", fail)
+    with pytest.raises(RuntimeError):
+        datagen.generate(**SIZES, password="secret")
+    assert _triggers() == {"post_search_ai", "post_search_ad", "post_search_au"}
@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+from flaskr.database import db, Post, Representative, UserRequest
+from flaskr.export import export_requests, parse_since
+from conftest import make_post_type, make_user
+
+
+def test_since_is_compared_as_naive_utc():
+    assert parse_since("2024-05-01T12:00:00+02:00") == datetime(2024, 5, 1, 10, 0)
+    assert parse_since("2024-05-01T12:00:00") == datetime(2024, 5, 1, 12, 0)
+    assert parse_since("") is None
+
+
+def _request(caller, representative, post_type) -> UserRequest:
+    post = Post(
+        title="A post title",
+        body="A body long enough to be a post body, well over fifty characters.",
+        post_type_id=post_type.id,
+        original_author=caller
+    )
+    db.session.add(post)
+    db.session.add(UserRequest(calling_user=caller, receiving_representative_id=representative.id, request_object=post))
+    db.session.commit()
+    return post.outgoing_request
+
+
+def test_requests_created_or_confirmed_after_a_watermark_are_exported(app):
+    caller, representative = make_user("caller"), make_user("rep", Representative)
+    post_type = make_post_type()
+    confirmed = _request(caller, representative, post_type)
+    _request(caller, representative, post_type)
+    watermark = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    created = _request(caller, representative, post_type)
+    confirmed.confirmed = True
+    db.session.commit()
+
+    exported = [record["id"] for chunk in export_requests(watermark, 100) for record in chunk]
+    assert sorted(exported) == sorted([created.id, confirmed.id])
@@ -0,0 +1,51 @@
+from flask_login import login_user
+from sqlalchemy import update
+from flaskr import fragments
+from flaskr.database import db, Post, PostCategory, PostComment, PostDiscussion
+from conftest import make_post_type, make_user
+
+
+def _post(author) -> Post:
+    category = PostCategory(name="Roads")
+    post = Post(
+        title="A post title",
+        body="A body long enough to be a post body, well over fifty characters.",
+        post_type_id=make_post_type().id,
+        original_author=author,
+        post_categories=[category]
+    )
+    db.session.add_all([post, PostDiscussion(post=post)])
+    db.session.commit()
+    return post
+
+
+def test_fragments_follow_writes_the_store_was_not_told_about(app):
+    cache = fragments.FragmentCache(fragments.MemoryStore(100))
+    author = make_user("author")
+    post = _post(author)
+    comment = PostComment(text="First", post_discussion=post.post_discussion, author=author)
+    db.session.add(comment)
+    db.session.commit()
+
+    with app.test_request_context():
+        login_user(author)
+        app.extensions["fragment_cache"] = cache
+        assert "Roads" in fragments.post_card(post)
+        assert "First" in fragments.comment_thread(post, lambda: f"<p>{comment.text}</p>")
+
+        # As if another worker committed: no invalidation reaches this store
+        del app.extensions["fragment_cache"]
+        db.session.execute(update(PostCategory).values(name="Bridges"))
+        comment_id = comment.id
+        db.session.delete(comment)
+        db.session.commit()
+        replacement = PostComment(text="Second", post_discussion=post.post_discussion, author=author)
+        db.session.add(replacement)
+        db.session.commit()
+        assert replacement.id == comment_id
+
+        app.extensions["fragment_cache"] = cache
+        assert "Bridges" in fragments.post_card(post)
+        assert "Second" in fragments.comment_thread(post, lambda: f"<p>{replacement.text}</p>")
+
+    assert cache.stats()["kinds"]["card"]["hits"] == 0
@@ -0,0 +1,80 @@
+import pytest
+from flaskr import graph
+from flaskr.database import db, Post, PostType
+from flaskr.graph import AdjacencyIndex, neighbourhood
+from conftest import make_user
+
+
+@pytest.fixture
+def chain(app):
+    """issue -> hidden (private, another author's) -> solution, and issue -> other -> solution2."""
+    viewer, other = make_user("viewer"), make_user("other")
+    issues, solutions = PostType(name="Issues"), PostType(name="Solutions")
+    db.session.add_all([issues, solutions])
+    db.session.commit()
+
+    def post(title, post_type, author, **columns):
+        return Post(
+            title=title,
+            body="A body long enough to be a post body, well over fifty characters.",
+            post_type=post_type,
+            original_author=author,
+            **columns
+        )
+
+    posts = {
+        "issue": post("The starting issue", issues, viewer),
+        "hidden": post("A private issue", issues, other, private=True),
+        "solution": post("Behind the private one", solutions, other),
+        "step": post("A public issue", issues, other),
+        "solution2": post("Behind the public one", solutions, other),
+    }
+    posts["issue"].linked_posts = [posts["hidden"], posts["step"]]
+    posts["hidden"].linked_posts = [posts["solution"]]
+    posts["step"].linked_posts = [posts["solution2"]]
+    db.session.add_all(posts.values())
+    db.session.commit()
+    return viewer, solutions, {name: post.id for name, post in posts.items()}
+
+
+def test_the_walk_neither_returns_nor_passes_private_posts(chain):
+    viewer, solutions, ids = chain
+    assert neighbourhood(ids["issue"], 3, viewer_id=viewer.id) == [
+        (ids["step"], 1), (ids["solution2"], 2)
+    ]
+    assert neighbourhood(ids["issue"], 3, viewer_id=viewer.id, post_type_ids={solutions.id}) == [
+        (ids["solution2"], 2)
+    ]
+
+
+def test_the_index_walk_follows_privacy_changes(app, chain):
+    viewer, solutions, ids = chain
+    index = app.extensions["graph_index"] = AdjacencyIndex(ttl=300, max_overlay=100)
+    assert sorted(index.reachable(ids["issue"], viewer_id=viewer.id, post_type_ids={solutions.id})) == [
+        (ids["solution2"], 2)
+    ]
+
+    db.session.get(Post, ids["hidden"]).private = False
+    db.session.get(Post, ids["step"]).private = True
+    db.session.commit()
+    assert sorted(index.reachable(ids["issue"], viewer_id=viewer.id)) == [
+        (ids["hidden"], 1), (ids["solution"], 2)
+    ]
+
+
+def test_changes_committed_during_a_rebuild_survive_it(app, chain, monkeypatch):
+    viewer, _, ids = chain
+    index = AdjacencyIndex(ttl=300, max_overlay=100)
+    build = graph._csr
+    committed = []
+
+    def build_while_a_link_commits(edges, size):
+        # Another request commits a link after the rebuild read the table
+        if not committed:
+            committed.append(True)
+            index.apply([(ids["issue"], ids["solution"])], [], {})
+        return build(edges, size)
+
+    monkeypatch.setattr(graph, "_csr", build_while_a_link_commits)
+    index.rebuild()
+    assert (ids["solution"], 1) in index.reachable(ids["issue"], viewer_id=viewer.id)
@@ -0,0 +1,51 @@
+from sqlalchemy import update
+from flask import current_app
+from flaskr import identity
+from flaskr.database import db, User
+from conftest import make_user
+
+
+def _load(alternative_id):
+    # A fresh session, as the next request would have
+    db.session.remove()
+    return identity.load_user(alternative_id)
+
+
+def test_a_profile_edit_evicts_the_cached_user(app):
+    cache = current_app.extensions["identity_cache"]
+    alternative_id = make_user("member").alternative_id
+
+    _load(alternative_id)
+    assert _load(alternative_id).full_name == "Member"
+    assert cache.stats()["hits"] == 1
+
+    user = _load(alternative_id)
+    user.full_name = "Renamed Member"
+    db.session.commit()
+    assert _load(alternative_id).full_name == "Renamed Member"
+    assert cache.stats()["misses"] == 2
+
+
+def test_a_rolled_back_edit_keeps_the_cached_user(app):
+    cache = current_app.extensions["identity_cache"]
+    alternative_id = make_user("member").alternative_id
+    _load(alternative_id)
+
+    user = _load(alternative_id)
+    user.full_name = "Not committed"
+    db.session.flush()
+    db.session.rollback()
+    assert _load(alternative_id).full_name == "Member"
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (2, 1)
+
+
+def test_core_writes_leave_the_cache_stale_until_invalidated(app):
+    alternative_id = make_user("member").alternative_id
+    _load(alternative_id)
+
+    db.session.execute(update(User).where(User.alternative_id == alternative_id).values(full_name="Bulk"))
+    db.session.commit()
+    assert _load(alternative_id).full_name == "Member"
+
+    identity.invalidate(alternative_id)
+    assert _load(alternative_id).full_name == "Bulk"
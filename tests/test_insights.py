@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, select
+from flaskr import insights
+from flaskr.database import db, Insight, InsightJob, Post, Representative
+from conftest import make_post_type, make_user
+
+BACKEND = "flaskr.insights:extractive_summary"
+
+
+def test_a_worker_past_its_lease_writes_nothing(app):
+    author = make_user("author")
+    make_user("rep", Representative)
+    db.session.add(Post(
+        title="A post title",
+        body="A body long enough to be a post body. It has two sentences.",
+        post_type_id=make_post_type().id,
+        original_author=author,
+        confirmed_for_insights=True
+    ))
+    db.session.commit()
+
+    late_ids, late_lease = insights.claim_batch(10, lease_seconds=-1)
+    # The lease ran out: another worker claims and finishes the job
+    ids, lease = insights.claim_batch(10, lease_seconds=60)
+    assert ids == late_ids
+    with ThreadPoolExecutor(1) as executor:
+        assert insights.process_batch(ids, lease, executor, BACKEND, 3)["done"] == 1
+        result = insights.process_batch(late_ids, late_lease, executor, BACKEND, 3)
+
+    assert (result["done"], result["lost"]) == (0, 1)
+    assert db.session.execute(select(func.count()).select_from(Insight)).scalar() == 1
+    assert db.session.execute(select(InsightJob.status)).scalar() == insights.DONE
+
+
+def test_the_process_pool_spawns_its_workers(app):
+    make_user("rep", Representative)
+    db.session.add(Post(
+        title="A post title",
+        body="A body long enough to be a post body. It has two sentences.",
+        post_type_id=make_post_type().id,
+        original_author=make_user("author"),
+        confirmed_for_insights=True
+    ))
+    db.session.commit()
+
+    with insights.make_executor("process", 1) as executor:
+        assert executor._mp_context.get_start_method() == "spawn"
+    assert insights.run(batch_size=10, workers=1, pool="process")["done"] == 1
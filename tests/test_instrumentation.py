@@ -0,0 +1,72 @@
+import logging
+import pytest
+from sqlalchemy import event, select
+from flaskr import create_app
+from flaskr.database import db, User
+from conftest import make_user
+
+
+@pytest.fixture
+def instrumented(tmp_path):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+        "RELATED_INDEX_PATH": str(tmp_path / "related"),
+        "SQL_INSTRUMENTATION": True,
+        "FRAGMENT_CACHE": None,
+        "VOTES_FLUSH_INTERVAL": 3600,
+        "SQLITE_MAINTENANCE_INTERVAL": 0,
+    })
+
+    @app.get("/_test/repeated")
+    def repeated():
+        # The same statement once per "row": what a lazy load in a loop does
+        for _ in range(app.config["SQL_N_PLUS_ONE_THRESHOLD"]):
+            db.session.execute(select(User).limit(1)).all()
+        return "done"
+
+    with app.app_context():
+        db.create_all()
+        user_id = make_user("viewer").get_id()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = user_id
+    return app, client
+
+
+def test_the_count_header_matches_the_statements_run(instrumented):
+    app, client = instrumented
+    statements = []
+
+    def count(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        response = client.get("/posts/")
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert response.status_code == 200
+    assert int(response.headers["X-SQL-Count"]) == len(statements) > 0
+    assert "X-SQL-Repeated" not in response.headers
+    assert "db;dur=" in response.headers["Server-Timing"]
+
+
+def test_repeated_statements_are_reported_as_n_plus_one(instrumented, caplog):
+    app, client = instrumented
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        response = client.get("/_test/repeated")
+
+    assert response.headers["X-SQL-Repeated"] == "1"
+    assert any("Possible N+1 in repeated" in record.getMessage() for record in caplog.records)
+    report = client.get("/_debug/sql").get_json()
+    assert report["endpoints"]["repeated"]["n_plus_one_requests"] == 1
+
+
+def test_nothing_is_added_when_instrumentation_is_off(app):
+    response = app.test_client().get("/auth/login")
+    assert response.status_code == 200
+    assert "X-SQL-Count" not in response.headers
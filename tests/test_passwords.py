@@ -0,0 +1,35 @@
+import os
+import time
+import pytest
+from flaskr.passwords import HashingPool, PasswordHasherBusy
+
+
+def test_slow_hashes_and_dead_workers_answer_503_and_the_pool_recovers():
+    pool = HashingPool(workers=1, max_pending=2, timeout=5)
+    assert pool.run(abs, -1) == 1
+
+    with pytest.raises(PasswordHasherBusy):
+        pool.run(os._exit, 1)
+    assert pool.run(abs, -2) == 2
+
+    pool.timeout = 0.2
+    with pytest.raises(PasswordHasherBusy):
+        pool.run(time.sleep, 2)
+    pool._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def test_a_timed_out_hash_holds_its_slot_until_the_worker_finishes():
+    pool = HashingPool(workers=1, max_pending=1, timeout=5)
+    assert pool.run(abs, -1) == 1
+
+    pool.timeout = 0.2
+    with pytest.raises(PasswordHasherBusy):
+        pool.run(time.sleep, 1)
+    # The worker is still running it, so nothing may queue up behind it
+    pool.timeout = 5
+    with pytest.raises(PasswordHasherBusy):
+        pool.run(abs, -2)
+
+    time.sleep(1.5)
+    assert pool.run(abs, -3) == 3
+    pool._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,115 @@
+from datetime import datetime
+from sqlalchemy import text, update
+from flaskr import create_app
+from flaskr.database import db, Post
+from flaskr.posts import paginate_posts, posts_query
+from flaskr.utils import decode_cursor, encode_cursor
+from conftest import make_post_type, make_user
+
+BODY = "A body long enough to be a post body, well over fifty characters."
+
+
+def test_short_info_keeps_body_and_survives_a_missing_preview(app):
+    post = Post(title="A post title", body=BODY, post_type_id=make_post_type().id,
+                original_author=make_user("author"))
+    db.session.add(post)
+    db.session.commit()
+    info = post.get_public_info(short=True)
+    assert info["preview"] == info["body"] == BODY[:50]
+
+    # As on a database created before the preview column was filled
+    db.session.execute(update(Post).values(preview=None))
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(Post, post.id).get_public_info(short=True)["body"] == BODY[:50]
+
+
+def test_each_app_stores_bodies_with_its_own_compression(app, tmp_path):
+    compressing = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'compressed.db'}",
+        "POST_BODY_COMPRESSION": True,
+        "POST_BODY_COMPRESSION_THRESHOLD": 1,
+        "FRAGMENT_CACHE": None,
+    })
+
+    def store_post():
+        post = Post(title="A post title", body=BODY, post_type_id=make_post_type().id,
+                    original_author=make_user("author"))
+        db.session.add(post)
+        db.session.commit()
+        return db.session.execute(text("SELECT typeof(body) FROM post_table")).scalar()
+
+    # Created last, the compressing app must not change how this one stores
+    assert store_post() == "text"
+    with compressing.app_context():
+        db.create_all()
+        assert store_post() == "blob"
+        db.session.remove()
+
+
+def _listing_posts(author, post_type, times):
+    posts = [
+        Post(title=f"Post number {number}", body=BODY, post_type=post_type, original_author=author,
+             created_at=created_at)
+        for number, created_at in enumerate(times)
+    ]
+    db.session.add_all(posts)
+    db.session.commit()
+    return posts
+
+
+def _walk(query, per_page, cursor_name="after", cursor=None):
+    """Every page from `cursor` on, following next (after) or prev (before) cursors."""
+    pages = []
+    while True:
+        page, next_cursor, prev_cursor = paginate_posts(query, per_page, **{cursor_name: decode_cursor(cursor)})
+        pages.append([post.id for post in page])
+        cursor = next_cursor if cursor_name == "after" else prev_cursor
+        if cursor is None:
+            return pages
+
+
+def test_cursors_walk_every_post_once_across_created_at_ties(app):
+    author = make_user("author")
+    tie = datetime(2024, 1, 2)
+    posts = _listing_posts(author, make_post_type(), [
+        datetime(2024, 1, 1), tie, tie, tie, datetime(2024, 1, 3), tie, datetime(2024, 1, 4)
+    ])
+    expected = [post.id for post in sorted(posts, key=lambda post: (post.created_at, post.id), reverse=True)]
+    query = posts_query(author)
+
+    pages = _walk(query, 2)
+    assert [post_id for page in pages for post_id in page] == expected
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+
+    # Back from the last page with the before cursors
+    last = db.session.get(Post, pages[-1][0])
+    back = _walk(query, 2, "before", encode_cursor(last.created_at, last.id))
+    assert back == pages[-2::-1]
+
+
+def test_filters_hold_across_pages(app):
+    author, reader = make_user("author"), make_user("reader")
+    issues, ideas = make_post_type("Issues"), make_post_type("Ideas")
+    times = [datetime(2024, 1, day) for day in range(1, 9)]
+    posts = _listing_posts(author, issues, times[:4]) + _listing_posts(author, ideas, times[4:])
+    posts[1].private = True
+    db.session.commit()
+
+    pages = _walk(posts_query(reader, post_type_name="Issues"), 1)
+    assert [post_id for page in pages for post_id in page] == [posts[3].id, posts[2].id, posts[0].id]
+
+
+def test_malformed_cursors_fall_back_to_the_first_page(app):
+    author = make_user("author")
+    _listing_posts(author, make_post_type(), [datetime(2024, 1, day) for day in range(1, 4)])
+    for token in ["", "%%%", "bm90IGEgY3Vyc29y", "MjAyNC0wMS0wMXxhYmM", "//79"]:
+        assert decode_cursor(token) is None
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = author.get_id()
+    first_page = client.get("/posts/?per_page=2")
+    assert client.get("/posts/?per_page=2&after=%%%25").data == first_page.data
+    assert client.get("/posts/?per_page=2&before=bm90IGEgY3Vyc29y").status_code == 200
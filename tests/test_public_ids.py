@@ -0,0 +1,22 @@
+from flaskr import create_app
+from flaskr.database import db, User
+from conftest import make_user
+
+
+def test_each_app_binds_public_ids_in_its_own_form(app, tmp_path):
+    public_id = make_user("text").alternative_id
+    assert db.session.execute(
+        db.text("SELECT typeof(alternative_id) FROM user_table")
+    ).scalar() == "text"
+
+    # A second app in the same process must not change the first one's form
+    create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'binary.db'}",
+        "PUBLIC_ID_BINARY": True,
+        "FRAGMENT_CACHE": None,
+    })
+    db.session.expunge_all()
+    assert db.session.execute(
+        db.select(User).filter_by(alternative_id=public_id)
+    ).scalar_one().username == "text"
@@ -0,0 +1,57 @@
+from flaskr import reference
+from flaskr.database import db, Post, PostCategory, PostType
+from conftest import make_post_type, make_user
+
+
+def _names(entries):
+    return [entry["name"] for entry in entries]
+
+
+def test_writes_to_the_reference_tables_invalidate_the_snapshot(app):
+    issues = make_post_type("Issues")
+    assert _names(reference.reference_data().post_types) == ["Issues"]
+
+    issues.name = "Bugs"
+    db.session.add(PostCategory(name="Backend"))
+    db.session.commit()
+    snapshot = reference.reference_data()
+    assert _names(snapshot.post_types) == ["Bugs"]
+    assert _names(snapshot.post_categories) == ["Backend"]
+    assert snapshot.post_type_by_name("Bugs")["id"] == issues.id
+
+    db.session.delete(db.session.get(PostCategory, snapshot.post_categories[0]["id"]))
+    db.session.commit()
+    assert reference.reference_data().post_categories == ()
+
+
+def test_rolled_back_and_unrelated_writes_keep_the_snapshot(app):
+    post_type = make_post_type()
+    category = PostCategory(name="Backend")
+    db.session.add(category)
+    db.session.commit()
+    snapshot = reference.reference_data()
+
+    db.session.add(PostType(name="Not committed"))
+    db.session.flush()
+    db.session.rollback()
+    assert reference.reference_data() is snapshot
+
+    # Tagging a post only changes the category's posts collection
+    post = Post(title="A post title", body="A body long enough to be a post body, well over fifty characters.",
+                post_type_id=post_type.id, original_author=make_user("author"))
+    db.session.add(post)
+    category.posts.append(post)
+    db.session.commit()
+    assert reference.reference_data() is snapshot
+
+
+def test_core_writers_must_invalidate_by_hand(app):
+    make_post_type()
+    reference.reference_data()
+
+    db.session.execute(db.insert(PostType).values(name="Bulk"))
+    db.session.commit()
+    assert _names(reference.reference_data().post_types) == ["Issues"]
+
+    reference.invalidate()
+    assert _names(reference.reference_data().post_types) == ["Issues", "Bulk"]
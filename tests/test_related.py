@@ -0,0 +1,79 @@
+from datetime import datetime
+import numpy as np
+from sqlalchemy import update
+from flaskr import related
+from flaskr.database import db, Post
+from conftest import make_post_type, make_user
+
+TEXTS = [
+    ("Printer jams on every page", "The office printer jams on every page and needs a reset."),
+    ("Printer offline after update", "After the update the printer shows offline in the office."),
+    ("Coffee machine leaks", "Water leaks from the coffee machine in the kitchen."),
+    ("Kitchen sink blocked", "The kitchen sink is blocked again, water everywhere."),
+]
+
+
+def _posts(app):
+    author, post_type = make_user("author"), make_post_type()
+    posts = [Post(title=title, body=body, post_type=post_type, original_author=author) for title, body in TEXTS]
+    db.session.add_all(posts)
+    db.session.commit()
+    # Older than a build's overlap, so the build indexes them once
+    db.session.execute(update(Post).values(updated_at=datetime(2020, 1, 1)))
+    db.session.commit()
+    return posts
+
+
+def _expected(index, title, body):
+    """Dense cosine of the query against the current text of every post."""
+    meta, idf = index.meta(), index._maps()["idf"]
+    query = np.zeros(meta["dimensions"], dtype=np.float32)
+    buckets, counts = related._buckets(title, body, meta["dimensions"])
+    query[buckets] = related._vector(buckets, counts, idf)
+    expected = {}
+    for post in db.session.execute(db.select(Post)).scalars():
+        buckets, counts = related._buckets(post.title, post.body, meta["dimensions"])
+        expected[post.id] = float(query[buckets] @ related._vector(buckets, counts, idf))
+    return expected
+
+
+def _assert_scores_match(index, title, body):
+    post_ids, scores = index.scores(title, body)
+    live = scores > 0
+    # One row per post: the rows that edits replaced score nothing
+    assert len(set(post_ids[live].tolist())) == live.sum()
+    found = dict(zip(post_ids[live].tolist(), scores[live].tolist()))
+    expected = {post_id: score for post_id, score in _expected(index, title, body).items() if score > 0}
+    assert sorted(found) == sorted(expected)
+    assert np.allclose([found[post_id] for post_id in sorted(found)],
+                       [expected[post_id] for post_id in sorted(found)], atol=1e-6)
+
+
+def test_the_inverted_index_scores_like_the_dense_vectors(app):
+    _posts(app)
+    index = related._index()
+    related.build(index.path, app.config["RELATED_DIMENSIONS"])
+    assert index.meta()["documents"] == len(TEXTS) and index.meta()["appended"] == 0
+
+    title, body = "Printer jams", "The printer in the office jams."
+    _assert_scores_match(index, title, body)
+
+
+def test_edited_and_new_posts_replace_their_vectors(app):
+    posts = _posts(app)
+    index = related._index()
+    related.build(index.path, app.config["RELATED_DIMENSIONS"])
+
+    # Only the title is touched: the deferred body is read back for the vector
+    db.session.expire_all()
+    edited = db.session.get(Post, posts[2].id)
+    edited.title = "Printer toner empty"
+    db.session.add(Post(title="Printer paper tray", body="The printer paper tray is stuck.",
+                        post_type_id=posts[0].post_type_id, original_author_id=posts[0].original_author_id))
+    db.session.commit()
+    db.session.get(Post, posts[3].id).body = "The printer in the kitchen jams on every page."
+    db.session.commit()
+    assert index.meta()["appended"] == 3
+
+    title, body = "Printer jams", "The printer in the office jams."
+    _assert_scores_match(index, title, body)
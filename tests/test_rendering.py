@@ -0,0 +1,36 @@
+from sqlalchemy import update
+from flaskr import rendering
+from flaskr.database import db, Post, PostDiscussion
+from conftest import make_post_type, make_user
+
+
+def test_rerender_keeps_an_edit_made_while_it_rendered(app, monkeypatch):
+    post = Post(
+        title="A post title",
+        body="The *original* body, long enough to be a post body of fifty characters.",
+        post_type_id=make_post_type().id,
+        original_author=make_user("author")
+    )
+    db.session.add_all([post, PostDiscussion(post=post)])
+    db.session.commit()
+    db.session.execute(update(Post).values(body_html_version=None))
+    db.session.commit()
+
+    render = rendering.render
+
+    def render_racing_an_edit(text):
+        # The author saves an edit between rerender's read and its write
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(Post.__table__).values(
+                    body="The **edited** body", body_html=render("The **edited** body"),
+                    body_html_version=rendering.RENDERER_VERSION
+                )
+            )
+        return render(text)
+
+    monkeypatch.setattr(rendering, "render", render_racing_an_edit)
+    assert rendering.rerender() == 0
+
+    db.session.expire_all()
+    assert "<strong>edited</strong>" in db.session.get(Post, post.id).body_html
@@ -0,0 +1,61 @@
+import pytest
+from flaskr import create_app
+from flaskr.database import db, Post, PostCategory, PostDiscussion
+from flaskr.replicas import sync_replicas
+from conftest import make_post_type, make_user
+
+BODY = "A body long enough to be a post body, well over fifty characters."
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    # No app context held across requests: each gets its own, as in production
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'primary.db'}",
+        "READ_REPLICAS": [f"sqlite:///{tmp_path / 'replica.db'}"],
+        "RELATED_INDEX_PATH": str(tmp_path / "related"),
+        "FRAGMENT_CACHE": None,
+        "VOTES_FLUSH_INTERVAL": 3600,
+        "SQLITE_MAINTENANCE_INTERVAL": 0,
+    })
+    with app.app_context():
+        # The replica gets its tables from sync_replicas()
+        db.create_all(bind_key=None)
+    yield app
+    # Flask-SQLAlchemy keeps a metadata per bind on the shared db object;
+    # apps created later have no engine for this one
+    db.metadatas.pop("replica_0", None)
+
+
+def test_reads_go_to_the_primary_after_a_write(replicated):
+    with replicated.app_context():
+        author, post_type = make_user("author"), make_post_type()
+        category = PostCategory(name="Health")
+        db.session.add(category)
+        db.session.commit()
+        sync_replicas()
+
+        # Written after the sync: only the primary has it
+        unsynced = Post(title="Not on the replica", body=BODY, post_type=post_type, original_author=author)
+        db.session.add_all([unsynced, PostDiscussion(post=unsynced)])
+        db.session.commit()
+        author_id, post_type_id, category_id = author.get_id(), post_type.id, category.id
+        unsynced_id = unsynced.alternative_id
+
+    client = replicated.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = author_id
+    assert client.get(f"/posts/{unsynced_id}").status_code == 404
+
+    response = client.post("/posts/add-post", data={
+        "title": "A freshly written post",
+        "body": BODY,
+        "post_type": post_type_id,
+        "post_categories": [category_id],
+    }, follow_redirects=True)
+    # The redirect to the new post reads it back, from the primary
+    assert response.status_code == 200
+    assert b"A freshly written post" in response.data
+    # And so does every read of the browser session for a while
+    assert client.get(f"/posts/{unsynced_id}").status_code == 200
@@ -0,0 +1,71 @@
+from sqlalchemy import event, func, select
+from flaskr.database import db, Post, PostDiscussion, Representative, UserRequest
+from conftest import make_post_type, make_user
+
+
+def _client(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = user.get_id()
+    return client
+
+
+def test_a_publication_gets_one_request(app):
+    author, representative = make_user("author"), make_user("rep", Representative)
+    post = Post(
+        title="A post title",
+        body="A body long enough to be a post body, well over fifty characters.",
+        post_type_id=make_post_type().id,
+        original_author=author
+    )
+    db.session.add_all([post, PostDiscussion(post=post)])
+    db.session.commit()
+    client = _client(app, author)
+
+    for _ in range(2):
+        client.get(f"/requests/create/user_req?source_id={post.alternative_id}")
+
+    assert db.session.execute(select(func.count()).select_from(UserRequest)).scalar() == 1
+    db.session.expire_all()
+    assert db.session.get(Representative, representative.id).open_requests_count == 1
+
+
+def _statements(app, client, path: str) -> int:
+    statements = []
+
+    def count(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        assert client.get(path).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return len(statements)
+
+
+def test_request_lists_load_in_a_fixed_number_of_statements(app):
+    representative = make_user("rep", Representative)
+    post_type = make_post_type()
+    client = _client(app, representative)
+    # Let the identity cache hold the user, as on any later page
+    client.get("/requests/")
+    counts = []
+    for number in range(1, 4):
+        caller = make_user(f"caller{number}")
+        post = Post(
+            title="A post title",
+            body="A body long enough to be a post body, well over fifty characters.",
+            post_type_id=post_type.id,
+            original_author=caller
+        )
+        db.session.add(post)
+        db.session.add(UserRequest(
+            calling_user=caller, receiving_representative_id=representative.id, request_object=post
+        ))
+        db.session.commit()
+        counts.append(_statements(app, client, "/requests/"))
+
+    # No statement per listed request
+    assert counts[0] == counts[-1]
@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+from flaskr.database import db, Representative, UserRequest
+from conftest import make_user
+
+
+def test_open_requests_count_follows_requests_loaded_before_a_commit(app):
+    caller = make_user("caller")
+    first, second = make_user("first", Representative), make_user("second", Representative)
+    user_request = UserRequest(calling_user_id=caller.id, receiving_representative_id=first.id)
+    db.session.add(user_request)
+    db.session.commit()
+    assert first.open_requests_count == 1
+
+    # Everything loaded so far is expired by these commits
+    db.session.expire_all()
+    user_request.receiving_representative_id = second.id
+    db.session.commit()
+    assert (first.open_requests_count, second.open_requests_count) == (0, 1)
+
+    db.session.expire_all()
+    user_request.closed_at = datetime.now(timezone.utc)
+    db.session.commit()
+    assert second.open_requests_count == 0
+
+    db.session.delete(user_request)
+    db.session.commit()
+    assert (first.open_requests_count, second.open_requests_count) == (0, 0)
@@ -0,0 +1,19 @@
+from sqlalchemy import text
+from flaskr.database import db
+from flaskr.schema import ensure_indexes
+
+
+def _indexes() -> set:
+    return set(db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'index'")
+    ).scalars())
+
+
+def test_ensure_indexes_adds_what_an_older_database_lacks(app):
+    db.session.execute(text("DROP INDEX ix_post_comment_post_discussion_id"))
+    db.session.execute(text("DROP INDEX ix_post_category_association_category_post"))
+    db.session.commit()
+
+    assert ensure_indexes() == 2
+    assert {"ix_post_comment_post_discussion_id", "ix_post_category_association_category_post"} <= _indexes()
+    assert ensure_indexes() == 0
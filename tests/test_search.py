@@ -0,0 +1,56 @@
+from flaskr.database import db, Post
+from flaskr.search import search_posts
+from conftest import make_post_type, make_user
+
+BODY = "A body long enough to be a post body, well over fifty characters."
+
+
+def _titles(query, viewer):
+    results, _ = search_posts(query, viewer, 10)
+    return sorted(post.title for post, _ in results)
+
+
+def _post(author, post_type, title, body=BODY, **columns) -> Post:
+    post = Post(title=title, body=body, post_type=post_type, original_author=author, **columns)
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def test_the_index_follows_inserts_updates_and_deletes(app):
+    author, post_type = make_user("author"), make_post_type()
+    post = _post(author, post_type, "Broken streetlights downtown")
+    assert _titles("streetlights", author) == ["Broken streetlights downtown"]
+
+    post.title = "Potholes on the main road"
+    post.body = "The main road is full of potholes after the winter, please fix them."
+    db.session.commit()
+    assert _titles("streetlights", author) == []
+    assert _titles("winter", author) == ["Potholes on the main road"]
+
+    db.session.delete(post)
+    db.session.commit()
+    assert _titles("potholes", author) == []
+
+
+def test_private_posts_are_found_by_their_author_only(app):
+    author, reader, post_type = make_user("author"), make_user("reader"), make_post_type()
+    _post(author, post_type, "Private water survey", private=True)
+    _post(author, post_type, "Public water survey")
+
+    assert _titles("water", author) == ["Private water survey", "Public water survey"]
+    assert _titles("water", reader) == ["Public water survey"]
+
+
+def test_snippets_escape_the_post_text(app):
+    author, post_type = make_user("author"), make_post_type()
+    _post(author, post_type, "Script injection attempt",
+          body="Some <script>alert('xss')</script> markup around the keyword garden, long enough.")
+
+    (_, snippet), = search_posts("garden", author, 10)[0]
+    assert "<script>" not in snippet
+    assert "&lt;script&gt;" in snippet
+    assert "<mark>garden</mark>" in snippet
+
+    # Quotes and operators in the query are quoted words, not FTS5 syntax errors
+    assert search_posts('garden" OR "', author, 10) == ([], False)
@@ -0,0 +1,78 @@
+import json
+from flaskr.database import db, Post, PostCategory
+from flaskr.ingest import ingest
+from flaskr.statistics import get_statistics
+from conftest import make_post_type, make_user
+
+
+def _post(author, post_type, **columns) -> Post:
+    post = Post(
+        title="A post title",
+        body="A body long enough to be a post body, well over fifty characters.",
+        post_type_id=post_type.id,
+        original_author=author,
+        **columns
+    )
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def test_counters_follow_changes_of_posts_loaded_before_a_commit(app):
+    author, other = make_user("author"), make_user("other")
+    post = _post(author, make_post_type())
+    assert get_statistics(author)["public_publications"] == 1
+
+    # Everything loaded so far is expired by these commits
+    db.session.expire_all()
+    post.private = True
+    db.session.commit()
+    post.confirmed_for_insights = True
+    db.session.commit()
+    assert get_statistics(author) == {
+        "publications": 1,
+        "public_publications": 0,
+        "confirmed_for_deployment": 0,
+        "confirmed_for_insights": 1
+    }
+
+    db.session.expire_all()
+    post.original_author_id = other.id
+    db.session.commit()
+    assert get_statistics(author)["publications"] == 0
+    assert get_statistics(other)["confirmed_for_insights"] == 1
+
+    db.session.delete(post)
+    db.session.commit()
+    assert all(value == 0 for value in get_statistics(author).values())
+    assert all(value == 0 for value in get_statistics(other).values())
+
+
+def test_imported_posts_are_counted_with_their_chunk(app):
+    author = make_user("author")
+    post_type = make_post_type()
+    category = PostCategory(name="Roads")
+    db.session.add(category)
+    db.session.commit()
+    lines = [
+        (number, json.dumps({
+            "external_id": str(number),
+            "title": f"Imported post {number}",
+            "body": "A body long enough to be a post body, well over fifty characters.",
+            "post_type": post_type.id,
+            "categories": [category.id],
+            "private": number == 2
+        }))
+        for number in (1, 2, 3)
+    ]
+
+    ingest(lines, "forum", author.id, chunk_size=2, on_reject=print)
+    assert get_statistics(author) == {
+        "publications": 3,
+        "public_publications": 2,
+        "confirmed_for_deployment": 0,
+        "confirmed_for_insights": 0
+    }
+    # Posts written through the ORM keep adding to the same counters
+    _post(author, post_type)
+    assert get_statistics(author)["publications"] == 4
@@ -0,0 +1,64 @@
+import sqlite3
+import pytest
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import OperationalError
+from flaskr import create_app
+from flaskr.database import db, PostType
+
+
+@pytest.fixture
+def busy_app(tmp_path, monkeypatch):
+    path = tmp_path / "test.db"
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}",
+        "RELATED_INDEX_PATH": str(tmp_path / "related"),
+        "FRAGMENT_CACHE": None,
+        "VOTES_FLUSH_INTERVAL": 3600,
+        "SQLITE_MAINTENANCE_INTERVAL": 0,
+        # Refused at once instead of after the busy timeout
+        "SQLITE_BUSY_TIMEOUT": 0,
+        "SQLITE_BUSY_RETRIES": 2,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.commit()
+
+        # Another process holding the write lock
+        writer = sqlite3.connect(path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        backoffs = []
+        monkeypatch.setattr("flaskr.storage.time.sleep", backoffs.append)
+        yield app, writer, backoffs
+        writer.close()
+        db.session.remove()
+
+
+def test_a_locked_write_is_retried_until_the_lock_is_released(busy_app, monkeypatch):
+    app, writer, backoffs = busy_app
+
+    def release(seconds):
+        backoffs.append(seconds)
+        writer.execute("COMMIT")
+
+    monkeypatch.setattr("flaskr.storage.time.sleep", release)
+    db.session.execute(insert(PostType).values(name="Issues"))
+    db.session.commit()
+
+    assert len(backoffs) == 1
+    assert db.session.scalar(select(func.count()).select_from(PostType)) == 1
+
+
+def test_a_write_gives_up_after_the_configured_retries(busy_app):
+    app, writer, backoffs = busy_app
+
+    with pytest.raises(OperationalError, match="database is locked"):
+        db.session.execute(insert(PostType).values(name="Issues"))
+    db.session.rollback()
+
+    assert len(backoffs) == app.config["SQLITE_BUSY_RETRIES"]
+    # Jittered exponential backoff
+    first, second = backoffs
+    backoff = app.config["SQLITE_BUSY_BACKOFF"]
+    assert backoff * 0.5 <= first < backoff * 1.5
+    assert backoff * 2 * 0.5 <= second < backoff * 2 * 1.5
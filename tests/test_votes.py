@@ -0,0 +1,70 @@
+from datetime import datetime
+from sqlalchemy import select, update
+from flaskr import votes
+from flaskr.database import db, Post, PostComment, PostDiscussion, post_vote_table
+from conftest import make_post_type, make_user
+
+
+def _post(author, **columns) -> Post:
+    post = Post(
+        title="A post title",
+        body="A body long enough to be a post body, well over fifty characters.",
+        post_type_id=make_post_type().id,
+        original_author=author,
+        **columns
+    )
+    db.session.add_all([post, PostDiscussion(post=post)])
+    db.session.commit()
+    return post
+
+
+def _client(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = user.get_id()
+    return client
+
+
+def test_upvotes_respect_visibility_and_comment_ownership(app):
+    author, voter = make_user("author"), make_user("voter")
+    private, public = _post(author, private=True), _post(author)
+    comment = PostComment(text="On the private post", post_discussion=private.post_discussion, author=author)
+    db.session.add(comment)
+    db.session.commit()
+    client = _client(app, voter)
+
+    assert client.post(f"/posts/{private.alternative_id}/upvote").status_code == 404
+    assert client.post(f"/posts/{private.alternative_id}/comments/{comment.id}/upvote").status_code == 404
+    # A comment of another post, even with the right id
+    assert client.post(f"/posts/{public.alternative_id}/comments/{comment.id}/upvote").status_code == 404
+    assert client.post(f"/posts/{public.alternative_id}/upvote").status_code == 302
+    assert votes.pending_total(votes.POST) == 1
+
+
+def test_a_full_buffer_flushes_without_committing_the_request_session(app):
+    app.extensions["votes"].max_pending = 1
+    author = make_user("author")
+    post = _post(author)
+
+    post.title = "Not committed by the vote"
+    votes.upvote(votes.POST, post.id, author.id)
+    db.session.rollback()
+    # Waits for the flusher thread woken by the vote, if it is still writing
+    votes.flush()
+
+    assert db.session.get(Post, post.id).title == "A post title"
+    assert db.session.execute(select(post_vote_table.c.post_id)).scalars().all() == [post.id]
+
+
+def test_a_flushed_vote_is_not_an_edit(app):
+    author, voter = make_user("author"), make_user("voter")
+    post = _post(author)
+    db.session.execute(update(Post).values(updated_at=datetime(2020, 1, 1)))
+    db.session.commit()
+
+    votes.upvote(votes.POST, post.id, voter.id)
+    votes.flush()
+
+    db.session.expire_all()
+    post = db.session.get(Post, post.id)
+    assert (post.upvotes, post.updated_at) == (1, datetime(2020, 1, 1))